@@ -0,0 +1,163 @@
+# analysis_cache.py
+"""
+압축 / 품질 분석 결과 캐시 (디스크, 세션이 바뀌어도 유지)
+
+- 키 = sha256(원본 내용 해시 + 코덱 + 파라미터 JSON)
+  원본 내용 해시는 전송과 같은 블록 해시(transfer.hash_file_blocks / root_hash)이고,
+  (경로, 크기, 수정 시각)이 그대로면 sources.json에 기억해 둔 값을 써서 다시 읽지 않는다
+- 항목 하나 = ANALYSIS_CACHE_DIR/<키>/ 폴더: meta.json(PSNR / SSIM 등) + output(인코딩 결과, 선택)
+  임시 폴더에 다 쓴 뒤 이름을 바꿔서 넣으므로 반쯤 쓴 항목은 보이지 않는다
+- LRU: 읽을 때마다 meta.json의 수정 시각을 갱신하고, 합계가 ANALYSIS_CACHE_MAX를 넘으면
+  가장 오래 안 쓴 항목부터 지운다
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from config import ANALYSIS_CACHE_DIR, ANALYSIS_CACHE_MAX
+
+
+class AnalysisCache:
+    def __init__(self, root=ANALYSIS_CACHE_DIR, max_bytes=ANALYSIS_CACHE_MAX):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.sources_path = os.path.join(root, "sources.json")
+        self.sources = None             # 절대 경로 → {"size", "mtime", "hash"}
+
+    # -----------------------
+    # 키
+    # -----------------------
+    def source_hash(self, path):
+        """원본 파일 내용 해시 (크기 / 수정 시각이 같으면 기억해 둔 값)"""
+        from transfer import hash_file_blocks, root_hash
+
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self.lock:
+            if self.sources is None:
+                self.sources = self._load_sources()
+            known = self.sources.get(path)
+        if known and known["size"] == st.st_size and known["mtime"] == st.st_mtime_ns:
+            return known["hash"]
+
+        digest = root_hash(hash_file_blocks(path), st.st_size)
+        with self.lock:
+            self.sources[path] = {"size": st.st_size, "mtime": st.st_mtime_ns, "hash": digest}
+            self._save_sources()
+        return digest
+
+    def key(self, path, codec, params):
+        h = hashlib.sha256(self.source_hash(path).encode())
+        h.update(codec.encode())
+        h.update(json.dumps(params, sort_keys=True).encode())
+        return h.hexdigest()
+
+    # -----------------------
+    # 조회 / 저장
+    # -----------------------
+    def get(self, key):
+        """(metrics, 인코딩 결과 경로 또는 None) / 없으면 None"""
+        entry = os.path.join(self.root, key)
+        meta_path = os.path.join(entry, "meta.json")
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            os.utime(meta_path)                 # LRU: 최근 사용
+        except (OSError, ValueError):
+            return None
+        output = os.path.join(entry, "output") if meta.get("has_output") else None
+        if output and not os.path.exists(output):
+            return None
+        return meta["metrics"], output
+
+    def get_bytes(self, key):
+        """(metrics, 인코딩 결과 bytes 또는 None) / 없으면 None"""
+        hit = self.get(key)
+        if hit is None:
+            return None
+        metrics, output = hit
+        if output is None:
+            return metrics, None
+        with open(output, "rb") as f:
+            return metrics, f.read()
+
+    def put(self, key, metrics, output_path=None, output_bytes=None):
+        """metrics(JSON으로 저장 가능한 dict)와 인코딩 결과(파일 경로 또는 bytes)를 저장"""
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            tmp = os.path.join(self.root, f".tmp-{key}-{threading.get_ident()}")
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            has_output = output_path is not None or output_bytes is not None
+            if output_path is not None:
+                # 하드 링크는 쓰지 않음: ffmpeg -y가 원래 경로를 덮어쓰면 캐시 내용도 바뀐다
+                shutil.copyfile(output_path, os.path.join(tmp, "output"))
+            elif output_bytes is not None:
+                with open(os.path.join(tmp, "output"), "wb") as f:
+                    f.write(output_bytes)
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"metrics": metrics, "has_output": has_output, "created": time.time()}, f)
+
+            entry = os.path.join(self.root, key)
+            try:
+                os.replace(tmp, entry)
+            except OSError:
+                shutil.rmtree(tmp, ignore_errors=True)     # 다른 작업이 먼저 넣음
+            self._evict()
+        except Exception as e:
+            print("analysis cache error:", e)
+
+    # -----------------------
+    # 정리
+    # -----------------------
+    def _evict(self):
+        with self.lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.root):
+                entry = os.path.join(self.root, name)
+                meta_path = os.path.join(entry, "meta.json")
+                if name.startswith(".") or not os.path.isfile(meta_path):
+                    continue
+                size = sum(
+                    os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry)
+                )
+                entries.append((os.path.getmtime(meta_path), size, entry))
+                total += size
+            entries.sort()
+            while total > self.max_bytes and entries:
+                _, size, entry = entries.pop(0)
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+
+    def _load_sources(self):
+        try:
+            with open(self.sources_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_sources(self):
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            tmp = self.sources_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.sources, f)
+            os.replace(tmp, self.sources_path)
+        except OSError as e:
+            print("analysis cache error:", e)
+
+
+_cache = None
+
+
+def get_analysis_cache():
+    global _cache
+    if _cache is None:
+        _cache = AnalysisCache()
+    return _cache
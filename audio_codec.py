@@ -0,0 +1,387 @@
+# audio_codec.py
+"""
+TYPE_AUDIO 용 오디오 코덱 (16bit mono PCM 기준)
+
+- pcm16 : 무압축 (1x)
+- ulaw  : G.711 μ-law (2x), 65536칸 LUT로 인코딩 / 256칸 LUT로 디코딩
+- alaw  : G.711 A-law (2x), 위와 동일
+- adpcm : IMA-ADPCM (4x), 패킷마다 predictor/index 헤더를 넣어 독립 디코딩 가능
+
+패킷 형식: [codec id 1 byte][codec payload]
+무음 구간에는 [CN_ID][잡음 레벨 -dBov 1 byte] 만 보낸다 (comfort noise, RFC 3389와 같은 방식).
+코덱은 CodecNegotiator가 세션마다 TYPE_AUDIO_CFG로 상대와 협상해서 고른다.
+python audio_codec.py 로 1초 분량 오디오 기준 인코딩/디코딩 비용 벤치마크.
+"""
+
+import json
+import struct
+import time
+
+import numpy as np
+
+from config import (
+    TYPE_AUDIO_CFG, AUDIO_CODEC_PREFERENCE, AUDIO_RATES, AUDIO_CHANNEL_OPTIONS,
+    AUDIO_PACKET_OPTIONS, AUDIO_RATE, AUDIO_CHANNELS
+)
+from audio_io import default_format
+
+
+# -----------------------
+# G.711 (μ-law / A-law)
+# -----------------------
+_SEG_UEND = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+_SEG_AEND = np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF])
+
+
+def _linear2ulaw(pcm):
+    pcm = pcm.astype(np.int32) >> 2
+    mask = np.where(pcm < 0, 0x7F, 0xFF)
+    pcm = np.minimum(np.abs(pcm), 8159) + (0x84 >> 2)
+    seg = np.searchsorted(_SEG_UEND, pcm)
+    uval = (seg << 4) | ((pcm >> (seg + 1)) & 0xF)
+    uval = np.where(seg >= 8, 0x7F, uval)
+    return (uval ^ mask).astype(np.uint8)
+
+
+def _ulaw2linear(u):
+    u = ~u.astype(np.int32) & 0xFF
+    t = (((u & 0xF) << 3) + 0x84) << ((u & 0x70) >> 4)
+    return np.where(u & 0x80, 0x84 - t, t - 0x84).astype(np.int16)
+
+
+def _linear2alaw(pcm):
+    pcm = pcm.astype(np.int32) >> 3
+    mask = np.where(pcm >= 0, 0xD5, 0x55)
+    pcm = np.where(pcm >= 0, pcm, -pcm - 1)
+    seg = np.searchsorted(_SEG_AEND, pcm)
+    shift = np.where(seg < 2, 1, seg)
+    aval = (np.minimum(seg, 7) << 4) | ((pcm >> shift) & 0xF)
+    aval = np.where(seg >= 8, 0x7F, aval)
+    return (aval ^ mask).astype(np.uint8)
+
+
+def _alaw2linear(a):
+    a = a.astype(np.int32) ^ 0x55
+    t = (a & 0xF) << 4
+    seg = (a & 0x70) >> 4
+    t = np.where(seg == 0, t + 8, t + 0x108)
+    t = np.where(seg > 1, t << np.maximum(seg - 1, 0), t)
+    return np.where(a & 0x80, t, -t).astype(np.int16)
+
+
+# int16 전 구간 인코딩 테이블 (uint16 view로 인덱싱)
+_ALL_PCM = np.arange(65536, dtype=np.uint16).view(np.int16)
+_ULAW_ENC = _linear2ulaw(_ALL_PCM)
+_ALAW_ENC = _linear2alaw(_ALL_PCM)
+_ULAW_DEC = _ulaw2linear(np.arange(256))
+_ALAW_DEC = _alaw2linear(np.arange(256))
+
+
+def ulaw_encode(pcm: bytes) -> bytes:
+    return _ULAW_ENC[np.frombuffer(pcm, dtype=np.uint16)].tobytes()
+
+
+def ulaw_decode(data: bytes) -> bytes:
+    return _ULAW_DEC[np.frombuffer(data, dtype=np.uint8)].tobytes()
+
+
+def alaw_encode(pcm: bytes) -> bytes:
+    return _ALAW_ENC[np.frombuffer(pcm, dtype=np.uint16)].tobytes()
+
+
+def alaw_decode(data: bytes) -> bytes:
+    return _ALAW_DEC[np.frombuffer(data, dtype=np.uint8)].tobytes()
+
+
+# -----------------------
+# IMA-ADPCM
+# -----------------------
+_IMA_STEP = [
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+    11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+    32767,
+]
+_IMA_INDEX = [-1, -1, -1, -1, 2, 4, 6, 8] * 2
+_ADPCM_HDR = struct.Struct("<HhB")   # 샘플 수, 시작 predictor, 시작 step index
+
+
+def adpcm_encode(pcm: bytes, state=(0, 0)):
+    """
+    predictor 재귀는 본질적으로 순차적이라 샘플 루프는 파이썬 int로 돌리고,
+    nibble 패킹만 NumPy로 한다. state=(predictor, index)는 이전 패킷의 끝 상태.
+    return: (encoded bytes, 끝 상태)
+    """
+    samples = np.frombuffer(pcm, dtype=np.int16).tolist()
+    pred, index = state
+    hdr = _ADPCM_HDR.pack(len(samples), pred, index)
+
+    step_tab, idx_tab = _IMA_STEP, _IMA_INDEX
+    codes = [0] * len(samples)
+    for i, s in enumerate(samples):
+        step = step_tab[index]
+        diff = s - pred
+        code = 0
+        if diff < 0:
+            code = 8
+            diff = -diff
+        delta = step >> 3
+        if diff >= step:
+            code |= 4
+            diff -= step
+            delta += step
+        step >>= 1
+        if diff >= step:
+            code |= 2
+            diff -= step
+            delta += step
+        step >>= 1
+        if diff >= step:
+            code |= 1
+            delta += step
+        pred = pred - delta if code & 8 else pred + delta
+        if pred > 32767:
+            pred = 32767
+        elif pred < -32768:
+            pred = -32768
+        index += idx_tab[code]
+        if index < 0:
+            index = 0
+        elif index > 88:
+            index = 88
+        codes[i] = code
+
+    if len(codes) & 1:
+        codes.append(0)
+    c = np.array(codes, dtype=np.uint8)
+    packed = (c[0::2] | (c[1::2] << 4)).astype(np.uint8)
+    return hdr + packed.tobytes(), (pred, index)
+
+
+def adpcm_decode(data: bytes) -> bytes:
+    n, pred, index = _ADPCM_HDR.unpack_from(data)
+    packed = np.frombuffer(data, dtype=np.uint8, offset=_ADPCM_HDR.size)
+    codes = np.empty(len(packed) * 2, dtype=np.uint8)
+    codes[0::2] = packed & 0x0F
+    codes[1::2] = packed >> 4
+
+    step_tab, idx_tab = _IMA_STEP, _IMA_INDEX
+    out = [0] * n
+    for i, code in enumerate(codes[:n].tolist()):
+        step = step_tab[index]
+        delta = step >> 3
+        if code & 4:
+            delta += step
+        if code & 2:
+            delta += step >> 1
+        if code & 1:
+            delta += step >> 2
+        pred = pred - delta if code & 8 else pred + delta
+        if pred > 32767:
+            pred = 32767
+        elif pred < -32768:
+            pred = -32768
+        index += idx_tab[code]
+        if index < 0:
+            index = 0
+        elif index > 88:
+            index = 88
+        out[i] = pred
+    return np.array(out, dtype=np.int16).tobytes()
+
+
+# -----------------------
+# 패킷 단위 인코딩 / 디코딩
+# -----------------------
+CODEC_IDS = {"pcm16": 0, "ulaw": 1, "alaw": 2, "adpcm": 3}
+CODEC_NAMES = {v: k for k, v in CODEC_IDS.items()}
+CODEC_RATIO = {"pcm16": 1, "ulaw": 2, "alaw": 2, "adpcm": 4}
+CN_ID = 0xFF
+
+
+def encode_comfort_noise(level_db: float) -> bytes:
+    return bytes([CN_ID, int(min(127, max(0, round(-level_db))))])
+
+
+def comfort_noise_level(payload: bytes):
+    """comfort noise 패킷이면 잡음 레벨(dBov), 아니면 None."""
+    if len(payload) >= 2 and payload[0] == CN_ID:
+        return -float(payload[1])
+    return None
+
+
+class AudioEncoder:
+    """송신측 인코더 (ADPCM 상태를 패킷 사이에 이어간다)."""
+
+    def __init__(self):
+        self.adpcm_state = (0, 0)
+
+    def encode(self, codec: str, pcm: bytes) -> bytes:
+        if codec == "ulaw":
+            body = ulaw_encode(pcm)
+        elif codec == "alaw":
+            body = alaw_encode(pcm)
+        elif codec == "adpcm":
+            body, self.adpcm_state = adpcm_encode(pcm, self.adpcm_state)
+        else:
+            codec, body = "pcm16", pcm
+        return bytes([CODEC_IDS[codec]]) + body
+
+
+def decode_packet(payload: bytes):
+    """TYPE_AUDIO payload → 16bit PCM bytes. 모르는 코덱이면 None."""
+    if not payload:
+        return None
+    codec = CODEC_NAMES.get(payload[0])
+    body = payload[1:]
+    if codec == "pcm16":
+        return body
+    if codec == "ulaw":
+        return ulaw_decode(body)
+    if codec == "alaw":
+        return alaw_decode(body)
+    if codec == "adpcm":
+        return adpcm_decode(body)
+    return None
+
+
+class CodecNegotiator:
+    """
+    세션별 오디오 포맷 협상 (코덱 / 샘플레이트 / 채널).
+    - 연결 / 마이크 시작 때 내 지원 목록(선호 순)을 TYPE_AUDIO_CFG로 보낸다
+    - 상대 목록을 받으면 항목마다 내 선호 순서에서 둘 다 지원하는 첫 값을 송신 포맷으로 고르고,
+      상대의 offer였다면 내 목록으로 answer를 돌려준다
+    - 송신 포맷이 바뀌면 "sending"으로 상대에게 알리고, 상대는 그 포맷으로 재생 장치를 연다
+    - 협상 전에는 pcm16 / 기본 포맷으로 보낸다 (모든 피어가 디코딩 가능)
+    - 상대가 comfort noise("cn")를 지원할 때만 무음 구간 억제(VAD)를 켠다
+    """
+
+    FEATURES = ["cn"]
+
+    def __init__(self, app, preference=None):
+        self.app = app
+        self.preference = list(preference or AUDIO_CODEC_PREFERENCE)
+        self.peer = None
+        self.send_codec = "pcm16"
+        self.send_format = default_format()
+
+    @property
+    def peer_codecs(self):
+        return self.peer.get("codecs", []) if self.peer is not None else None
+
+    @property
+    def use_vad(self) -> bool:
+        return self.peer is not None and "cn" in self.peer.get("features", [])
+
+    def offer(self):
+        self._send(answer=False)
+
+    def _send(self, answer):
+        msg = {
+            "codecs": self.preference,
+            "features": self.FEATURES,
+            "rates": AUDIO_RATES,
+            "channels": AUDIO_CHANNEL_OPTIONS,
+            "sending": self.send_format,
+            "answer": answer,
+        }
+        self.app.send_bytes(TYPE_AUDIO_CFG, json.dumps(msg).encode("utf-8"))
+
+    @staticmethod
+    def _pick(mine, theirs, default):
+        return next((v for v in mine if v in theirs), default)
+
+    def handle(self, payload: bytes):
+        try:
+            msg = json.loads(payload.decode("utf-8"))
+        except Exception as e:
+            print("audio cfg parse error:", e)
+            return
+        self.peer = msg
+
+        # 상대가 보내는 포맷에 맞춰 재생 (장치는 첫 패킷 전에 백그라운드에서 미리 연다)
+        if msg.get("sending"):
+            self.app.audio_player.configure(msg["sending"])
+        self.app.audio_player.prepare()
+
+        chosen = self._pick(self.preference, msg.get("codecs", []), "pcm16")
+        if chosen != self.send_codec:
+            self.send_codec = chosen
+            self.app.system_msg(f"Audio codec: {chosen} ({CODEC_RATIO[chosen]}x)")
+
+        fmt = {
+            "rate": self._pick(AUDIO_RATES, msg.get("rates", [AUDIO_RATE]), AUDIO_RATE),
+            "channels": self._pick([AUDIO_CHANNELS] + AUDIO_CHANNEL_OPTIONS,
+                                   msg.get("channels", [AUDIO_CHANNELS]), AUDIO_CHANNELS),
+            "packet_ms": self.send_format["packet_ms"],
+        }
+        changed = fmt != self.send_format
+        if changed:
+            self.send_format = fmt
+            self.app.video.audio.reconfigure()
+
+        if not msg.get("answer"):
+            self._send(answer=True)
+        elif changed:
+            self._send(answer=True)   # 바뀐 송신 포맷만 알림 (answer라 다시 응답하지 않음)
+
+    def set_packet_ms(self, packet_ms: int):
+        if packet_ms not in AUDIO_PACKET_OPTIONS or packet_ms == self.send_format["packet_ms"]:
+            return
+        self.send_format = dict(self.send_format, packet_ms=packet_ms)
+        self.app.video.audio.reconfigure()
+        if self.peer is not None:
+            self._send(answer=True)
+
+    def reset(self):
+        self.peer = None
+        self.send_codec = "pcm16"
+        self.send_format = default_format()
+        self.app.audio_player.configure(default_format())
+        self.app.video.audio.reconfigure()
+
+
+# -----------------------
+# 벤치마크
+# -----------------------
+def benchmark(seconds=1.0, rate=16000, chunk=320, repeat=5):
+    """코덱별 1초 분량 오디오 인코딩/디코딩 시간(ms)과 SNR(dB)."""
+    t = np.arange(int(rate * seconds)) / rate
+    rng = np.random.default_rng(0)
+    sig = 8000 * np.sin(2 * np.pi * 440 * t) + 2000 * rng.standard_normal(len(t))
+    pcm = np.clip(sig, -32768, 32767).astype(np.int16)
+    chunks = [pcm[i:i + chunk].tobytes() for i in range(0, len(pcm), chunk)]
+
+    results = {}
+    for codec in CODEC_IDS:
+        best_enc = best_dec = float("inf")
+        for _ in range(repeat):
+            enc = AudioEncoder()
+            t0 = time.perf_counter()
+            packets = [enc.encode(codec, c) for c in chunks]
+            t1 = time.perf_counter()
+            decoded = [decode_packet(p) for p in packets]
+            t2 = time.perf_counter()
+            best_enc = min(best_enc, t1 - t0)
+            best_dec = min(best_dec, t2 - t1)
+        out = np.frombuffer(b"".join(decoded), dtype=np.int16).astype(np.float64)
+        err = out - pcm.astype(np.float64)
+        snr = 10 * np.log10(np.mean(pcm.astype(np.float64) ** 2) / max(np.mean(err ** 2), 1e-12))
+        size = sum(len(p) for p in packets)
+        results[codec] = {
+            "encode_ms": best_enc * 1000 / seconds,
+            "decode_ms": best_dec * 1000 / seconds,
+            "ratio": len(pcm) * 2 / size,
+            "snr_db": snr,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    print(f"{'codec':<8}{'enc ms/s':>10}{'dec ms/s':>10}{'ratio':>8}{'SNR dB':>9}")
+    for codec, r in benchmark().items():
+        print(f"{codec:<8}{r['encode_ms']:>10.2f}{r['decode_ms']:>10.2f}"
+              f"{r['ratio']:>8.2f}{r['snr_db']:>9.1f}")
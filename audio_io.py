@@ -0,0 +1,110 @@
+# audio_io.py
+"""
+오디오 캡처 / 재생 공통 부분
+
+- RingBuffer: 단일 생산자 / 단일 소비자 int16 링 버퍼 (락 없음)
+  PyAudio 콜백 스레드와 송신 / 수신 스레드 사이에서 샘플을 넘긴다
+- 패킷 길이(ms) ↔ 프레임 수 변환
+- get_pyaudio(): 캡처 / 재생이 같이 쓰는 PyAudio 인스턴스 (처음 쓸 때 만든다)
+"""
+
+import threading
+
+import numpy as np
+
+from config import AUDIO_RATE, AUDIO_CHANNELS, AUDIO_PACKET_MS
+
+
+class RingBuffer:
+    """
+    생산자만 w를, 소비자만 r을 증가시킨다 (둘 다 단조 증가 정수).
+    인덱스 갱신은 복사가 끝난 뒤 한 번의 대입으로 하므로 GIL 아래에서 락 없이 안전하다.
+    """
+
+    def __init__(self, capacity: int):
+        self.buf = np.zeros(capacity, dtype=np.int16)
+        self.capacity = capacity
+        self.w = 0
+        self.r = 0
+
+    def available(self) -> int:
+        return self.w - self.r
+
+    def space(self) -> int:
+        return self.capacity - (self.w - self.r)
+
+    def write(self, samples) -> int:
+        """생산자 전용. 공간이 모자라면 앞부분만 쓰고 쓴 샘플 수를 리턴."""
+        n = min(len(samples), self.space())
+        if n <= 0:
+            return 0
+        pos = self.w % self.capacity
+        first = min(n, self.capacity - pos)
+        self.buf[pos:pos + first] = samples[:first]
+        if n > first:
+            self.buf[:n - first] = samples[first:n]
+        self.w += n
+        return n
+
+    def read_into(self, out) -> int:
+        """소비자 전용. out을 채울 수 있는 만큼 채우고 읽은 샘플 수를 리턴."""
+        n = min(len(out), self.available())
+        if n <= 0:
+            return 0
+        pos = self.r % self.capacity
+        first = min(n, self.capacity - pos)
+        out[:first] = self.buf[pos:pos + first]
+        if n > first:
+            out[first:n] = self.buf[:n - first]
+        self.r += n
+        return n
+
+    def peek(self, n):
+        """소비자 전용. 앞쪽 n개 샘플의 복사본 (읽기 위치는 그대로)"""
+        n = min(n, self.available())
+        idx = (self.r + np.arange(n)) % self.capacity
+        return self.buf[idx]
+
+    def skip(self, n) -> int:
+        """소비자 전용. 앞쪽 n개 샘플을 읽지 않고 버린다."""
+        n = min(n, self.available())
+        self.r += n
+        return n
+
+
+def default_format():
+    return {"rate": AUDIO_RATE, "channels": AUDIO_CHANNELS, "packet_ms": AUDIO_PACKET_MS}
+
+
+def packet_frames(fmt) -> int:
+    """패킷 하나의 프레임(채널당 샘플) 수"""
+    return fmt["rate"] * fmt["packet_ms"] // 1000
+
+
+# -----------------------
+# PyAudio (지연 초기화)
+# -----------------------
+_pyaudio = None
+_pyaudio_lock = threading.Lock()
+
+def get_pyaudio():
+    """
+    PyAudio()는 만들 때 모든 오디오 장치를 조사하므로 (수백 ms) 창이 뜨기 전에 만들지 않고
+    마이크 / 스피커를 처음 열 때 하나만 만들어서 같이 쓴다. pyaudio import도 여기서.
+    """
+    global _pyaudio
+    with _pyaudio_lock:
+        if _pyaudio is None:
+            import pyaudio
+            _pyaudio = pyaudio.PyAudio()
+    return _pyaudio
+
+def terminate_pyaudio():
+    global _pyaudio
+    with _pyaudio_lock:
+        if _pyaudio is not None:
+            try:
+                _pyaudio.terminate()
+            except Exception:
+                pass
+            _pyaudio = None
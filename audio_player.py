@@ -1,36 +1,293 @@
 # audio_player.py
-import pyaudio
+import math
+import threading
+import time
+
+import numpy as np
+
+from audio_io import RingBuffer, default_format, packet_frames, get_pyaudio
+
+
+class JitterBuffer:
+    """
+    수신 오디오 링 버퍼 + 적응형 재생 지연.
+    네트워크 스레드가 push(생산자), PyAudio 콜백이 pop(소비자)만 하므로 락이 없다.
+
+    - 도착 간격의 지터를 RFC 3550 방식(1/16 지수 평균)으로 추정
+    - 목표 깊이 = 1 + ceil(4 * jitter / 패킷 길이) 패킷 (min_depth ~ max_depth)
+    - 재생 콜백(소비자)이 링 앞쪽의 가장 오래된 패킷을 건너뛰어 지연을 줄인다:
+      목표 + 1 패킷보다 깊으면 오래된 패킷이 조용할 때, 목표 + 2보다 깊으면 소리가 커도
+      (time-compress, 콜백마다 최대 한 패킷). 링이 가득 차서 못 쓴 패킷만 late drop
+    - 모자라면 직전 출력을 점점 줄여 반복 (loss concealment), 그 뒤는 무음
+    - 상대가 무음 구간(comfort noise)을 알리면 그동안은 underrun 대신 낮은 잡음을 재생하고,
+      다음 음성 구간(talkspurt)이 시작될 때 지연을 새로 맞춘다
+    - 패킷의 송신 시각(ts)을 링 위치와 묶어 두었다가, 지금 스피커로 나가는 샘플의
+      송신 시각을 audio_clock()으로 알려준다 (비디오 립싱크 기준)
+    """
+
+    CONCEAL_MAX = 3
+
+    def __init__(self, fmt=None, min_depth=1, max_depth=10):
+        fmt = fmt or default_format()
+        self.fmt = fmt
+        self.channels = fmt["channels"]
+        self.packet = packet_frames(fmt) * self.channels       # 패킷당 샘플 수
+        self.packet_dur = fmt["packet_ms"] / 1000.0
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+
+        self.ring = RingBuffer(self.packet * (max_depth + 2))
+        self.last_arrival = None
+        self.jitter = 0.0
+        self.target = min_depth + 1
+        self.avg_rms = 0.0
+        self.playing = False           # False면 목표 깊이까지 프리버퍼링 (소비자만 변경)
+        self.conceal_count = 0
+        self.out = np.zeros(0, dtype=np.int16)
+        self.last_out = None
+
+        # 오디오 클럭: ts_ref = (링 쓰기 위치, 그 위치 샘플의 송신 시각)
+        #             clock = (재생 중인 청크 첫 샘플의 송신 시각, 그 샘플이 들리는 로컬 시각)
+        self.ts_ref = None
+        self.clock = None
+        self.latency = 0.0             # 출력 장치 지연 (초)
+
+        # comfort noise: 단위 레벨 잡음을 미리 만들어 두고 스케일만 바꿔서 재생
+        rng = np.random.default_rng()
+        noise = rng.standard_normal(self.packet * 8).astype(np.float32)
+        noise = 0.5 * (noise + np.roll(noise, 1))          # 살짝 저역 통과
+        self.noise = noise / np.sqrt(np.mean(noise * noise))
+        self.noise_pos = 0
+        self.cn_gain = None                                   # None이면 comfort noise 꺼짐
+
+        self.stats = {
+            "received": 0, "played": 0, "underruns": 0,
+            "concealed": 0, "late_drops": 0, "compressed": 0,
+            "cn_chunks": 0,
+        }
+
+    # -----------------------
+    # 생산자 (네트워크 스레드)
+    # -----------------------
+    def push(self, data: bytes, ts: float = None, now: float = None):
+        now = time.monotonic() if now is None else now
+        samples = np.frombuffer(data, dtype=np.int16)
+        if not len(samples):
+            return
+        rms = float(np.sqrt(np.mean(samples.astype(np.float32) ** 2)))
+        dur = len(samples) / float(self.channels) / self.fmt["rate"]
+
+        if self.last_arrival is not None:
+            d = (now - self.last_arrival) - dur
+            self.jitter += (abs(d) - self.jitter) / 16.0
+        self.last_arrival = now
+        self.target = max(self.min_depth, min(
+            self.max_depth - 1, 1 + math.ceil(4 * self.jitter / self.packet_dur)
+        ))
+        self.stats["received"] += 1
+
+        self.avg_rms += 0.05 * (rms - self.avg_rms)
+
+        # 지연 줄이기(오래된 패킷 버리기)는 소비자가 한다 (pop의 _compress) → 생산자는 쓰기만
+        n = self.ring.write(samples)
+        if n < len(samples):
+            self.stats["late_drops"] += 1
+        elif ts is not None:
+            self.ts_ref = (self.ring.w, ts + dur)
+
+    def comfort_noise(self, level_db: float):
+        """상대가 무음 구간에 들어감 (level_db: 배경 잡음 dBov)"""
+        self.cn_gain = 32768.0 * (10 ** (level_db / 20.0))
+        # 무음 동안의 도착 간격은 지터가 아니므로 다음 talkspurt부터 다시 측정
+        self.last_arrival = None
+
+    # -----------------------
+    # 소비자 (PyAudio 콜백)
+    # -----------------------
+    def _noise_into(self, out):
+        n = len(out)
+        if self.noise_pos + n > len(self.noise):
+            self.noise_pos = 0
+        seg = self.noise[self.noise_pos:self.noise_pos + n] * self.cn_gain
+        self.noise_pos += n
+        out[:] = np.clip(seg, -32768, 32767)
+        self.stats["cn_chunks"] += 1
+
+    def _compress(self):
+        """목표보다 깊게 쌓였으면 가장 오래된 패킷 하나를 건너뛴다 (소비자 전용)"""
+        excess = self.ring.available() - (self.target + 1) * self.packet
+        if excess <= 0:
+            return
+        if excess <= self.packet:
+            oldest = self.ring.peek(self.packet).astype(np.float32)
+            if float(np.sqrt(np.mean(oldest * oldest))) >= 0.5 * self.avg_rms:
+                return                  # 한 패킷만 넘침 → 조용한 패킷이 올 때까지 기다림
+        self.ring.skip(self.packet)
+        self.stats["compressed"] += 1
+
+    def pop(self, frame_count: int) -> bytes:
+        need = frame_count * self.channels
+        if len(self.out) != need:
+            self.out = np.zeros(need, dtype=np.int16)
+        out = self.out
+        avail = self.ring.available()
+        self.clock = None
+
+        if not self.playing:
+            if avail < self.target * self.packet:
+                if self.cn_gain is not None:
+                    self._noise_into(out)
+                else:
+                    out[:] = 0
+                return out.tobytes()
+            self.playing = True
+            self.cn_gain = None
+
+        self._compress()
+        r0 = self.ring.r
+        n = self.ring.read_into(out)
+        if n == need:
+            ref = self.ts_ref
+            if ref is not None:
+                head_ts = ref[1] - (ref[0] - r0) / float(self.channels * self.fmt["rate"])
+                self.clock = (head_ts, time.monotonic() + self.latency)
+            self.conceal_count = 0
+            self.stats["played"] += 1
+            self.last_out = out.copy()
+            return out.tobytes()
+
+        if self.cn_gain is not None and n == 0:
+            # 상대가 무음 구간 → 잡음으로 채우고 다음 talkspurt에서 다시 프리버퍼링
+            self.playing = False
+            self._noise_into(out)
+            return out.tobytes()
+
+        # underrun → 모자란 부분을 직전 출력으로 은닉 (CONCEAL_MAX번까지 0.5^k로 줄이며 반복)
+        # 은닉이 다 떨어졌을 때만 재생을 멈추고 다시 목표 깊이까지 프리버퍼링
+        self.stats["underruns"] += 1
+        if self.last_out is not None and self.conceal_count < self.CONCEAL_MAX:
+            self.conceal_count += 1
+            self.stats["concealed"] += 1
+            gain = 0.5 ** self.conceal_count
+            out[n:] = (self.last_out[n:] * gain).astype(np.int16)
+        else:
+            self.playing = False
+            out[n:] = 0
+        return out.tobytes()
+
+    def audio_clock(self, now: float = None):
+        """지금 들리는 샘플의 송신 시각 (재생 중이 아니거나 콜백이 멈췄으면 None)"""
+        c = self.clock
+        if c is None:
+            return None
+        now = time.monotonic() if now is None else now
+        elapsed = now - c[1]
+        if elapsed > 4 * self.packet_dur + 0.1:
+            return None
+        return c[0] + elapsed
+
+    def snapshot(self):
+        s = dict(self.stats)
+        depth = self.ring.available() / float(self.packet)
+        s["depth"] = depth
+        s["target"] = self.target
+        s["jitter_ms"] = self.jitter * 1000
+        s["delay_ms"] = depth * self.packet_dur * 1000
+        return s
 
-CHUNK = 1024
-FORMAT = pyaudio.paInt16
-CHANNELS = 1
-RATE = 16000
 
 class AudioPlayer:
+    """
+    재생 장치는 prepare()가 별도 스레드에서 연다 (오디오 협상이 끝났을 때, 또는 첫 패킷에서).
+    PyAudio 장치 조사가 수백 ms라 네트워크 수신 스레드에서 하면 모든 패킷이 그만큼 밀린다.
+    열기에 실패하면(pyaudio 없음 / 출력 장치 없음) 기억해 두고 다시 시도하지 않는다.
+    """
+
     def __init__(self):
-        self.audio = pyaudio.PyAudio()
         self.stream = None
+        self.fmt = default_format()
+        self.jitter = JitterBuffer(self.fmt)
+        self.lock = threading.Lock()    # start / stop (여는 스레드 ↔ 수신 스레드)
+        self.opening = False
+        self.failed = False
+
+    def configure(self, fmt):
+        """상대가 알려준 송신 포맷(rate / channels / packet_ms)으로 재생 장치를 다시 연다."""
+        if fmt == self.fmt:
+            return
+        with self.lock:
+            self._close()
+            self.fmt = dict(fmt)
+            self.jitter = JitterBuffer(self.fmt)
+
+    def prepare(self):
+        """재생 장치를 백그라운드에서 연다 (이미 열었거나 여는 중 / 실패했으면 아무것도 안 함)"""
+        with self.lock:
+            if self.stream or self.opening or self.failed:
+                return
+            self.opening = True
+        threading.Thread(target=self._open, daemon=True, name="audio-open").start()
+
+    def _open(self):
+        try:
+            get_pyaudio()                   # 장치 조사 (느림) → 락 밖에서
+            with self.lock:
+                self.start()
+        except Exception as e:
+            self.failed = True
+            print("Audio output start failed (재생 끔):", e)
+        finally:
+            self.opening = False
 
     def start(self):
+        """재생 스트림 열기 (self.lock을 잡고 호출)"""
         if self.stream:
             return
-        self.stream = self.audio.open(
-            format=FORMAT,
-            channels=CHANNELS,
-            rate=RATE,
+        import pyaudio
+
+        # 콜백 모드: 장치가 필요할 때마다 jitter buffer에서 한 패킷 분량을 꺼낸다
+        self.pa_continue = pyaudio.paContinue
+        self.stream = get_pyaudio().open(
+            format=pyaudio.paInt16,
+            channels=self.fmt["channels"],
+            rate=self.fmt["rate"],
             output=True,
-            frames_per_buffer=CHUNK
+            frames_per_buffer=packet_frames(self.fmt),
+            stream_callback=self._callback
         )
-
-    def play(self, data: bytes):
-        if not self.stream:
-            self.start()
         try:
-            self.stream.write(data)
-        except:
+            self.jitter.latency = self.stream.get_output_latency()
+        except Exception:
             pass
+        self.stream.start_stream()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        return self.jitter.pop(frame_count), self.pa_continue
+
+    def play(self, data: bytes, ts: float = None):
+        """네트워크 스레드에서 호출 — 버퍼에 넣기만 하고 바로 리턴 (ts: 송신측 캡처 시각)"""
+        self.jitter.push(data, ts)
+        if not self.stream:
+            self.prepare()
+
+    def comfort_noise(self, level_db: float):
+        self.jitter.comfort_noise(level_db)
+        if not self.stream:
+            self.prepare()
+
+    def audio_clock(self):
+        if not self.stream:
+            return None
+        return self.jitter.audio_clock()
+
+    def stats(self):
+        return self.jitter.snapshot()
 
     def stop(self):
+        with self.lock:
+            self._close()
+
+    def _close(self):
         if self.stream:
             try:
                 self.stream.stop_stream()
@@ -38,9 +295,3 @@ class AudioPlayer:
             except:
                 pass
             self.stream = None
-
-    def __del__(self):
-        try:
-            self.audio.terminate()
-        except:
-            pass
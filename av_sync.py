@@ -0,0 +1,129 @@
+# av_sync.py
+"""
+오디오 / 비디오 동기화 (립싱크)
+
+- 송신측: AudioStream / VideoStream이 같은 media_clock()으로 캡처 시각을 찍어
+  TYPE_AUDIO / TYPE_VIDEO / TYPE_VIDEO_H263 payload 앞에 붙인다 (MEDIA_TS_FMT, 마이크로초)
+- 수신측: 오디오는 jitter buffer가 재생 중인 샘플의 송신 시각(오디오 클럭)을 알려주고,
+  PlayoutScheduler가 비디오 프레임을 그 시각에 맞춰 화면에 내보낸다
+  (오디오가 없으면 / 무음 구간이면 도착 즉시 표시)
+- 표시할 때마다 A/V 오프셋(프레임 시각 - 오디오 클럭)을 재서 stats에 남긴다
+"""
+
+import struct
+import threading
+import time
+from collections import deque
+
+from config import MEDIA_TS_FMT
+
+MEDIA_TS_SIZE = struct.calcsize(MEDIA_TS_FMT)
+
+
+def media_clock() -> float:
+    """오디오 / 비디오 캡처가 함께 쓰는 송신측 기준 시계 (초)"""
+    return time.monotonic()
+
+
+def pack_media_ts(ts: float) -> bytes:
+    return struct.pack(MEDIA_TS_FMT, int(ts * 1_000_000))
+
+
+def split_media_ts(payload: bytes):
+    """payload → (ts 초, 나머지). 너무 짧으면 (None, payload)."""
+    if len(payload) < MEDIA_TS_SIZE:
+        return None, payload
+    (us,) = struct.unpack_from(MEDIA_TS_FMT, payload)
+    return us / 1_000_000, payload[MEDIA_TS_SIZE:]
+
+
+class PlayoutScheduler:
+    """
+    비디오 프레임을 오디오 클럭에 맞춰 표시.
+
+    - push(ts, item): 디코딩된 프레임(또는 JPEG)을 송신 시각과 함께 넣는다 (네트워크 / 디코더 스레드)
+    - 스레드가 오디오 클럭이 ts에 도달하면 present(item)을 호출한다
+    - late_ms보다 늦은 프레임은 버리되, 큐의 마지막 프레임은 화면이 멈추지 않게 표시
+    - max_lead_ms보다 앞선 프레임(클럭이 리셋됨 등)이나 오디오 클럭이 없을 때는 바로 표시
+    - max_frames를 넘게 쌓이면 가장 오래된 프레임부터 버린다
+    """
+
+    def __init__(self, present, audio_clock, late_ms=80, max_lead_ms=1000, max_frames=30):
+        self.present = present
+        self.audio_clock = audio_clock
+        self.late = late_ms / 1000.0
+        self.max_lead = max_lead_ms / 1000.0
+        self.max_frames = max_frames
+
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.running = True
+        self.offset_ms = None            # A/V 오프셋 EMA (+: 비디오가 오디오보다 앞섬)
+        self.stats = {"presented": 0, "late_drops": 0, "overflow_drops": 0, "unsynced": 0}
+
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def push(self, ts, item):
+        with self.cond:
+            if len(self.queue) >= self.max_frames:
+                self.queue.popleft()
+                self.stats["overflow_drops"] += 1
+            self.queue.append((ts, item))
+            self.cond.notify()
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                ts, item = self.queue[0]
+                clock = self.audio_clock() if ts is not None else None
+
+                if clock is not None:
+                    lead = ts - clock
+                    if 0 < lead <= self.max_lead:
+                        # 아직 이르다 → 그 시각까지 (새 프레임이 오면 다시 계산)
+                        self.cond.wait(min(lead, 0.05))
+                        continue
+                    if lead < -self.late and len(self.queue) > 1:
+                        self.queue.popleft()
+                        self.stats["late_drops"] += 1
+                        self._track(lead)
+                        continue
+                    if lead > self.max_lead:
+                        self.stats["unsynced"] += 1
+                    else:
+                        self._track(lead)
+                else:
+                    self.stats["unsynced"] += 1
+                self.queue.popleft()
+
+            self.stats["presented"] += 1
+            try:
+                self.present(item)
+            except Exception as e:
+                print("playout present error:", e)
+
+    def _track(self, lead):
+        ms = lead * 1000
+        self.offset_ms = ms if self.offset_ms is None else self.offset_ms + 0.1 * (ms - self.offset_ms)
+
+    def snapshot(self):
+        s = dict(self.stats)
+        s["queued"] = len(self.queue)
+        s["offset_ms"] = self.offset_ms
+        return s
+
+    def clear(self):
+        with self.cond:
+            self.queue.clear()
+            self.offset_ms = None
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.queue.clear()
+            self.cond.notify()
@@ -1,20 +1,13 @@
 # chat.py
 from config import TYPE_TEXT
-from network import send_packet
 
 class ChatManager:
     def __init__(self, app):
         self.app = app  # main.App
 
     def append(self, text: str):
-        try:
-            box = self.app.ui.chat_box
-            box.configure(state='normal')
-            box.insert('end', text + '\n')
-            box.configure(state='disabled')
-            box.see('end')
-        except Exception as e:
-            print("append_chat error:", e)
+        # 화면 표시는 프론트엔드가 (app.on_chat)
+        self.app.show_chat(text)
 
     def append_system(self, text: str):
         self.append("[SYSTEM] " + text)
@@ -23,10 +16,9 @@ class ChatManager:
         if not text:
             return
         self.append(f"You: {text}")
-        self.app.ui.chat_entry.delete(0, 'end')
         if self.app.sock:
             try:
-                send_packet(self.app.sock, TYPE_TEXT, text.encode('utf-8'))
+                self.app.send_bytes(TYPE_TEXT, text.encode('utf-8'))
             except Exception as e:
                 print("Chat send error:", e)
                 self.append_system("Failed to send chat")
@@ -1,4 +1,5 @@
 # config.py
+import os
 import struct
 import shutil
 
@@ -25,12 +26,144 @@ TYPE_FILE_END   = b'FEND'
 TYPE_TEXT       = b'TEX0'
 TYPE_IMAGE      = b'IMG0'
 TYPE_AUDIO      = b'AUD0'
+TYPE_KEYFRAME_REQ = b'KFR0'   # 수신측 → 송신측 H.263 키프레임 요청
+TYPE_AUDIO_CFG  = b'ACF0'     # 오디오 코덱 협상 (JSON)
+TYPE_FILE_HAVE  = b'FHV0'     # 수신측 → 송신측: 이미 가진 블록 목록 (이어받기)
+
+# -----------------------
+# 송신 우선순위 (network.PacketScheduler, 작을수록 먼저)
+# 파일 전송(FILE_*)은 큐가 빌 때만 나가는 bulk 트래픽
+# -----------------------
+PACKET_PRIORITY = {
+    TYPE_AUDIO: 0, TYPE_AUDIO_CFG: 0, TYPE_KEYFRAME_REQ: 0,
+    TYPE_TEXT: 1, TYPE_FILE_HDR: 1, TYPE_FILE_HAVE: 1,
+    TYPE_VIDEO: 2, TYPE_VIDEO_H263: 2, TYPE_IMAGE: 2,
+}
+PACKET_PRIORITY_DEFAULT = max(PACKET_PRIORITY.values())   # 그 밖의 타입
+DROPPABLE_QUEUE_MAX = {TYPE_VIDEO: 2}   # MJPEG 프레임은 밀리면 오래된 것부터 버림
+
+# -----------------------
+# 라이브 스트리밍 설정
+# -----------------------
+STREAM_CODECS = ["MJPEG", "H.263"]
+H263_STREAM_SIZE = (352, 288)   # CIF (H.263 표준 해상도)
+H263_STREAM_FPS = 20
+H263_GOP = 40                   # 주기적 인트라 프레임 간격 (프레임)
+KEYFRAME_REQ_INTERVAL = 0.5     # 키프레임 재요청 최소 간격 (초)
+
+# -----------------------
+# A/V 동기화: TYPE_AUDIO / TYPE_VIDEO / TYPE_VIDEO_H263 payload 앞의 캡처 시각 (마이크로초)
+# -----------------------
+MEDIA_TS_FMT = '!Q'
+AV_STATUS_INTERVAL = 1.0        # A/V 오프셋 표시 갱신 간격 (초)
+
+# -----------------------
+# 오디오 (16bit PCM, 코덱/샘플레이트/채널은 선호 순서로 상대와 협상)
+# -----------------------
+AUDIO_CODEC_PREFERENCE = ["adpcm", "ulaw", "alaw", "pcm16"]
+AUDIO_RATES = [16000, 8000, 48000]
+AUDIO_CHANNEL_OPTIONS = [1, 2]
+AUDIO_PACKET_OPTIONS = [10, 20, 40]   # 패킷 길이 (ms)
+
+AUDIO_RATE = AUDIO_RATES[0]           # 협상 전 기본값
+AUDIO_CHANNELS = 1
+AUDIO_PACKET_MS = 20
+
+# -----------------------
+# 파일 전송 (백그라운드 엔진)
+# -----------------------
+TRANSFER_MIN_CHUNK = 64 * 1024
+TRANSFER_MAX_CHUNK = 1024 * 1024
+TRANSFER_CHUNK_TIME = 0.02          # 청크 하나 전송 목표 시간 (초) → 청크 크기 자동 조절
+                                    # (청크 전송 중에는 오디오도 기다리므로 짧게)
+TRANSFER_ID_FMT = '!I'              # FILE_END payload (전송 ID)
+TRANSFER_CHUNK_FMT = '!IQ'          # FILE_CHUNK payload 앞 (전송 ID, 파일 내 오프셋)
+TRANSFER_BLOCK_SIZE = 1024 * 1024   # 이어받기 / 중복 제거 해시 블록 크기
+TRANSFER_HAVE_TIMEOUT = 30.0        # FILE_HAVE 응답 대기 (초)
+TRANSFER_CACHE_DIR = "transfer_cache"   # 받은 파일의 content-addressed 캐시 (전체 해시 → 파일)
+TRANSFER_WRITE_SIZE = 4 * 1024 * 1024       # 수신 파일 쓰기 단위 (이 크기 경계에 맞춰 모아서 씀)
+TRANSFER_FSYNC_BYTES = 64 * 1024 * 1024     # 이만큼 쓸 때마다 fsync (끝날 때도 한 번)
+TRANSFER_WRITE_QUEUE_MAX = 256 * 1024 * 1024  # 디스크가 밀릴 때 메모리에 쌓아 둘 최대 바이트
+TRANSFER_STREAM_BUFFER = 8 * 1024 * 1024   # 인코딩하면서 보낼 때 전송 대기로 쌓아 둘 최대 바이트
+TRANSFER_MAX_JOBS = 4               # 동시에 준비 / 전송할 수 있는 파일 수
+TRANSFER_PROGRESS_INTERVAL = 0.2    # 진행률 표시 간격 (초)
+
+# -----------------------
+# Audio Visualizer 소스 모드
+# -----------------------
+VISUALIZER_SIZE = (640, 480)
+VISUALIZER_FPS = 20             # 오디오 패킷 주기와 무관한 고정 렌더링 주기
+VISUALIZER_FFT = 512
+VISUALIZER_DB_RANGE = 90.0      # 스펙트로그램 표시 범위 (dBFS)
+
+# -----------------------
+# 병렬 트랜스코딩 (transcode.py)
+# -----------------------
+TRANSCODE_SEGMENT_MIN_SEC = 4.0     # 세그먼트 최소 길이 (짧으면 ffmpeg 시작 비용이 커짐)
+TRANSCODE_SEGMENTS_PER_WORKER = 2   # 워커당 세그먼트 수 (끝부분 부하 균형)
+TRANSCODE_PARALLEL_MIN_SEC = 30.0   # 이보다 긴 비디오는 병렬 인코딩 후 전송 (짧으면 인코딩하면서 전송)
+
+# -----------------------
+# 비디오 품질 분석 (quality.py)
+# -----------------------
+QUALITY_SAMPLE_EVERY = 10           # N프레임마다 PSNR / SSIM (1이면 전부)
+QUALITY_WORKERS = max(1, min(4, (os.cpu_count() or 1) // 2))   # 구간별 프로세스 수
+
+# -----------------------
+# 압축 / 분석 결과 캐시 (analysis_cache.py)
+# -----------------------
+ANALYSIS_CACHE_DIR = "analysis_cache"
+ANALYSIS_CACHE_MAX = 2 * 1024 * 1024 * 1024     # 이보다 커지면 오래 안 쓴 항목부터 삭제
+
+# -----------------------
+# 이미지 목표 크기 / 전송 시간 맞추기 (rate_control.py)
+# -----------------------
+RATE_MODES = ["Fixed Q", "Target KB", "Target sec"]
+RATE_Q_MIN = 10
+RATE_Q_MAX = 95
+RATE_SCALES = (0.75, 0.5, 0.35, 0.25)    # Q 최솟값으로도 넘칠 때 시도할 축소 배율
+RATE_WORKERS = 4                         # 동시에 인코딩해 볼 Q 후보 수
+TRANSFER_DEFAULT_BPS = 1024 * 1024       # 전송 속도를 아직 못 쟀을 때 가정 (bytes/s)
+
+# -----------------------
+# 이미지 점진 전송 (썸네일 → progressive JPEG 한 번)
+# -----------------------
+IMAGE_THUMB_SIZE = 160                   # 먼저 보내는 미리보기의 긴 변 (px)
+IMAGE_THUMB_QUALITY = 50
+IMAGE_PREVIEW_MAX = 32 * 1024 * 1024     # 이보다 큰 이미지는 받는 중 표시 없이 다 받은 뒤 표시
+
+# -----------------------
+# 시작 시간 (python main.py bench)
+# -----------------------
+STARTUP_BUDGET_SEC = 2.0            # 새 프로세스 시작 → 첫 창이 그려질 때까지 (중간값)
+STARTUP_BENCH_RUNS = 3
+STARTUP_LAZY_MODULES = (            # 창이 뜰 때까지 올라오면 안 되는 모듈 (처음 쓸 때 import)
+    "pyaudio", "matplotlib", "quality", "transcode", "rate_control", "multiprocessing",
+)
 
 # -----------------------
 # ffmpeg 체크
 # -----------------------
+FFMPEG_LOCAL_DIR = "ffmpeg"         # 프로그램 폴더에 같이 둔 ffmpeg (있으면 PATH보다 우선)
+
+_ffmpeg = None                      # 찾은 결과 (경로 또는 None)를 (값,)으로 기억
+
+def _find_ffmpeg():
+    for name in ("ffmpeg.exe", "ffmpeg"):
+        local = os.path.join(FFMPEG_LOCAL_DIR, name)
+        if os.path.isfile(local) and os.access(local, os.X_OK):
+            return local
+    return shutil.which("ffmpeg")
+
+def ffmpeg_path():
+    """사용할 ffmpeg 실행 파일 (./ffmpeg/ffmpeg → PATH 순서). 없으면 None. 처음 쓸 때 한 번만 찾는다"""
+    global _ffmpeg
+    if _ffmpeg is None:
+        _ffmpeg = (_find_ffmpeg(),)
+    return _ffmpeg[0]
+
 def ffmpeg_available():
-    return shutil.which("ffmpeg") is not None
+    return ffmpeg_path() is not None
 
 
 
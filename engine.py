@@ -0,0 +1,443 @@
+# engine.py
+"""
+화면 없이 동작하는 클라이언트 엔진 (ClientEngine)
+
+- 연결 / 송신 스케줄러 / 수신 루프와 비디오 · 오디오 · 파일 전송 · 채팅 서브 모듈을 모두 가진다.
+  Tkinter를 쓰지 않으므로 디스플레이 없이 자동 테스트 / 봇 / 부하 생성에 쓸 수 있다
+- 화면에 보여 줄 것 / 알릴 것은 on_* 콜백으로 내보낸다 (None이면 버림).
+  콜백은 수신 / 캡처 / 작업 스레드에서 불리므로 GUI 프론트엔드는 자기 스레드로 넘겨야 한다
+  (main.App은 root.after로)
+- 파일 선택 / 경고 같은 대화 상자는 프론트엔드 몫: 엔진 API는 경로 / 값을 인자로 받고,
+  문제가 있으면 on_error로 알린다
+
+단독 실행: python engine.py [쌍 수] [초]
+    → socketpair로 이은 엔진 쌍 여러 개가 채팅 / MJPEG 프레임 / 이미지를 주고받는 부하 테스트
+"""
+
+import socket
+import threading
+
+from network import recv_packet, PacketScheduler
+from video_stream import VideoStream
+from audio_player import AudioPlayer
+from file_transfer import FileTransfer
+from transfer import TransferEngine
+from chat import ChatManager
+from audio_codec import CodecNegotiator, decode_packet, comfort_noise_level
+from av_sync import split_media_ts
+from audio_io import terminate_pyaudio
+
+from config import (
+    SERVER_PORT,
+    TYPE_VIDEO, TYPE_VIDEO_H263, TYPE_TEXT, TYPE_IMAGE,
+    TYPE_FILE_HDR, TYPE_FILE_CHUNK, TYPE_FILE_END,
+    TYPE_AUDIO, TYPE_KEYFRAME_REQ, TYPE_AUDIO_CFG, TYPE_FILE_HAVE,
+    ffmpeg_available
+)
+
+
+class ClientEngine:
+    def __init__(self):
+        # 상태
+        self.sock = None
+        self.scheduler = None        # 송신 우선순위 스케줄러 (연결마다 하나)
+        self.running = False
+        self.recv_thread = None
+
+        # 품질 / 필터
+        self.compression_quality = 50
+        self.filter_mode = "None"
+        self.use_h263 = ffmpeg_available()
+        self.stream_codec = "MJPEG"   # 라이브 스트림 코덱 (MJPEG / H.263)
+
+        # 프론트엔드 콜백 (None이면 버림)
+        self.on_local_frame = None        # (BGR) 내 카메라 / 파일 프레임
+        self.on_local_clear = None        # () 로컬 소스 종료
+        self.on_remote_frame = None       # (BGR) 디코딩된 수신 프레임 (H.263 / 받은 이미지)
+        self.on_remote_jpeg = None        # (JPEG bytes) MJPEG 수신 프레임 / 이미지 썸네일
+        self.on_chat = None               # (한 줄) "You: ..." / "Peer: ..." / "[SYSTEM] ..."
+        self.on_error = None              # (제목, 내용)
+        self.on_transfer_progress = None  # (pct, 보낸 bytes, 전체 bytes, MB/s)
+        self.on_result = None             # (labels, sizes, title, speed_title, log, quality) 압축 결과
+        self.on_packet = None             # (ttype, payload) 받은 패킷 전부 (처리 전, 부하 테스트용)
+        self.on_disconnected = None       # () 연결이 끊긴 뒤
+
+        # 서브 모듈 (오디오 장치 / 그래프 / 얼굴 검출 모델 / ffmpeg 분석 모듈은 처음 쓸 때 준비)
+        self.video = VideoStream(self)
+        self.audio_player = AudioPlayer()
+        self.audio_codec = CodecNegotiator(self)
+        self.transfer = TransferEngine(self)
+        self.file_transfer = FileTransfer(self)
+        self.chat = ChatManager(self)
+
+    # -----------------------
+    # 콜백 (서브 모듈 → 프론트엔드)
+    # -----------------------
+    @staticmethod
+    def _call(cb, *args):
+        if cb is None:
+            return
+        try:
+            cb(*args)
+        except Exception as e:
+            print("frontend callback error:", e)
+
+    def show_local(self, frame):
+        self._call(self.on_local_frame, frame)
+
+    def clear_local(self):
+        self._call(self.on_local_clear)
+
+    def show_remote_from_bgr(self, frame_bgr):
+        self._call(self.on_remote_frame, frame_bgr)
+
+    def show_remote_jpeg(self, jpeg_bytes: bytes):
+        self._call(self.on_remote_jpeg, jpeg_bytes)
+
+    def show_chat(self, line: str):
+        self._call(self.on_chat, line)
+
+    def system_msg(self, text: str):
+        self.chat.append_system(text)
+
+    def show_error(self, title, msg):
+        self._call(self.on_error, title, msg)
+
+    def update_transfer_status(self, pct, sent_bytes, total_bytes, speed_mbps):
+        self._call(self.on_transfer_progress, pct, sent_bytes, total_bytes, speed_mbps)
+
+    def report_result(self, labels, sizes, title, speed_title, log, quality=None):
+        self._call(self.on_result, labels, sizes, title, speed_title, log, quality)
+
+    def av_status(self):
+        """수신 A/V 오프셋 요약 (립싱크가 동작 중일 때만, 아니면 None)"""
+        v = self.video.playout.snapshot()
+        if v["offset_ms"] is None or not self.sock:
+            return None
+        a = self.audio_player.stats()
+        return (f"A/V offset {v['offset_ms']:+.0f} ms  |  audio delay {a['delay_ms']:.0f} ms  "
+                f"|  video late drops {v['late_drops']}")
+
+    def filter_status(self):
+        """얼굴 검출 처리 시간 (로컬 상태 표시용, 프레임에는 그리지 않는다). 안 쓰면 None"""
+        if "Face Detect" not in self.filter_mode:
+            return None
+        from filters import face_stats
+        s = face_stats(self.filter_mode)
+        if s is None:
+            return None
+        return f"face {s['cost_ms']:.1f} ms/frame (검출 {s['detect_ms']:.1f} ms, {s['faces']}명)"
+
+    # -----------------------
+    # Network
+    # -----------------------
+    def connect(self, host, port=SERVER_PORT):
+        """서버에 연결 (실패하면 on_error로 알리고 False)"""
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(5)
+            sock.connect((host, port))
+            sock.settimeout(None)
+        except Exception as e:
+            self.show_error("Connect failed", str(e))
+            return False
+        self.attach(sock)
+        self.system_msg(f"Connected to {host}:{port}")
+        return True
+
+    def attach(self, sock):
+        """이미 연결된 소켓으로 시작 (테스트 / 부하 생성: socketpair 등)"""
+        self.sock = sock
+        self.scheduler = PacketScheduler(sock)
+        self.running = True
+        self.recv_thread = threading.Thread(target=self.recv_loop, daemon=True)
+        self.recv_thread.start()
+        self.audio_codec.offer()
+
+    def disconnect(self):
+        self.system_msg("Disconnecting...")
+        self.running = False
+        if self.sock:
+            try:
+                self.sock.close()
+            except:
+                pass
+            self.sock = None
+
+    def send_bytes(self, ttype, payload: bytes):
+        """우선순위 큐에 넣고 바로 리턴 (실제 전송은 스케줄러 스레드)"""
+        scheduler = self.scheduler
+        if not self.sock or scheduler is None:
+            return False
+        return scheduler.send(ttype, payload)
+
+    def recv_loop(self):
+        try:
+            while self.running and self.sock:
+                ttype, payload = recv_packet(self.sock)
+                if not ttype:
+                    break
+
+                if self.on_packet:
+                    self._call(self.on_packet, ttype, payload)
+
+                if ttype == TYPE_VIDEO:
+                    # 스트리밍 비디오 수신 (앞 8바이트: 캡처 시각)
+                    ts, data = split_media_ts(payload)
+                    self.video.handle_video_packet(data, ts)
+
+                elif ttype == TYPE_VIDEO_H263:
+                    # H.263 라이브 스트림 수신
+                    ts, data = split_media_ts(payload)
+                    self.video.handle_h263_packet(data, ts)
+
+                elif ttype == TYPE_KEYFRAME_REQ:
+                    self.video.handle_keyframe_request()
+
+                elif ttype == TYPE_TEXT:
+                    text = payload.decode("utf-8", errors="replace")
+                    self.chat.handle_incoming(text)
+
+                elif ttype == TYPE_IMAGE:
+                    # 이미지 파일 수신 표시
+                    self.show_remote_jpeg(payload)
+
+                elif ttype == TYPE_FILE_HDR:
+                    self.file_transfer.handle_file_header(payload)
+
+                elif ttype == TYPE_FILE_CHUNK:
+                    self.file_transfer.handle_file_chunk(payload)
+
+                elif ttype == TYPE_FILE_END:
+                    self.file_transfer.handle_file_end(payload)
+
+                elif ttype == TYPE_FILE_HAVE:
+                    self.transfer.handle_have(payload)
+
+                elif ttype == TYPE_AUDIO:
+                    ts, data = split_media_ts(payload)
+                    level = comfort_noise_level(data)
+                    if level is not None:
+                        self.audio_player.comfort_noise(level)
+                    else:
+                        pcm = decode_packet(data)
+                        if pcm:
+                            self.audio_player.play(pcm, ts)
+                            self.video.feed_visualizer(
+                                "remote", pcm, self.audio_player.fmt["channels"]
+                            )
+
+                elif ttype == TYPE_AUDIO_CFG:
+                    self.audio_codec.handle(payload)
+
+        except Exception as e:
+            print("Receive loop error:", e)
+        finally:
+            print("Receiver exiting")
+            self.video.reset_remote()
+            self.audio_codec.reset()
+            self.file_transfer.abort_incoming()
+            self.transfer.abort_all()
+            if self.scheduler:
+                self.scheduler.stop()
+                self.scheduler = None
+            if self.sock:
+                try:
+                    self.sock.close()
+                except:
+                    pass
+                self.sock = None
+            self.running = False
+            self.system_msg("Disconnected from server")
+            self._call(self.on_disconnected)
+
+    # -----------------------
+    # 미디어 소스
+    # -----------------------
+    def start_camera(self):
+        self.video.start_camera()
+
+    def stop_camera(self):
+        self.video.stop_camera()
+
+    def start_audio(self):
+        if self.sock and self.audio_codec.peer_codecs is None:
+            self.audio_codec.offer()
+        self.video.audio.start()
+
+    def stop_audio(self):
+        self.video.audio.stop()
+
+    def start_visualizer(self):
+        self.video.start_visualizer()
+
+    def play_video_file(self, path):
+        """비디오 파일 방송 (로컬 표시 + 원격 스트리밍)"""
+        self.video.play_video_file_broadcast(path)
+
+    def send_frame(self, frame):
+        """카메라 없이 프레임 하나를 라이브 스트림으로 (로컬 표시 + 전송 + 녹화, 필터 없음)"""
+        self.video._emit_frame(frame)
+
+    def send_still_image(self, img):
+        """이미지 한 장을 상대 화면에 표시 (TYPE_IMAGE, 파일로 저장하지 않음)"""
+        import cv2
+
+        self.show_local(img)
+        if not self.sock:
+            return False
+        ok, jpg = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, self.compression_quality])
+        return ok and self.send_bytes(TYPE_IMAGE, jpg.tobytes())
+
+    def set_stream_codec(self, codec):
+        """라이브 스트림 코덱 변경. 실제로 쓰게 된 코덱을 리턴 (ffmpeg이 없으면 MJPEG)"""
+        if codec == "H.263" and not self.use_h263:
+            self.system_msg("ffmpeg not found — H.263 live stream unavailable, using MJPEG.")
+            codec = "MJPEG"
+        self.stream_codec = codec
+        return codec
+
+    # -----------------------
+    # 파일 / 채팅
+    # -----------------------
+    def send_image(self, path, quality=None, target=None):
+        """이미지 압축 + 품질 분석 + 전송 (백그라운드). target: None / ("bytes", n) / ("sec", 초)"""
+        q = self.compression_quality if quality is None else quality
+        return self.file_transfer.send_image(path, q, target)
+
+    def send_h263_video(self, path):
+        return self.file_transfer.send_h263_video(path)
+
+    def send_chat(self, text):
+        self.chat.send(text)
+
+    # -----------------------
+    # 종료
+    # -----------------------
+    def close(self):
+        """연결 / 캡처 / 재생 / 녹화를 모두 멈춘다 (창은 프론트엔드가 닫는다)"""
+        self.running = False
+        try:
+            self.video.stop_camera()
+            thread = self.video.thread
+            if thread and thread.is_alive() and thread is not threading.current_thread():
+                thread.join(timeout=0.5)
+        except:
+            pass
+        try:
+            if self.sock:
+                self.sock.close()         # 수신 루프가 recv에서 빠져나온다
+        except:
+            pass
+        try:
+            if self.recv_thread and self.recv_thread.is_alive():
+                self.recv_thread.join(timeout=0.5)
+        except:
+            pass
+        try:
+            self.video.playout.stop()
+        except:
+            pass
+        try:
+            for rec in self.video.recorders.values():
+                rec.stop()
+        except:
+            pass
+        terminate_pyaudio()
+
+
+if __name__ == "__main__":
+    # 부하 테스트: 엔진 쌍 (보내는 쪽 a → 받는 쪽 b)을 socketpair로 잇고,
+    # a가 MJPEG 프레임(20fps)과 채팅을 보내는 동안 b가 받은 양 / 지연을 센다
+    import sys
+    import time
+    import numpy as np
+    from av_sync import media_clock
+
+    pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    fps = 20
+
+    h, w = 240, 320
+    ramp = np.linspace(0, 255, w, dtype=np.float32)[None, :, None]
+    frames = [
+        np.broadcast_to((ramp + 8 * i) % 256, (h, w, 3)).astype(np.uint8) for i in range(fps)
+    ]
+
+    def receiver_stats(engine):
+        got = {"packets": 0, "bytes": 0, "frames": 0, "chat": 0, "latency": []}
+
+        def on_packet(ttype, payload):
+            got["packets"] += 1
+            got["bytes"] += len(payload)
+            if ttype == TYPE_VIDEO:
+                ts, _ = split_media_ts(payload)
+                got["latency"].append(media_clock() - ts)
+
+        def on_remote_jpeg(data):
+            got["frames"] += 1
+
+        def on_chat(line):
+            if line.startswith("Peer:"):
+                got["chat"] += 1
+
+        engine.on_packet = on_packet
+        engine.on_remote_jpeg = on_remote_jpeg
+        engine.on_chat = on_chat
+        return got
+
+    engines, stats = [], []
+    for _ in range(pairs):
+        a, b = ClientEngine(), ClientEngine()
+        stats.append(receiver_stats(b))
+        sa, sb = socket.socketpair()
+        a.attach(sa)
+        b.attach(sb)
+        engines.append((a, b))
+
+    def sender(engine, stop):
+        period = 1.0 / fps
+        next_t = time.monotonic()
+        n = 0
+        while not stop.is_set():
+            engine.send_frame(frames[n % fps])
+            if n % fps == 0:
+                engine.send_chat(f"ping {n // fps}")
+            n += 1
+            next_t += period
+            delay = next_t - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    stop = threading.Event()
+    threads = [threading.Thread(target=sender, args=(a, stop), daemon=True) for a, _ in engines]
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    time.sleep(0.3)                  # 보낸 것이 마저 도착하도록
+    wall, cpu = time.perf_counter() - t0, time.process_time() - cpu0
+    active = threading.active_count()
+
+    for a, b in engines:
+        a.close()
+        b.close()
+
+    latency = np.array([x for s in stats for x in s["latency"]]) * 1000
+    expected = int(seconds * fps)
+    total_bytes = sum(s["bytes"] for s in stats)
+    print(f"{pairs} pairs ({2 * pairs} endpoints), {seconds:g}s, {fps} fps MJPEG {w}x{h}")
+    print(f"  frames / receiver : min {min(s['frames'] for s in stats)}, "
+          f"max {max(s['frames'] for s in stats)} (sent ~{expected})")
+    print(f"  chat / receiver   : min {min(s['chat'] for s in stats)}")
+    print(f"  throughput        : {total_bytes / wall / 1e6:.2f} MB/s total")
+    if len(latency):
+        print(f"  latency           : p50 {np.percentile(latency, 50):.1f} ms, "
+              f"p95 {np.percentile(latency, 95):.1f} ms")
+    print(f"  CPU               : {cpu / wall:.2f} cores ({cpu / wall / (2 * pairs) * 100:.1f}% per endpoint), "
+          f"threads {active}")
+    if cpu > 0:
+        print(f"  → ~{2 * pairs * wall / cpu:.0f} endpoints per core at this load")
@@ -2,7 +2,7 @@
 """
 VideoNet 확장 기능 모듈
 
-- 녹화 기능(웹캠/전송 중 영상 로컬 저장)
+- 녹화 기능(웹캠/수신 영상 로컬 저장, 별도 writer 스레드, MJPEG 패스스루)
 - Tkinter용 녹화 버튼 생성 헬퍼
 - 1:1 통신 서버 실행 헬퍼
 - 파일 압축 + 품질 비교 (PSNR/SSIM) 함수
@@ -11,7 +11,10 @@ VideoNet 확장 기능 모듈
 import os
 import time
 import math
+import queue
+import struct
 import zipfile
+import threading
 
 import cv2
 import numpy as np
@@ -24,83 +27,238 @@ except ImportError:
 
 
 # ===============================
-# 1. 녹화 관련 (웹캠 → 파일 저장)
+# 1. 녹화 관련 (웹캠 / 수신 영상 → 파일 저장)
 # ===============================
 
+def jpeg_size(data):
+    """JPEG SOF 마커에서 (w, h)를 읽는다. 못 찾으면 None."""
+    i = 2
+    n = len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        seg_len = (data[i + 2] << 8) | data[i + 3]
+        # SOF0~SOF15 (DHT=C4, JPG=C8, DAC=CC 제외)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            h = (data[i + 5] << 8) | data[i + 6]
+            w = (data[i + 7] << 8) | data[i + 8]
+            return w, h
+        i += 2 + seg_len
+    return None
+
+
+class MjpegAviWriter:
+    """
+    JPEG 비트스트림을 디코딩/재인코딩 없이 그대로 AVI(MJPG)에 담는 최소 muxer.
+    헤더의 크기/프레임 수 필드는 close() 때 채운다.
+    """
+    def __init__(self, path, width, height, fps=20):
+        self.path = path
+        self.fp = open(path, "wb")
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.index = []          # (offset, size)
+        self.max_size = 0
+        self._write_headers()
+
+    def _write_headers(self):
+        fp = self.fp
+        w, h = self.width, self.height
+        usec = int(1_000_000 / self.fps)
+
+        fp.write(b"RIFF" + struct.pack("<I", 0) + b"AVI ")
+        fp.write(b"LIST" + struct.pack("<I", 4 + 64 + 12 + 64 + 48) + b"hdrl")
+
+        fp.write(b"avih" + struct.pack("<I", 56))
+        self._avih_frames = fp.tell() + 16
+        fp.write(struct.pack("<10I", usec, 0, 0, 0x10, 0, 0, 1, 0, w, h))
+        fp.write(b"\0" * 16)
+
+        fp.write(b"LIST" + struct.pack("<I", 4 + 64 + 48) + b"strl")
+        fp.write(b"strh" + struct.pack("<I", 56))
+        fp.write(b"vidsMJPG")
+        fp.write(struct.pack("<IHHIII", 0, 0, 0, 0, 1000, int(self.fps * 1000)))
+        self._strh_length = fp.tell() + 4
+        fp.write(struct.pack("<IIIiI", 0, 0, 0, -1, 0))
+        fp.write(struct.pack("<4h", 0, 0, w, h))
+
+        fp.write(b"strf" + struct.pack("<I", 40))
+        fp.write(struct.pack("<IiiHH", 40, w, h, 1, 24) + b"MJPG" +
+                 struct.pack("<IiiII", w * h * 3, 0, 0, 0, 0))
+
+        fp.write(b"LIST")
+        self._movi_size = fp.tell()
+        fp.write(struct.pack("<I", 0) + b"movi")
+        self._movi_start = self._movi_size + 4
+
+    def write_frame(self, jpeg_bytes):
+        size = len(jpeg_bytes)
+        self.index.append((self.fp.tell() - self._movi_start, size))
+        self.fp.write(b"00dc" + struct.pack("<I", size))
+        self.fp.write(jpeg_bytes)
+        if size & 1:
+            self.fp.write(b"\0")
+        self.max_size = max(self.max_size, size)
+
+    def close(self):
+        fp = self.fp
+        if fp is None:
+            return
+        movi_end = fp.tell()
+        fp.write(b"idx1" + struct.pack("<I", 16 * len(self.index)))
+        fp.write(b"".join(
+            b"00dc" + struct.pack("<III", 0x10, off, size) for off, size in self.index
+        ))
+        riff_end = fp.tell()
+
+        fp.seek(4)
+        fp.write(struct.pack("<I", riff_end - 8))
+        fp.seek(self._avih_frames)
+        fp.write(struct.pack("<I", len(self.index)))
+        fp.seek(self._strh_length)
+        fp.write(struct.pack("<II", len(self.index), self.max_size))
+        fp.seek(self._movi_size)
+        fp.write(struct.pack("<I", movi_end - self._movi_size - 4))
+        fp.close()
+        self.fp = None
+
+
 class VideoRecorder:
     """
-    간단한 비디오 녹화기.
-    - 첫 프레임이 들어올 때 자동으로 VideoWriter 생성
-    - app.capture_loop에서 매 프레임마다 write() 호출해 주면 됨
+    비동기 비디오 녹화기.
+    - write()/write_jpeg()는 큐에 넣기만 하고 바로 리턴 (라이브 경로 비용 최소화)
+    - 별도 writer 스레드가 파일에 기록, 큐가 가득 차면 새 프레임을 버린다
+    - write_jpeg(): 이미 JPEG인 프레임은 디코딩/재인코딩 없이 그대로 저장
+    - write(): raw BGR 프레임은 writer 스레드에서 JPEG로 인코딩
+    - source: "local"(내 카메라/파일) 또는 "remote"(수신 영상), 파일 이름에 붙는다
     """
-    def __init__(self, out_dir="records", fps=20):
+    def __init__(self, out_dir="records", fps=20, source="local", max_queue=60, quality=90):
         self.out_dir = out_dir
         self.fps = fps
+        self.source = source
+        self.quality = quality
         self.writer = None
         self.recording = False
-        self.frame_size = None
+        self.filename = None
+        self.frames = 0
+        self.dropped = 0
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = None
 
         if not os.path.exists(self.out_dir):
             os.makedirs(self.out_dir, exist_ok=True)
 
-    def _create_writer(self, frame):
-        h, w = frame.shape[:2]
-        self.frame_size = (w, h)
-        fourcc = cv2.VideoWriter_fourcc(*"XVID")
+    def _create_writer(self, jpeg_bytes):
+        size = jpeg_size(jpeg_bytes)
+        if size is None:
+            return False
         timestamp = time.strftime("%Y%m%d_%H%M%S")
-        filename = os.path.join(self.out_dir, f"record_{timestamp}.avi")
-        self.writer = cv2.VideoWriter(filename, fourcc, self.fps, self.frame_size)
-        print("[Recorder] Start recording to:", filename)
-        return filename
+        self.filename = os.path.join(self.out_dir, f"record_{self.source}_{timestamp}.avi")
+        self.writer = MjpegAviWriter(self.filename, size[0], size[1], self.fps)
+        print("[Recorder] Start recording to:", self.filename)
+        return True
 
     def start(self):
+        if self.recording:
+            return
+        self.frames = 0
+        self.dropped = 0
         self.recording = True
-        print("[Recorder] Recording flag ON")
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        print(f"[Recorder] Recording flag ON ({self.source})")
 
     def stop(self):
+        if not self.recording:
+            return
         self.recording = False
-        if self.writer is not None:
-            self.writer.release()
-            self.writer = None
-            print("[Recorder] Recording stopped / writer released")
+        self.queue.put(None)
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+        print(f"[Recorder] Recording stopped ({self.frames} frames, {self.dropped} dropped)")
+
+    def _put(self, item):
+        if not self.recording:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
 
     def write(self, frame):
         """
-        capture_loop에서 매 프레임마다 호출.
-        start()가 켜져 있을 때만 기록.
+        raw BGR 프레임 (JPEG 인코딩은 writer 스레드에서)
+        호출한 쪽이 버퍼를 재사용할 수 있으므로(예: visualizer.render) 복사해서 넣는다
         """
-        if not self.recording:
-            return
+        if self.recording:
+            self._put((frame.copy(), None))
+
+    def write_jpeg(self, jpeg_bytes):
+        """이미 인코딩된 JPEG 프레임 (그대로 저장)"""
+        self._put((None, jpeg_bytes))
 
-        if self.writer is None:
-            # 첫 프레임 들어오면 writer 생성
-            self._create_writer(frame)
+    def _loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            frame, jpeg = item
+            try:
+                if jpeg is None:
+                    ok, enc = cv2.imencode(".jpg", frame,
+                                           [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                    if not ok:
+                        continue
+                    jpeg = enc.tobytes()
+                if self.writer is None and not self._create_writer(jpeg):
+                    continue
+                self.writer.write_frame(jpeg)
+                self.frames += 1
+            except Exception as e:
+                print("[Recorder] write error:", e)
 
-        self.writer.write(frame)
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            print("[Recorder] Writer closed:", self.filename)
 
 
 def add_record_controls(parent_frame, app):
     """
-    client.VideoChatClient.setup_gui() 안에서 호출해서
+    AppUI 안에서 호출해서 녹화 대상(Local/Remote) 선택과
     'Start Rec', 'Stop Rec' 버튼을 추가하는 헬퍼.
 
-    parent_frame: Tkinter Frame (예: group_mode)
-    app: VideoChatClient 인스턴스
+    parent_frame: Tkinter Frame
+    app: main.App 인스턴스 (app.video.recorders 사용)
     """
     if tk is None:
         return
 
-    # VideoRecorder 인스턴스를 app에 달아둔다.
-    if not hasattr(app, "_recorder"):
-        app._recorder = VideoRecorder()
+    from tkinter import ttk
+
+    combo = ttk.Combobox(parent_frame, values=["Local", "Remote"],
+                         state="readonly", width=7)
+    combo.current(0)
+    combo.pack(side="left", padx=4)
 
     def on_start():
-        app.append_chat_system("Recording started")
-        app._recorder.start()
+        source = combo.get().lower()
+        app.video.recorders[source].start()
+        app.system_msg(f"Recording started ({source})")
 
     def on_stop():
-        app._recorder.stop()
-        app.append_chat_system("Recording stopped")
+        for source, rec in app.video.recorders.items():
+            if rec.recording:
+                rec.stop()
+                app.system_msg(f"Recording stopped ({source}): {rec.filename}")
 
     tk.Button(parent_frame, text="Start Rec",
               command=on_start, bg="#ffd27f").pack(side="left", padx=4)
@@ -110,9 +268,9 @@ def add_record_controls(parent_frame, app):
 
 def handle_record_frame(app, frame):
     """
-    client.capture_loop() 안에서 프레임을 로컬 저장하고 싶을 때 호출.
+    캡처 루프 안에서 로컬 프레임을 저장하고 싶을 때 호출.
     """
-    rec = getattr(app, "_recorder", None)
+    rec = app.video.recorders.get("local")
     if rec is not None:
         rec.write(frame)
 
@@ -161,8 +319,157 @@ def zip_compress_file(in_path, out_zip=None):
 
 
 # ---------- PSNR / SSIM (이미지 품질) ----------
+#
+# - float32 커널: Y는 cv2.transform 한 번 (채널별 슬라이스 / float64 변환 없음),
+#   SSIM의 중간 값은 스레드별로 재사용하는 scratch 버퍼에 in-place로 계산
+# - SSIM은 행 단위 타일(SSIM_TILE_ROWS + 가우시안 반경만큼 겹침)로 나눠 계산 → 메모리가 프레임 크기와 무관.
+#   겹친 행으로 경계를 처리하므로 결과는 전체 이미지를 한 번에 계산한 것과 같다
+# - *_batch: N×H×W×3 스택(또는 리스트)을 받는 편의 함수. 안에서는 프레임마다 단일 커널을 부르는
+#   파이썬 루프다 (SSIM 블러가 프레임 경계를 넘으면 안 되므로 스택 전체를 한 번에 계산하지 않는다).
+#   이득은 모든 프레임이 같은 scratch 버퍼를 쓰는 것뿐
+# - 원래 float64 구현은 _compute_psnr_ref / _compute_ssim_y_ref 로 남겨 두고
+#   python extra.py bench 로 속도와 오차를 비교한다 (오차는 tests/test_quality_kernels.py에서도 검사)
+
+SSIM_TILE_ROWS = 256
+_Y_BGR = np.array([[0.114, 0.587, 0.299]], dtype=np.float32)     # BGR → Y (BT.601)
+_SSIM_C1 = (0.01 * 255) ** 2
+_SSIM_C2 = (0.03 * 255) ** 2
+_scratch = threading.local()
+
 
 def compute_psnr(img_ref, img_cmp):
+    if img_ref.shape != img_cmp.shape:
+        raise ValueError(f"이미지 크기가 다름: {img_ref.shape} vs {img_cmp.shape}")
+    # 차이 제곱합을 OpenCV가 한 번에 (임시 배열 없음, 누적은 double)
+    mse = cv2.norm(img_ref, img_cmp, cv2.NORM_L2SQR) / img_ref.size
+    if mse == 0:
+        return float("inf")
+    PIXEL_MAX = 255.0
+    return 20 * math.log10(PIXEL_MAX) - 10 * math.log10(mse)
+
+
+def bgr2y(img, out=None):
+    """BGR → Y (float32). 회색조(2차원)는 그대로 float32로"""
+    if img.ndim == 2:
+        if out is None:
+            return img.astype(np.float32)
+        np.copyto(out, img)
+        return out
+    if img.dtype != np.float32:
+        img = img.astype(np.float32)
+    return cv2.transform(img, _Y_BGR, dst=out)
+
+
+def _buffers(rows, cols):
+    """현재 스레드의 scratch 버퍼 (크기가 바뀔 때만 새로 할당)"""
+    key = (rows, cols)
+    bufs = getattr(_scratch, "bufs", None)
+    if bufs is None or bufs["key"] != key:
+        bufs = {"key": key, "rgb": np.empty((rows, cols, 3), np.float32)}
+        for name in ("y1", "y2", "mu1", "mu2", "s11", "s22", "s12", "t1", "t2"):
+            bufs[name] = np.empty((rows, cols), np.float32)
+        _scratch.bufs = bufs
+    return bufs
+
+
+def _luma_into(img, a0, a1, bufs, name):
+    n = a1 - a0
+    dst = bufs[name][:n]
+    if img.ndim == 2:
+        np.copyto(dst, img[a0:a1])
+        return dst
+    rgb = bufs["rgb"][:n]
+    np.copyto(rgb, img[a0:a1])
+    y = cv2.transform(rgb, _Y_BGR, dst=dst)
+    if y is not dst:
+        np.copyto(dst, y.reshape(dst.shape))
+    return dst
+
+
+def _blur(src, dst, ksize, sigma):
+    out = cv2.GaussianBlur(src, (ksize, ksize), sigma, dst=dst)
+    if out is not dst:
+        np.copyto(dst, out)
+    return dst
+
+
+def _ssim_sum(img1, img2, ksize, sigma, tile_rows):
+    """SSIM 맵의 합 (행 타일마다 반경만큼 겹쳐서 계산)"""
+    h, w = img1.shape[:2]
+    halo = ksize // 2
+    tile_rows = max(1, min(tile_rows, h))
+    bufs = _buffers(tile_rows + 2 * halo, w)
+    total = 0.0
+
+    for r0 in range(0, h, tile_rows):
+        r1 = min(r0 + tile_rows, h)
+        a0, a1 = max(0, r0 - halo), min(h, r1 + halo)
+        n = a1 - a0
+        y1 = _luma_into(img1, a0, a1, bufs, "y1")
+        y2 = _luma_into(img2, a0, a1, bufs, "y2")
+
+        mu1 = _blur(y1, bufs["mu1"][:n], ksize, sigma)
+        mu2 = _blur(y2, bufs["mu2"][:n], ksize, sigma)
+        t = bufs["t1"][:n]
+        s11 = _blur(np.multiply(y1, y1, out=t), bufs["s11"][:n], ksize, sigma)
+        s22 = _blur(np.multiply(y2, y2, out=t), bufs["s22"][:n], ksize, sigma)
+        s12 = _blur(np.multiply(y1, y2, out=t), bufs["s12"][:n], ksize, sigma)
+
+        # 겹친 행을 뺀 가운데만 (이미지 가장자리 처리는 전체 계산과 같다)
+        c = slice(r0 - a0, r1 - a0)
+        mu1, mu2, s11, s22, s12 = mu1[c], mu2[c], s11[c], s22[c], s12[c]
+        mu1_sq = np.multiply(mu1, mu1, out=bufs["t1"][c])
+        mu2_sq = np.multiply(mu2, mu2, out=bufs["t2"][c])
+        mu12 = np.multiply(mu1, mu2, out=mu1)
+
+        s11 -= mu1_sq                      # sigma1^2
+        s22 -= mu2_sq                      # sigma2^2
+        s12 -= mu12                        # sigma12
+
+        num = mu12
+        num *= 2
+        num += _SSIM_C1
+        s12 *= 2
+        s12 += _SSIM_C2
+        num *= s12
+
+        den = mu1_sq
+        den += mu2_sq
+        den += _SSIM_C1
+        s11 += s22
+        s11 += _SSIM_C2
+        den *= s11
+
+        num /= den
+        total += float(num.sum(dtype=np.float64))
+    return total
+
+
+def compute_ssim_y(img1, img2, ksize=11, sigma=1.5, tile_rows=SSIM_TILE_ROWS):
+    """
+    간단한 Y채널 기반 SSIM 구현 (과제용)
+    """
+    if img1.shape != img2.shape:
+        raise ValueError(f"이미지 크기가 다름: {img1.shape} vs {img2.shape}")
+    h, w = img1.shape[:2]
+    return _ssim_sum(img1, img2, ksize, sigma, tile_rows) / (h * w)
+
+
+def compute_psnr_batch(refs, cmps):
+    """N장 스택(N×H×W×3 또는 리스트) → PSNR 배열 (N,). 프레임마다 compute_psnr를 부르는 편의 함수"""
+    return np.array([compute_psnr(a, b) for a, b in zip(refs, cmps)], dtype=np.float64)
+
+
+def compute_ssim_y_batch(refs, cmps, ksize=11, sigma=1.5, tile_rows=SSIM_TILE_ROWS):
+    """N장 스택 → SSIM 배열 (N,). 프레임마다 compute_ssim_y를 부르는 편의 함수 (scratch 버퍼 공유)"""
+    return np.array(
+        [compute_ssim_y(a, b, ksize, sigma, tile_rows) for a, b in zip(refs, cmps)],
+        dtype=np.float64
+    )
+
+
+# 원래 구현 (float64) — bench의 기준값
+def _compute_psnr_ref(img_ref, img_cmp):
     diff = img_ref.astype(np.float64) - img_cmp.astype(np.float64)
     mse = np.mean(diff ** 2)
     if mse == 0:
@@ -171,21 +478,16 @@ def compute_psnr(img_ref, img_cmp):
     return 20 * math.log10(PIXEL_MAX) - 10 * math.log10(mse)
 
 
-def bgr2y(img):
+def _bgr2y_ref(img):
     B = img[:, :, 0].astype(np.float64)
     G = img[:, :, 1].astype(np.float64)
     R = img[:, :, 2].astype(np.float64)
     return 0.299 * R + 0.587 * G + 0.114 * B
 
 
-def compute_ssim_y(img1, img2, ksize=11, sigma=1.5):
-    """
-    간단한 Y채널 기반 SSIM 구현 (과제용)
-    """
-    import cv2
-
-    Y1 = bgr2y(img1)
-    Y2 = bgr2y(img2)
+def _compute_ssim_y_ref(img1, img2, ksize=11, sigma=1.5):
+    Y1 = _bgr2y_ref(img1)
+    Y2 = _bgr2y_ref(img2)
 
     C1 = (0.01 * 255) ** 2
     C2 = (0.03 * 255) ** 2
@@ -231,6 +533,58 @@ def compare_image_quality(orig_path, cmp_path):
     return psnr, ssim
 
 
+def _bench_quality(iters=10):
+    """float32 커널 vs 원래 구현: 속도 + 오차 (PSNR 1e-6 dB, SSIM 1e-4 이내여야 통과)"""
+    rng = np.random.default_rng(0)
+    ok = True
+    for w, h in ((704, 576), (1280, 720), (1920, 1080)):
+        # 부드러운 영상 + JPEG 압축본 (실제 비교와 비슷한 값 분포)
+        base = cv2.resize(rng.integers(0, 256, (h // 16, w // 16, 3), dtype=np.uint8), (w, h),
+                          interpolation=cv2.INTER_CUBIC)
+        refs = np.stack([np.roll(base, 3 * i, axis=1) for i in range(iters)])
+        cmps = np.stack([
+            cv2.imdecode(cv2.imencode(".jpg", f, [cv2.IMWRITE_JPEG_QUALITY, 30])[1], cv2.IMREAD_COLOR)
+            for f in refs
+        ])
+
+        t = time.perf_counter()
+        ref_p = [_compute_psnr_ref(a, b) for a, b in zip(refs, cmps)]
+        ref_s = [_compute_ssim_y_ref(a, b) for a, b in zip(refs, cmps)]
+        t_ref = (time.perf_counter() - t) / iters
+
+        t = time.perf_counter()
+        one_p = [compute_psnr(a, b) for a, b in zip(refs, cmps)]
+        one_s = [compute_ssim_y(a, b) for a, b in zip(refs, cmps)]
+        t_one = (time.perf_counter() - t) / iters
+
+        t = time.perf_counter()
+        bat_p = compute_psnr_batch(refs, cmps)
+        bat_s = compute_ssim_y_batch(refs, cmps)
+        t_bat = (time.perf_counter() - t) / iters
+
+        err_p = max(np.max(np.abs(np.subtract(one_p, ref_p))), np.max(np.abs(bat_p - ref_p)))
+        err_s = max(np.max(np.abs(np.subtract(one_s, ref_s))), np.max(np.abs(bat_s - ref_s)))
+        passed = err_p < 1e-6 and err_s < 1e-4
+        ok = ok and passed
+        print(f"{w}x{h}: reference {t_ref * 1000:7.1f} ms/frame | float32 {t_one * 1000:6.1f} ms "
+              f"({t_ref / t_one:4.1f}x) | batch {t_bat * 1000:6.1f} ms | "
+              f"max err PSNR {err_p:.1e} dB, SSIM {err_s:.1e} {'OK' if passed else 'FAIL'}")
+
+    # 타일 경계: 타일 크기와 상관없이 같은 값이어야 한다
+    a, b = refs[0], cmps[0]
+    whole = compute_ssim_y(a, b, tile_rows=a.shape[0])
+    for rows in (1, 7, 64):
+        d = abs(compute_ssim_y(a, b, tile_rows=rows) - whole)
+        ok = ok and d < 1e-6
+        print(f"tile_rows={rows}: |diff| vs untiled {d:.1e}")
+    return ok
+
+
 if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:2] == ["bench"]:
+        # python extra.py bench : PSNR / SSIM 커널 속도 + 허용 오차 검사
+        sys.exit(0 if _bench_quality() else 1)
     # python extra.py 로 실행하면 서버 테스트용으로 동작하게 해둠
     run_relay_server()
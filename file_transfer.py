@@ -1,26 +1,32 @@
 # file_transfer.py
 import os
 import json
+import shutil
+import threading
 import cv2
-import time
-import matplotlib.pyplot as plt
 import numpy as np
 
-from tkinter import filedialog, messagebox
 from extra import compute_psnr, compute_ssim_y
 
 from config import (
-    TYPE_FILE_HDR, TYPE_FILE_CHUNK, TYPE_FILE_END,
-    TYPE_IMAGE, TYPE_VIDEO, TYPE_VIDEO_H263
+    TYPE_FILE_HAVE,
+    TYPE_IMAGE, TYPE_VIDEO, TYPE_VIDEO_H263, TRANSFER_CACHE_DIR, TRANSCODE_PARALLEL_MIN_SEC,
+    QUALITY_SAMPLE_EVERY, QUALITY_WORKERS,
+    IMAGE_THUMB_SIZE, IMAGE_THUMB_QUALITY, IMAGE_PREVIEW_MAX
+)
+from utils import (
+    imread_unicode, open_h263_stream, stream_error, remux_to_avi, find_jpeg_scans, JPEG_EOI
+)
+from analysis_cache import get_analysis_cache
+from transfer import (
+    split_transfer_id, split_chunk, hash_file_blocks, root_hash, encode_have
 )
-from utils import imread_unicode, encode_h263
-from network import send_packet
 
 
 class FileTransfer:
     def __init__(self, app):
         self.app = app
-        self.incoming = None
+        self.incoming = {}        # 전송 ID → 수신 중인 파일 (여러 파일 동시 수신)
 
 
     # -------------------------------------------------------
@@ -29,320 +35,565 @@ class FileTransfer:
     def handle_file_header(self, payload: bytes):
         try:
             meta = json.loads(payload.decode("utf-8"))
-            fname = meta.get("filename", "received.bin")
+            tid = meta.get("id", 0)
+            fname = os.path.basename(meta.get("filename", "received.bin"))
             codec = meta.get("codec")
 
             if codec == "h263":
                 root, ext = os.path.splitext(fname)
                 save_name = f"recv_{root}.avi"     
-                self.incoming = {
-                    "name": save_name,
-                    "size": meta.get("filesize"),
-                    "received": 0,
-                    "fp": open(save_name, "wb"),
-                    "codec": "h263",
-                }
                 self.app.system_msg(f"[수신 시작] H.263 비디오: {save_name}")
-
             else:
                 save_name = f"recv_{fname}"
-                self.incoming = {
-                    "name": save_name,
-                    "size": meta.get("filesize"),
-                    "received": 0,
-                    "fp": open(save_name, "wb"),
-                    "codec": None,
-                }
                 self.app.system_msg(f"[수신 시작] 파일: {save_name}")
 
+            # 같은 이름을 동시에 받는 경우 덮어쓰지 않도록
+            if any(info["name"] == save_name for info in self.incoming.values()):
+                root, ext = os.path.splitext(save_name)
+                save_name = f"{root}_{tid}{ext}"
+
+            old = self.incoming.pop(tid, None)
+            if old and old["fh"]:
+                self.app.transfer.writer.close(old["fh"])
+
+            if meta.get("stream"):
+                self._start_stream(tid, save_name, meta)
+                return
+
+            # 받는 동안은 .part에 쓰고, 검증이 끝나면 이름을 바꾼다
+            # (.part 이름에 전체 해시를 넣어서 내용이 다른 같은 이름 파일과 섞이지 않게)
+            info = {
+                "id": tid,
+                "name": save_name,
+                "part": f"{save_name}.{meta['hash'][:16]}.part",
+                "size": meta.get("filesize"),
+                "block_size": meta["block_size"],
+                "blocks": meta["blocks"],
+                "hash": meta["hash"],
+                "received": 0,
+                "fh": None,           # InboundWriter 핸들
+                "codec": codec,
+                "container": None,
+                "preview": None,
+            }
+            if meta.get("progressive") and 0 < meta["filesize"] <= IMAGE_PREVIEW_MAX:
+                # progressive JPEG: 스캔이 하나씩 도착할 때마다 화면 갱신 (메모리에도 모아 둠)
+                info["preview"] = {
+                    "buf": bytearray(meta["filesize"]),
+                    "filled": 0,          # 앞에서부터 연속으로 받은 바이트
+                    "sos": [],            # 받은 범위 안의 SOS 위치
+                    "shown": 0,           # 마지막으로 디코딩한 길이
+                    "layers": 0,
+                    "busy": False,
+                    "done": False,
+                }
+            self.incoming[tid] = info
+
+            # 캐시 / .part 확인(해시)은 수신 스레드 밖에서 → 끝나면 FILE_HAVE 응답
+            self.app.transfer.submit_rx(self._prepare_inbound, info)
+
         except Exception as e:
             print("file header parse error:", e)
 
+    def _start_stream(self, tid, save_name, meta):
+        """
+        인코딩하면서 보내는 스트림: 크기 / 해시는 FILE_END의 trailer로 오므로
+        이어받기 확인 없이 바로 받기 시작한다 (FILE_HAVE 응답 없음)
+        """
+        part = f"{save_name}.{tid}.stream.part"
+        self.incoming[tid] = {
+            "id": tid,
+            "name": save_name,
+            "part": part,
+            "size": None,
+            "block_size": meta["block_size"],
+            "blocks": None,
+            "hash": None,
+            "received": 0,
+            # 파일 열기(남은 같은 이름 .part는 비움)는 writer 스레드에서 → 수신 스레드는 디스크를 안 기다림
+            "fh": self.app.transfer.writer.open_later(part, truncate=True),
+            "codec": meta.get("codec"),
+            "container": meta.get("container"),
+            "fps": meta.get("fps", 30),
+            "preview": None,
+        }
 
-    # -------------------------------------------------------
-    # JPEG 이미지 또는 일반 파일 CHUNK 수신
-    # -------------------------------------------------------
-    def handle_file_chunk(self, payload: bytes):
-        if not self.incoming:
-            return
+    def _prepare_inbound(self, info):
+        size = info["size"]
+        cached = os.path.join(TRANSFER_CACHE_DIR, info["hash"])
+        have = [False] * len(info["blocks"])
 
-        info = self.incoming
+        if os.path.exists(cached) and os.path.getsize(cached) == size:
+            # 예전에 받은 것과 같은 내용 → 캐시에서 복사, 보낼 블록 없음
+            shutil.copyfile(cached, info["part"])
+            have = [True] * len(have)
+            self.app.system_msg(f"[중복] {info['name']}: 캐시에 있는 파일 사용")
 
-        # 파일 쓰기
-        info["fp"].write(payload)
-        info["received"] += len(payload)
+        elif os.path.exists(info["part"]) and os.path.getsize(info["part"]) == size and size:
+            # 받다 만 파일 → 해시가 맞는 블록은 다시 받지 않는다
+            hashes = hash_file_blocks(info["part"], info["block_size"])
+            have = [h == b for h, b in zip(hashes, info["blocks"])]
+            if any(have):
+                self.app.system_msg(
+                    f"[이어받기] {info['name']}: {sum(have)}/{len(have)} 블록 있음"
+                )
 
-        # 완료 여부 확인
-        if info["size"] is not None and info["received"] >= info["size"]:
-            info["fp"].close()
-            name = info["name"]
-            self.incoming = None
-            self.app.system_msg(f"[수신 완료] {name}")
+        elif os.path.exists(info["part"]):
+            os.remove(info["part"])   # 크기가 다른 .part는 쓸 수 없음
 
-            # 이미지면 화면 표시
-            if name.lower().endswith((".jpg", ".jpeg", ".png", ".bmp", ".webp")):
-                img = imread_unicode(name)
-                if img is not None:
-                    self.app.show_remote_from_bgr(img)
+        if any(have):
+            info["preview"] = None    # 일부만 새로 받으면 앞부분이 메모리에 없다 → 다 받은 뒤 표시
+
+        # 파일 크기만큼 미리 할당 (쓰기는 InboundWriter 스레드가)
+        info["fh"] = self.app.transfer.writer.open(info["part"], size)
+        msg = {"id": info["id"], "have": encode_have(have)}
+        self.app.send_bytes(TYPE_FILE_HAVE, json.dumps(msg).encode("utf-8"))
 
 
     # -------------------------------------------------------
-    # H.263 chunk 수신
+    # 파일 CHUNK 수신 (앞 12바이트: 전송 ID, 오프셋)
     # -------------------------------------------------------
-    def handle_h263_chunk(self, payload: bytes):
-        if not self.incoming or self.incoming["codec"] != "h263":
+    def handle_file_chunk(self, payload: bytes):
+        tid, offset, data = split_chunk(payload)
+        info = self.incoming.get(tid)
+        if not info or not info["fh"]:
             return
 
-        info = self.incoming
-        info["fp"].write(payload)
-        info["received"] += len(payload)
+        # 파일 쓰기는 writer 스레드로 넘기기만 (수신 스레드는 디스크를 기다리지 않음)
+        self.app.transfer.writer.write(info["fh"], offset, data)
+        info["received"] += len(data)
+
+        preview = info["preview"]
+        if preview is not None:
+            self._feed_preview(preview, offset, data)
+
+    def _feed_preview(self, preview, offset, data):
+        """받은 청크를 모으고, 새 스캔이 끝났으면 (다음 SOS가 보이면) 디코딩을 맡긴다"""
+        end = offset + len(data)
+        buf = preview["buf"]
+        buf[offset:end] = data
+        if offset != preview["filled"]:
+            return                    # 순서대로 온 청크만 (이어받기가 없으면 항상 순서대로)
+        scan_from = max(0, preview["filled"] - 1)      # 청크 경계에 걸친 마커
+        preview["filled"] = end
+        preview["sos"].extend(find_jpeg_scans(buf, scan_from, end))
+        if len(preview["sos"]) >= 2 and preview["sos"][-1] > preview["shown"] and not preview["busy"]:
+            preview["busy"] = True
+            self.app.transfer.submit_rx(self._show_preview, preview)
+
+    def _show_preview(self, preview):
+        """마지막 SOS 앞까지 (= 끝난 스캔 전부) + EOI를 디코딩해서 원격 화면에 표시"""
+        try:
+            while not preview["done"]:
+                end = preview["sos"][-1]
+                if end <= preview["shown"]:
+                    break
+                data = bytes(preview["buf"][:end]) + JPEG_EOI
+                img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                preview["shown"] = end
+                if img is not None and not preview["done"]:
+                    preview["layers"] += 1
+                    self.app.show_remote_from_bgr(img)
+        finally:
+            preview["busy"] = False
 
 
     # -------------------------------------------------------
-    # H.263 종료
+    # 파일 종료 → 전체 검증
     # -------------------------------------------------------
-    def handle_file_end(self):
-        if self.incoming:
-            name = self.incoming["name"]
+    def handle_file_end(self, payload: bytes):
+        tid, rest = split_transfer_id(payload)
+        info = self.incoming.pop(tid, None)
+        if not info or not info["fh"]:
+            return
+        if info["preview"] is not None:
+            info["preview"]["done"] = True       # 이제부터는 완성본만 표시
+        if rest:
+            # 스트림: 최종 크기 / 블록 해시가 여기서 온다
             try:
-                self.incoming["fp"].close()
-            except:
-                pass
+                trailer = json.loads(bytes(rest).decode("utf-8"))
+            except Exception as e:
+                print("file end parse error:", e)
+                trailer = {"error": True}
+            if trailer.get("error"):
+                self.app.transfer.writer.close(info["fh"], lambda: os.remove(info["part"]))
+                self.app.system_msg(f"[수신 실패] {info['name']}: 송신측 인코딩 실패")
+                return
+            info["size"] = trailer["filesize"]
+            info["blocks"] = trailer["blocks"]
+            info["hash"] = trailer["hash"]
+        # 남은 쓰기 + fsync가 끝난 뒤 검증
+        transfer = self.app.transfer
+        transfer.writer.close(info["fh"], lambda: transfer.submit_rx(self._finish_inbound, info))
+
+    def _finish_inbound(self, info):
+        name = info["name"]
+
+        if info["fh"]["error"]:
+            # 디스크 쓰기 실패 → 검증할 것도 없음 (.part는 남겨서 다음에 이어받기)
+            self.app.system_msg(f"[수신 실패] {name}: 파일 쓰기 오류 ({info['fh']['error']})")
+            return
+
+        # 파일 전체를 다시 해시해서 헤더의 해시와 비교
+        hashes = hash_file_blocks(info["part"], info["block_size"])
+        if root_hash(hashes, os.path.getsize(info["part"])) != info["hash"]:
+            bad = sum(h != b for h, b in zip(hashes, info["blocks"]))
+            self.app.system_msg(
+                f"[검증 실패] {name}: {bad}개 블록 불일치 (다시 받으면 맞는 블록은 재사용)"
+            )
+            return
 
-            self.incoming = None
-            self.app.system_msg(f"[수신 종료] {name}")
+        if info["container"] == "nut":
+            # 인코딩하면서 받은 스트림 → AVI로 remux (캐시 해시는 nut 기준이라 캐시하지 않음)
+            if not remux_to_avi(info["part"], name, info["fps"]):
+                # 검증된 스트림은 지우지 않고 .nut으로 남겨 둔다 (나중에 직접 변환 가능)
+                kept = name + ".nut"
+                os.replace(info["part"], kept)
+                self.app.system_msg(f"[수신 실패] {name}: AVI 변환 실패 (받은 스트림은 {kept}에 저장)")
+                return
+            os.remove(info["part"])
+        else:
+            os.replace(info["part"], name)     # 검증된 임시 파일을 원자적으로 교체
+            self._add_to_cache(name, info["hash"])
+        layers = info["preview"]["layers"] if info["preview"] else 0
+        self.app.system_msg(
+            f"[수신 완료] {name} (검증 OK, 새로 받은 {info['received']} bytes"
+            + (f", 받는 중 {layers}단계 표시" if layers else "") + ")"
+        )
+
+        # 이미지면 화면 표시
+        if name.lower().endswith((".jpg", ".jpeg", ".png", ".bmp", ".webp")):
+            img = imread_unicode(name)
+            if img is not None:
+                self.app.show_remote_from_bgr(img)
+
+    @staticmethod
+    def _add_to_cache(path, digest):
+        try:
+            os.makedirs(TRANSFER_CACHE_DIR, exist_ok=True)
+            cached = os.path.join(TRANSFER_CACHE_DIR, digest)
+            if os.path.exists(cached):
+                return
+            try:
+                os.link(path, cached)          # 같은 파일시스템이면 공간을 쓰지 않음
+            except OSError:
+                shutil.copyfile(path, cached)
+        except Exception as e:
+            print("transfer cache error:", e)
+
+    def abort_incoming(self):
+        """연결이 끊기면 받던 파일을 모두 닫는다 (.part는 남겨서 다음에 이어받기)"""
+        for info in self.incoming.values():
+            if info["fh"]:
+                self.app.transfer.writer.close(info["fh"])
+            self.app.system_msg(f"[수신 중단] {info['name']} (다음 전송 때 이어받기)")
+        self.incoming.clear()
 
 
     # -------------------------------------------------------
-    # 이미지(JPEG) 전송
+    # 프론트엔드 알림 (작업 스레드에서 호출 → app 콜백)
     # -------------------------------------------------------
-    def compress_and_send_with_quality(self):
-        path = filedialog.askopenfilename(
-            filetypes=[("Image", "*.jpg *.jpeg *.png *.bmp *.webp")]
-        )
-        if not path:
-            return
+    def _error(self, title, msg):
+        self.app.show_error(title, msg)
 
-        import time
-        import matplotlib.pyplot as plt
-
-        Q = self.app.compression_quality
+    def _check_connected(self):
+        if not self.app.sock:
+            self.app.show_error("Not connected", "서버 연결 후 다시 시도하세요.")
+            return False
+        return True
 
+    # -------------------------------------------------------
+    # 이미지(JPEG) 전송
+    # -------------------------------------------------------
+    def send_image(self, path, Q, target=None):
+        """압축 / 분석 / 전송은 백그라운드에서 (호출한 스레드는 기다리지 않음)"""
+        if not self._check_connected():
+            return False
+        self.app.transfer.submit(self._send_image_job, path, Q, target)
+        return True
+
+    def _send_image_job(self, path, Q, target=None):
         # 1) 원본 이미지 로드
         original = imread_unicode(path)
         if original is None:
-            messagebox.showerror("Error", "이미지 로드 실패")
+            self._error("Error", "이미지 로드 실패")
             return
 
-        self.app.show_local(original.copy())
+        self.app.show_local(original)
 
-        # 2) JPEG 압축
-        ok, encoded = cv2.imencode(".jpg", original, [cv2.IMWRITE_JPEG_QUALITY, Q])
-        if not ok:
-            messagebox.showerror("Error", "이미지 압축 실패")
+        # 2) JPEG 압축 + 3) PSNR, SSIM 계산 (같은 파일 / 같은 설정은 캐시에서)
+        encoded = self._encode_image(path, original, Q, target)
+        if encoded is None:
+            self._error("Error", "이미지 압축 실패")
             return
-
-        jpeg_bytes = encoded.tobytes()
-        compressed = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
-
-        # 3) PSNR, SSIM 계산
-        try:
-            psnr_val = compute_psnr(original, compressed)
-            ssim_val = compute_ssim_y(original, compressed)
-        except Exception:
-            psnr_val = ssim_val = 0.0
+        jpeg_bytes, psnr_val, ssim_val, Q = encoded
 
         # 4) 파일 크기 비교
         original_size = os.path.getsize(path)
         compressed_size = len(jpeg_bytes)
 
-        # 5) 서버 연결 여부 확인
-        if not self.app.sock:
-            messagebox.showwarning("Not connected", "서버 연결 후 다시 시도하세요.")
-            return
-
-        # 전송률을 위한 변수
-        timestamps = []
-        mbps_log = []
-
-        sent = 0
-        CHUNK = 4096
-        start_time = time.time()
+        # 5) 작은 썸네일을 먼저 (수신측 화면에 바로 표시) → progressive JPEG을 한 번만 전송
+        #    수신측은 스캔이 하나씩 도착할 때마다 화면을 갱신하고, 같은 바이트로 파일을 저장한다
+        thumb = self._thumbnail(original)
+        if thumb:
+            self.app.send_bytes(TYPE_IMAGE, thumb)
 
-        # 6) 헤더 전송
-        meta = {"filename": os.path.basename(path), "filesize": compressed_size}
-        send_packet(self.app.sock, TYPE_FILE_HDR, json.dumps(meta).encode("utf-8"))
-
-        # 7) 실제 파일 전송 (chunk 단위)
-        for i in range(0, compressed_size, CHUNK):
-            chunk = jpeg_bytes[i:i+CHUNK]
-            send_packet(self.app.sock, TYPE_FILE_CHUNK, chunk)
-            sent += len(chunk)
-
-            # Mbps 계산
-            t = time.time() - start_time
-            mbps = (sent * 8 / 1_000_000) / max(t, 0.0001)
-
-            timestamps.append(t)
-            mbps_log.append(mbps)
-
-        # 종료 신호
-        send_packet(self.app.sock, TYPE_FILE_END, b"")
-
-        # 수신측 화면에도 바로 표시
-        send_packet(self.app.sock, TYPE_IMAGE, jpeg_bytes)
+        root, _ = os.path.splitext(os.path.basename(path))
+        meta = {"filename": root + ".jpg", "progressive": True}
+        log = self.app.transfer.send_data(jpeg_bytes, meta)
+        if log is None:
+            return
 
         self.app.system_msg(
-            f"[전송 완료] 이미지(Q={Q}) {compressed_size} bytes\n"
+            f"[전송 완료] 이미지(Q={Q}) {compressed_size} bytes "
+            f"(썸네일 {len(thumb)} bytes + progressive 스캔 {len(find_jpeg_scans(jpeg_bytes))}개)\n"
             f"PSNR={psnr_val:.2f}, SSIM={ssim_val:.4f}"
         )
 
-        fig, axs = plt.subplots(1, 2, figsize=(10, 5))
-
-        # 파일 크기 + PSNR/SSIM
-        axs[0].bar(["Original", "Compressed"], [original_size, compressed_size], color=["blue", "orange"])
-        axs[0].set_title(
+        self.app.report_result(
+            ["Original", "Compressed"], [original_size, compressed_size],
             f"Image Compression (Q={Q})\nPSNR={psnr_val:.2f} dB / SSIM={ssim_val:.4f}",
-            fontsize=12
+            "Transfer Speed (Mbps)", log
         )
-        axs[0].set_ylabel("Bytes")
-        axs[0].grid(axis="y", linestyle="--", alpha=0.5)
-
-        # 전송 속도(Mbps)
-        axs[1].plot(timestamps, mbps_log, marker='o', color="green")
-        axs[1].set_title("Transfer Speed (Mbps)", fontsize=12)
-        axs[1].set_xlabel("Time (seconds)")
-        axs[1].set_ylabel("Mbps")
-        axs[1].grid(True)
 
-        axs[1].set_xlim(left=0)
-        plt.tight_layout()
-        plt.show()
+    @staticmethod
+    def _thumbnail(img):
+        """긴 변 IMAGE_THUMB_SIZE 이하로 줄인 baseline JPEG bytes (실패하면 b"")"""
+        h, w = img.shape[:2]
+        scale = min(1.0, IMAGE_THUMB_SIZE / max(h, w))
+        small = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", small, [cv2.IMWRITE_JPEG_QUALITY, IMAGE_THUMB_QUALITY])
+        return buf.tobytes() if ok else b""
+
+    def _encode_image(self, path, original, Q, target):
+        """
+        target이 None이면 Q로, 아니면 목표 크기(bytes) / 목표 전송 시간(sec)에 맞는 Q(필요하면 축소)로 인코딩.
+        리턴: (jpeg bytes, psnr, ssim, 사용한 Q) / 실패하면 None
+        """
+        cache = get_analysis_cache()
+        if target is None:
+            key = cache.key(path, "jpeg", {"q": Q, "progressive": True})
+        else:
+            mode, value = target
+            if mode == "sec":
+                bps, measured = self.app.transfer.estimated_bandwidth()
+                target_bytes = int(bps * value)
+                goal = f"{value:g}초 × {bps * 8 / 1e6:.1f}Mbps({'측정' if measured else '가정'})"
+            else:
+                target_bytes = value
+                goal = f"{value / 1024:g}KB"
+            key = cache.key(path, "jpeg-fit", {"bytes": target_bytes, "progressive": True})
+
+        hit = cache.get_bytes(key)
+        if hit and hit[1] is not None:
+            metrics, jpeg_bytes = hit
+            Q = metrics.get("q", Q)
+            self.app.system_msg(f"[캐시] 이미지(Q={Q}) 압축 / 분석 결과 재사용")
+            return jpeg_bytes, metrics["psnr"], metrics["ssim"], Q
+
+        if target is None:
+            ok, buf = cv2.imencode(
+                ".jpg", original, [cv2.IMWRITE_JPEG_QUALITY, Q, cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+            )
+            if not ok:
+                return None
+            jpeg_bytes = buf.tobytes()
+            scale = 1.0
+        else:
+            from rate_control import fit_jpeg
+            fit = fit_jpeg(original, target_bytes)
+            if not fit["data"]:
+                return None
+            jpeg_bytes, Q, scale = fit["data"], fit["q"], fit["scale"]
+            self.app.system_msg(
+                f"[목표 크기] {goal} = {target_bytes} bytes → Q={Q}"
+                + (f", {scale:.2f}배 축소" if scale < 1 else "")
+                + f", {fit['size']} bytes"
+                + ("" if fit["fits"] else " (목표보다 큼: 가장 작은 결과)")
+                + f" — 후보 {fit['encodes']}개, {fit['seconds'] * 1000:.0f}ms"
+            )
+
+        # 품질은 원본 크기로 되돌려서 비교 (축소한 경우)
+        compressed = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if scale < 1:
+            compressed = cv2.resize(compressed, (original.shape[1], original.shape[0]),
+                                    interpolation=cv2.INTER_LINEAR)
+        try:
+            psnr_val = compute_psnr(original, compressed)
+            ssim_val = float(compute_ssim_y(original, compressed))
+            cache.put(key, {"psnr": psnr_val, "ssim": ssim_val, "q": Q, "scale": scale},
+                      output_bytes=jpeg_bytes)
+        except Exception:
+            psnr_val = ssim_val = 0.0
+        return jpeg_bytes, psnr_val, ssim_val, Q
 
     # -------------------------------------------------------
     # H.263 비디오 전송
     # -------------------------------------------------------
-    def send_h263_video(self):
-        path = filedialog.askopenfilename(
-            filetypes=[("Video", "*.mp4 *.avi *.mkv *.mov")]
-        )
-        if not path:
-            return
-
-        if not self.app.sock:
-            messagebox.showwarning("Not connected", "서버 연결 후 다시 시도하세요.")
-            return
-
-        import time
-        import matplotlib.pyplot as plt
-
-        # 1) 출력 파일 경로
+    def send_h263_video(self, path):
+        if not self._check_connected():
+            return False
+        self.app.system_msg(f"[H.263 인코딩 + 전송] {os.path.basename(path)}")
+        self.app.transfer.submit(self._send_h263_job, path)
+        return True
+
+    def _send_h263_job(self, path):
+        # 1) 출력 파일 경로 (avi: 분석 / 보관용)
         compressed_path = path + ".h263.avi"
-
-        # 2) ffmpeg 변환
-        ok = encode_h263(path, compressed_path)
-        if not ok:
-            messagebox.showerror("Error", "H.263 인코딩 실패")
+        fps = 30
+
+        # 2) 같은 원본 / 같은 설정으로 인코딩 + 분석한 적이 있으면 캐시의 결과를 그대로 전송
+        cache = get_analysis_cache()
+        key = cache.key(path, "h263", {"fps": fps, "resolution": "704x576", "every": QUALITY_SAMPLE_EVERY})
+        hit = cache.get(key)
+        hit = hit if hit and hit[1] is not None else None
+        workers = os.cpu_count() or 1
+        if workers > 1 and not hit:
+            from transcode import probe
+            info = probe(path)
+        else:
+            info = None
+        if hit:
+            self.app.system_msg(f"[캐시] {os.path.basename(path)}: H.263 인코딩 / 분석 결과 재사용")
+            analysis = dict(hit[0])
+            log = self.app.transfer.send_file(
+                hit[1], {"filename": os.path.basename(compressed_path), "codec": "h263"}
+            )
+        # 3) 긴 비디오 + 여러 코어 → 세그먼트 병렬 인코딩 후 전송 (전체 시간이 짧음)
+        #    그 밖에는 인코딩하면서 전송 (첫 바이트가 바로 나감)
+        elif info and info[0] >= TRANSCODE_PARALLEL_MIN_SEC:
+            log, analysis = self._send_h263_parallel(path, compressed_path, fps, workers, info)
+        else:
+            log, analysis = self._send_h263_stream(path, compressed_path, fps)
+        if log is None:
             return
+        if "error" in analysis:
+            self._error("Error", analysis["error"])
+            return
+        if not hit:
+            cache.put(
+                key, {k: analysis[k] for k in ("size", "psnr", "ssim", "quality")},
+                output_path=compressed_path
+            )
 
-        # 3) 파일 크기 비교
         original_size = os.path.getsize(path)
-        compressed_size = os.path.getsize(compressed_path)
-
-        # 4) PSNR / SSIM 계산 (10프레임 샘플링)
-
-        cap_orig = cv2.VideoCapture(path)
-        cap_cmp = cv2.VideoCapture(compressed_path)
+        compressed_size = analysis["size"]
+        mean_psnr, mean_ssim = analysis["psnr"], analysis["ssim"]
 
-        total_frames = int(cap_orig.get(cv2.CAP_PROP_FRAME_COUNT))
-        sample_indices = np.linspace(0, total_frames - 1, 10).astype(int)
-
-        psnr_list = []
-        ssim_list = []
-
-        for idx in sample_indices:
-            cap_orig.set(cv2.CAP_PROP_POS_FRAMES, idx)
-            cap_cmp.set(cv2.CAP_PROP_POS_FRAMES, idx)
-
-            ret1, f1 = cap_orig.read()
-            ret2, f2 = cap_cmp.read()
-            if not ret1 or not ret2:
-                continue
-
-            psnr_list.append(compute_psnr(f1, f2))
-            ssim_list.append(compute_ssim_y(f1, f2))
+        q = analysis["quality"]
+        self.app.system_msg(
+            f"[H.263 전송 완료] {os.path.basename(compressed_path)}\n"
+            f"원본 {original_size/1024/1024:.2f}MB → 압축 {compressed_size/1024/1024:.2f}MB\n"
+            f"PSNR={mean_psnr:.2f} (최저 {q['min_psnr']:.2f}), SSIM={mean_ssim:.4f} "
+            f"— {len(q['psnr'])}프레임, 분석 {q['seconds']:.1f}s"
+        )
 
-        cap_orig.release()
-        cap_cmp.release()
+        # 4) 그래프 시각화 (프론트엔드)
+        self.app.report_result(
+            ["Original", "H.263"], [original_size, compressed_size],
+            f"Video Compression (H.263)\nPSNR={mean_psnr:.2f} dB / SSIM={mean_ssim:.4f}",
+            "H.263 Transfer Speed (Mbps)", log, q
+        )
 
-        mean_psnr = np.mean(psnr_list) if psnr_list else 0
-        mean_ssim = np.mean(ssim_list) if ssim_list else 0
+    def _send_h263_stream(self, path, compressed_path, fps):
+        """인코딩하면서 전송 (nut 스트림). 리턴: (전송 로그, 분석 결과) — 실패하면 (None, None)"""
+        stream_path = path + ".h263.nut"
+        proc = open_h263_stream(path, fps)
+        if proc is None:
+            self._error("Error", "H.263 인코딩 실패")
+            return None, None
+
+        # 인코딩이 끝나면 전송의 마지막 청크가 나가는 동안 PSNR / SSIM 분석을 시작
+        # (전송은 인코더 속도에 묶여 있어 EOF 직후 끝나므로, 실제로 겹치는 건 마지막 송신 버퍼 정도다.
+        #  analyze_video는 완성된 파일을 시간 구간으로 나눠 프로세스 풀에서 돌리므로 자라는 tee 파일로는
+        #  시작할 수 없다. 전송 내내 겹치는 건 _send_h263_parallel 경로)
+        analysis = {}
+
+        def on_eof():
+            if proc.wait() != 0:
+                print("FFmpeg 인코딩 오류:", stream_error(proc))
+                analysis["error"] = "H.263 인코딩 실패"
+                return False
+            worker = threading.Thread(
+                target=self._analyze_h263, args=(path, stream_path, compressed_path, fps, analysis),
+                daemon=True
+            )
+            worker.start()
+            analysis["thread"] = worker
+            return True
 
-        # -----------------------------------------
-        # 5) 서버에 메타데이터 전송
-        # -----------------------------------------
         meta = {
             "filename": os.path.basename(compressed_path),
-            "filesize": compressed_size,
             "codec": "h263",
-            "psnr": float(mean_psnr),
-            "ssim": float(mean_ssim)
+            "container": "nut",
+            "fps": fps,
         }
-        send_packet(self.app.sock, TYPE_FILE_HDR, json.dumps(meta).encode("utf-8"))
-
-        # -----------------------------------------
-        # 6) 파일 CHUNK 전송 + 전송률 로그 저장
-        # -----------------------------------------
-        CHUNK = 4096
-        sent = 0
-        timestamps = []
-        mbps_log = []
-
-        start_time = time.time()
-
-        with open(compressed_path, "rb") as f:
-            while True:
-                chunk = f.read(CHUNK)
-                if not chunk:
-                    break
-
-                send_packet(self.app.sock, TYPE_FILE_CHUNK, chunk)
-                sent += len(chunk)
-
-                elapsed = time.time() - start_time
-                mbps = (sent * 8 / 1_000_000) / max(elapsed, 0.0001)
-
-                timestamps.append(elapsed)
-                mbps_log.append(mbps)
-
-        send_packet(self.app.sock, TYPE_FILE_END, b"")
-
+        try:
+            log = self.app.transfer.send_stream(proc.stdout, meta, tee_path=stream_path, on_eof=on_eof)
+        finally:
+            if proc.poll() is None:
+                proc.kill()         # 연결이 끊겨 중단된 경우
+            proc.wait()
+            proc.stdout.close()
+            proc.err_file.close()
+
+        if "thread" not in analysis:
+            if "error" in analysis:
+                self._error("Error", analysis["error"])
+            return None, None
+        analysis["thread"].join()
+        return log, analysis
+
+    def _send_h263_parallel(self, path, compressed_path, fps, workers, info):
+        """세그먼트 병렬 인코딩 → 파일 전송 (분석은 전송과 동시에). 리턴은 _send_h263_stream과 같음"""
+        from transcode import transcode_h263
+
+        name = os.path.basename(path)
+
+        def progress(done, total, index, seconds):
+            self.app.system_msg(f"[H.263 병렬 인코딩] {name}: {done}/{total} 세그먼트 (#{index} {seconds:.1f}s)")
+
+        stats = transcode_h263(path, compressed_path, fps, workers=workers, on_progress=progress, info=info)
+        if stats is None:
+            self._error("Error", "H.263 인코딩 실패")
+            return None, None
         self.app.system_msg(
-            f"[H.263 전송 완료] {os.path.basename(compressed_path)}\n"
-            f"원본 {original_size/1024/1024:.2f}MB → 압축 {compressed_size/1024/1024:.2f}MB\n"
-            f"PSNR={mean_psnr:.2f}, SSIM={mean_ssim:.4f}"
+            f"[H.263 병렬 인코딩 완료] {stats['seconds']:.1f}s "
+            f"(세그먼트 {stats['segments']}개, 워커 {stats['workers']}개, {stats['speedup']:.1f}배 병렬)"
         )
 
-        # 7) 그래프 시각화 
+        analysis = {}
+        worker = threading.Thread(
+            target=self._analyze_h263, args=(path, None, compressed_path, fps, analysis), daemon=True
+        )
+        worker.start()
+        log = self.app.transfer.send_file(compressed_path, {"filename": os.path.basename(compressed_path),
+                                                            "codec": "h263"})
+        worker.join()
+        return log, analysis
 
-        fig, axs = plt.subplots(1, 2, figsize=(10, 5))
+    def _analyze_h263(self, path, stream_path, compressed_path, fps, result):
+        """(stream_path가 있으면 AVI로 remux하고) 프레임별 PSNR / SSIM 계산. 결과는 result dict에"""
+        from quality import analyze_video
 
-        # 파일 크기 + PSNR/SSIM
-        axs[0].bar(["Original", "H.263"], [original_size, compressed_size], color=["blue", "orange"])
-        axs[0].set_title(
-            f"Video Compression (H.263)\nPSNR={mean_psnr:.2f} dB / SSIM={mean_ssim:.4f}",
-            fontsize=12
-        )
-        axs[0].set_ylabel("Bytes")
-        axs[0].grid(axis="y", linestyle="--", alpha=0.5)
-
-        # 전송 속도(Mbps)
-        axs[1].plot(timestamps, mbps_log, marker='o', color="green")
-        axs[1].set_title("H.263 Transfer Speed (Mbps)", fontsize=12)
-        axs[1].set_xlabel("Time (seconds)")
-        axs[1].set_ylabel("Mbps")
-        axs[1].grid(True)
-
-        axs[1].set_xlim(left=0)
-        plt.tight_layout()
-        plt.show()
\ No newline at end of file
+        try:
+            if stream_path:
+                if not remux_to_avi(stream_path, compressed_path, fps):
+                    result["error"] = "H.263 AVI 변환 실패"
+                    return
+                os.remove(stream_path)
+            result["size"] = os.path.getsize(compressed_path)
+
+            # 두 비디오를 나란히 순서대로 디코딩 (seek 없음), QUALITY_SAMPLE_EVERY 프레임마다
+            q = analyze_video(path, compressed_path, every=QUALITY_SAMPLE_EVERY,
+                              workers=QUALITY_WORKERS, fps=fps)
+            if q is None:
+                result["error"] = "H.263 품질 분석 실패"
+                return
+            result["psnr"] = q["mean_psnr"]
+            result["ssim"] = q["mean_ssim"]
+            result["quality"] = q
+        except Exception as e:
+            print("H.263 analysis error:", e)
+            result["error"] = f"H.263 품질 분석 실패: {e}"
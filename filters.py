@@ -0,0 +1,196 @@
+# filters.py
+"""
+필터 그래프 모듈
+
+- 필터는 fn(src, dst, scratch) 형태로 register_filter()에 등록
+  (결과를 dst에 쓰고, src와 dst가 같은 배열이어도 동작해야 함)
+- "Blur > Gray" 처럼 여러 단계를 체인으로 연결
+- 중간 버퍼 / 스크래치 버퍼는 FilterChain이 들고 있다가 프레임마다 재사용
+- python filters.py 로 해상도별 ms/frame 벤치마크
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+from utils import FaceDetector
+
+
+FILTERS = {}
+
+
+def register_filter(name):
+    """
+    새 필터 등록용 데코레이터.
+
+        @register_filter("Sepia")
+        def sepia(src, dst, scratch):
+            cv2.transform(src, SEPIA_MATRIX, dst=dst)
+    """
+    def deco(fn):
+        FILTERS[name] = fn
+        return fn
+    return deco
+
+
+class Scratch:
+    """스테이지별 재사용 버퍼 (모양이 바뀔 때만 새로 할당)."""
+
+    def __init__(self):
+        self.bufs = {}
+        self.state = {}    # 버퍼가 아닌 스테이지 상태 (예: 얼굴 검출기)
+
+    def get(self, name, shape, dtype=np.uint8):
+        buf = self.bufs.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self.bufs[name] = buf
+        return buf
+
+
+# -----------------------
+# 기본 필터
+# -----------------------
+@register_filter("Gray")
+def _gray(src, dst, scratch):
+    g = scratch.get("gray", src.shape[:2])
+    cv2.cvtColor(src, cv2.COLOR_BGR2GRAY, dst=g)
+    cv2.cvtColor(g, cv2.COLOR_GRAY2BGR, dst=dst)
+
+
+@register_filter("Canny(Edge)")
+def _canny(src, dst, scratch):
+    e = scratch.get("edges", src.shape[:2])
+    cv2.Canny(src, 50, 150, edges=e)
+    cv2.cvtColor(e, cv2.COLOR_GRAY2BGR, dst=dst)
+
+
+@register_filter("Inverse")
+def _inverse(src, dst, scratch):
+    cv2.bitwise_not(src, dst=dst)
+
+
+@register_filter("Blur")
+def _blur(src, dst, scratch):
+    cv2.GaussianBlur(src, (15, 15), 0, dst=dst)
+
+
+@register_filter("Face Detect")
+def _face_detect(src, dst, scratch):
+    det = scratch.state.get("face")
+    if det is None:
+        det = scratch.state["face"] = FaceDetector()
+    if dst is not src:
+        np.copyto(dst, src)
+    det.process(dst)
+
+
+# -----------------------
+# 체인
+# -----------------------
+def parse_chain(spec: str):
+    spec = (spec or "").replace("→", ">")
+    names = [s.strip() for s in spec.split(">")]
+    return [n for n in names if n and n != "None"]
+
+
+class FilterChain:
+    """
+    필터 여러 개를 순서대로 적용.
+    중간 결과는 두 개의 ping-pong 버퍼를 번갈아 쓰고,
+    마지막 단계는 out(기본: 입력 프레임 자체)에 바로 쓴다.
+    """
+
+    def __init__(self, spec):
+        names = parse_chain(spec) if isinstance(spec, str) else list(spec)
+        unknown = [n for n in names if n not in FILTERS]
+        if unknown:
+            raise ValueError(f"unknown filter: {', '.join(unknown)}")
+        self.names = names
+        self.stages = [(FILTERS[n], Scratch()) for n in names]
+        self.ping = Scratch()
+        self.last_ms = [0.0] * len(names)
+
+    def apply(self, frame, out=None):
+        if out is None:
+            out = frame
+        if not self.stages:
+            if out is not frame:
+                np.copyto(out, frame)
+            return out
+
+        src = frame
+        n = len(self.stages)
+        for i, (fn, scratch) in enumerate(self.stages):
+            if i == n - 1:
+                dst = out
+            else:
+                dst = self.ping.get("ab"[i % 2], frame.shape, frame.dtype)
+            t0 = time.perf_counter()
+            fn(src, dst, scratch)
+            self.last_ms[i] = (time.perf_counter() - t0) * 1000
+            src = dst
+        return out
+
+
+_chains = {}
+
+
+def get_chain(spec: str) -> FilterChain:
+    chain = _chains.get(spec)
+    if chain is None:
+        chain = _chains[spec] = FilterChain(spec)
+    return chain
+
+
+def apply_chain(frame, spec: str):
+    """프레임에 필터 체인을 in-place로 적용하고 그 프레임을 리턴."""
+    return get_chain(spec).apply(frame)
+
+
+def face_stats(spec: str):
+    """spec 체인에 있는 얼굴 검출기의 FaceDetector.stats() (없거나 아직 안 돌았으면 None)"""
+    chain = _chains.get(spec)
+    if chain is None:
+        return None
+    for _, scratch in chain.stages:
+        det = scratch.state.get("face")
+        if det is not None:
+            return det.stats()
+    return None
+
+
+# -----------------------
+# 벤치마크
+# -----------------------
+BENCH_SIZES = [("480p", 854, 480), ("720p", 1280, 720), ("1080p", 1920, 1080)]
+
+
+def benchmark(specs=None, iters=50, warmup=5):
+    """필터(체인)별 ms/frame 측정 결과를 {spec: {size: ms}} 로 리턴."""
+    if specs is None:
+        specs = list(FILTERS) + ["Blur > Gray"]
+    rng = np.random.default_rng(0)
+    results = {}
+    for label, w, h in BENCH_SIZES:
+        frame = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        for spec in specs:
+            chain = FilterChain(spec)
+            out = np.empty_like(frame)
+            for _ in range(warmup):
+                chain.apply(frame, out)
+            t0 = time.perf_counter()
+            for _ in range(iters):
+                chain.apply(frame, out)
+            ms = (time.perf_counter() - t0) * 1000 / iters
+            results.setdefault(spec, {})[label] = ms
+    return results
+
+
+if __name__ == "__main__":
+    res = benchmark()
+    labels = [b[0] for b in BENCH_SIZES]
+    print(f"{'filter':<20}" + "".join(f"{l:>10}" for l in labels) + "   (ms/frame)")
+    for spec, row in res.items():
+        print(f"{spec:<20}" + "".join(f"{row[l]:>10.2f}" for l in labels))
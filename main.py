@@ -1,80 +1,78 @@
 # main.py
-import socket
-import threading
+"""
+Tk 프론트엔드: ClientEngine(engine.py) 위에 창(AppUI)을 올린다.
+엔진 콜백은 수신 / 작업 스레드에서 오므로 전부 root.after로 Tk 스레드에 넘기고,
+파일 선택 / 경고 대화 상자는 여기서만 띄운다.
+"""
 import sys
 import json
-import numpy as np
-import shutil
 
 from ui import AppUI
-from network import send_packet, recv_packet
-from video_stream import VideoStream
-from video_decoder import decode_h263_bytes_to_bgr
-from audio_player import AudioPlayer
-from file_transfer import FileTransfer
-from chat import ChatManager
+from engine import ClientEngine
 
 from config import (
-    SERVER_PORT,
-    TYPE_VIDEO, TYPE_TEXT, TYPE_IMAGE,
-    TYPE_FILE_HDR, TYPE_FILE_CHUNK, TYPE_FILE_END,
-    TYPE_AUDIO
+    AV_STATUS_INTERVAL, STARTUP_BUDGET_SEC, STARTUP_BENCH_RUNS, STARTUP_LAZY_MODULES
 )
-from config import ffmpeg_available
-
-
-# ffmpeg 확인용 콘솔 출력
-if shutil.which("ffmpeg") is None:
-    print("⚠ ffmpeg not found in PATH")
-else:
-    print("ffmpeg OK:", shutil.which("ffmpeg"))
+from config import ffmpeg_path
 
 
 class App:
     def __init__(self):
-        # 상태
-        self.sock = None
-        self.running = False
-        self.recv_thread = None
+        # ffmpeg 확인용 콘솔 출력
+        if ffmpeg_path() is None:
+            print("⚠ ffmpeg not found (./ffmpeg/ffmpeg or PATH)")
+        else:
+            print("ffmpeg OK:", ffmpeg_path())
 
-        # 품질 / 필터
-        self.compression_quality = 50
-        self.filter_mode = "None"
-        self.use_h263 = ffmpeg_available()
+        self.engine = ClientEngine()
 
         # UI
         self.ui = AppUI(self)
-
-        # 서브 모듈
-        self.video = VideoStream(self)
-        self.audio_player = AudioPlayer()
-        self.file_transfer = FileTransfer(self)
-        self.chat = ChatManager(self)
-
-        if not self.use_h263:
-            self.chat.append_system("ffmpeg not found — falling back to MJPEG (JPEG) transport.")
+        self._connect_engine()
+        self.ui.root.after(int(AV_STATUS_INTERVAL * 1000), self._update_av_status)
+
+    def _connect_engine(self):
+        """엔진 콜백 → Tk 스레드"""
+        e, ui = self.engine, self.ui
+        e.on_local_frame = lambda frame: self._tk(ui.show_local_bgr, frame.copy())
+        e.on_local_clear = lambda: self._tk(ui.clear_local)
+        e.on_remote_frame = lambda frame: self._tk(ui.show_remote_bgr, frame)
+        e.on_remote_jpeg = lambda data: self._tk(ui.show_remote_jpeg, data)
+        e.on_chat = lambda line: self._tk(ui.append_chat, line)
+        e.on_error = lambda title, msg: self._tk(self.show_error, title, msg)
+        e.on_transfer_progress = self.update_transfer_status
+        e.on_result = lambda *args: self._tk(ui.plot_result, *args)
+
+        if not e.use_h263:
+            self.system_msg("ffmpeg not found — falling back to MJPEG (JPEG) transport.")
 
     # -----------------------
     # UI 헬퍼
     # -----------------------
-    def show_local(self, frame):
-        self.ui.root.after(0, self.ui.show_local_bgr, frame.copy())
-
-    def clear_local(self):
-        self.ui.root.after(0, self.ui.clear_local)
+    def _tk(self, fn, *args):
+        self.ui.root.after(0, fn, *args)
 
-    def show_remote_from_bgr(self, frame_bgr):
-        import cv2
-        rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-        ok, jpg = cv2.imencode(".jpg", rgb)
-        if ok:
-            self.ui.root.after(0, self.ui.show_remote_jpeg, jpg.tobytes())
+    @property
+    def video(self):
+        return self.engine.video
 
-    def show_remote_jpeg(self, jpeg_bytes: bytes):
-        self.ui.root.after(0, self.ui.show_remote_jpeg, jpeg_bytes)
+    @property
+    def compression_quality(self):
+        return self.engine.compression_quality
 
     def system_msg(self, text: str):
-        self.chat.append_system(text)
+        self.engine.system_msg(text)
+
+    def _update_av_status(self):
+        """수신 A/V 오프셋(립싱크가 동작 중일 때)과 얼굴 검출 처리 시간을 주기적으로 상태바에 표시"""
+        try:
+            parts = [self.engine.av_status(), self.engine.filter_status()]
+            text = "  |  ".join(p for p in parts if p)
+            if text:
+                self.ui.status_bar.config(text=text)
+        except Exception as e:
+            print("av status error:", e)
+        self.ui.root.after(int(AV_STATUS_INTERVAL * 1000), self._update_av_status)
 
     def show_error(self, title, msg):
         from tkinter import messagebox
@@ -86,7 +84,7 @@ class App:
                 text=f"[{pct:.1f}%]  {sent_bytes/1024/1024:.2f} MB / "
                     f"{total_bytes/1024/1024:.2f} MB  ({speed_mbps:.2f} MB/s)"
             )
-        self.ui.root.after(0, _update)
+        self._tk(_update)
 
     # -----------------------
     # Network
@@ -97,91 +95,23 @@ class App:
             from tkinter import messagebox
             messagebox.showwarning("Input", "서버 IP를 입력하세요.")
             return
-        try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.settimeout(5)
-            self.sock.connect((ip, SERVER_PORT))
-            self.sock.settimeout(None)
-            self.system_msg(f"Connected to {ip}:{SERVER_PORT}")
-            self.running = True
-            self.recv_thread = threading.Thread(target=self.recv_loop, daemon=True)
-            self.recv_thread.start()
-        except Exception as e:
-            from tkinter import messagebox
-            messagebox.showerror("Connect failed", str(e))
-            self.sock = None
+        self.engine.connect(ip)
 
     def disconnect_server(self):
-        self.system_msg("Disconnecting...")
-        self.running = False
-        if self.sock:
-            try:
-                self.sock.close()
-            except:
-                pass
-            self.sock = None
-
-    def send_bytes(self, ttype, payload: bytes):
-        if not self.sock:
-            return False
-        return send_packet(self.sock, ttype, payload)
-
-    def recv_loop(self):
-        try:
-            while self.running and self.sock:
-                ttype, payload = recv_packet(self.sock)
-                if not ttype:
-                    break
-
-                if ttype == TYPE_VIDEO:
-                    # 스트리밍 비디오 수신
-                    self.show_remote_jpeg(payload)
-
-                elif ttype == TYPE_TEXT:
-                    text = payload.decode("utf-8", errors="replace")
-                    self.chat.handle_incoming(text)
-
-                elif ttype == TYPE_IMAGE:
-                    # 이미지 파일 수신 표시
-                    self.show_remote_jpeg(payload)
-
-                elif ttype == TYPE_FILE_HDR:
-                    self.file_transfer.handle_file_header(payload)
-
-                elif ttype == TYPE_FILE_CHUNK:
-                    self.file_transfer.handle_file_chunk(payload)
-
-                elif ttype == TYPE_FILE_END:
-                    self.file_transfer.handle_file_end()
-
-                elif ttype == TYPE_AUDIO:
-                    self.audio_player.play(payload)
-
-        except Exception as e:
-            print("Receive loop error:", e)
-        finally:
-            print("Receiver exiting")
-            if self.sock:
-                try:
-                    self.sock.close()
-                except:
-                    pass
-                self.sock = None
-            self.running = False
-            self.system_msg("Disconnected from server")
+        self.engine.disconnect()
 
     # Camera / Audio / File / Chat / UI 콜백
     def start_camera(self):
-        self.video.start_camera()
+        self.engine.start_camera()
 
     def stop_camera(self):
-        self.video.stop_camera()
-    
+        self.engine.stop_camera()
+
     def start_audio(self):
-        self.video.audio.start()
+        self.engine.start_audio()
 
     def stop_audio(self):
-        self.video.audio.stop()
+        self.engine.stop_audio()
 
 
     def load_file(self):
@@ -189,6 +119,7 @@ class App:
         load_file → 로컬 표시 + 원격 표시
         Image → 즉시 화면 표시
         Video → broadcast(로컬 재생 + 원격 스트리밍)
+        Audio Visualizer → 오디오 스펙트로그램을 카메라처럼 송출
         """
         mode = self.ui.combo_mode.get()
         from tkinter import filedialog, messagebox
@@ -215,17 +146,8 @@ class App:
                 messagebox.showerror("Error", "이미지 디코딩 실패")
                 return
 
-            # --- LOCAL 표시 ---
-            self.show_local(img)
-
-            # --- REMOTE 전송 ---
-            if self.sock:
-                ok, jpg = cv2.imencode(
-                    ".jpg", img,
-                    [cv2.IMWRITE_JPEG_QUALITY, self.compression_quality]
-                )
-                if ok:
-                    self.send_bytes(TYPE_IMAGE, jpg.tobytes())
+            # LOCAL 표시 + REMOTE 전송
+            self.engine.send_still_image(img)
 
             self.system_msg(f"이미지 로드 완료: {os.path.basename(path)}")
             return
@@ -238,7 +160,12 @@ class App:
             if not path:
                 return
 
-            self.video.play_video_file_broadcast(path)
+            self.engine.play_video_file(path)
+            return
+
+        # AUDIO VISUALIZER → 스펙트로그램을 영상 소스로 송출
+        elif mode == "Audio Visualizer":
+            self.engine.start_visualizer()
             return
 
         else:
@@ -246,15 +173,36 @@ class App:
             return
 
     def compress_and_send_with_quality(self):
-        self.file_transfer.compress_and_send_with_quality()
+        from tkinter import filedialog, messagebox
+
+        path = filedialog.askopenfilename(
+            filetypes=[("Image", "*.jpg *.jpeg *.png *.bmp *.webp")]
+        )
+        if not path:
+            return
+        if not self.engine.sock:
+            messagebox.showwarning("Not connected", "서버 연결 후 다시 시도하세요.")
+            return
+        self.engine.send_image(path, target=self.image_rate_target())
 
     def compress_and_send_h263_video(self):
-        self.file_transfer.send_h263_video()
+        from tkinter import filedialog, messagebox
+
+        path = filedialog.askopenfilename(
+            filetypes=[("Video", "*.mp4 *.avi *.mkv *.mov")]
+        )
+        if not path:
+            return
+        if not self.engine.sock:
+            messagebox.showwarning("Not connected", "서버 연결 후 다시 시도하세요.")
+            return
+        self.engine.send_h263_video(path)
 
     # Chat
     def send_chat(self):
         text = self.ui.chat_entry.get().strip()
-        self.chat.send(text)
+        self.ui.chat_entry.delete(0, 'end')
+        self.engine.send_chat(text)
 
     def on_enter_pressed(self, event):
         self.send_chat()
@@ -265,44 +213,46 @@ class App:
         try:
             val = int(self.ui.progress_var.get())
             val = max(10, min(val, 95))
-            self.compression_quality = val
+            self.engine.compression_quality = val
             self.ui.scale_quality.set(val)
             self.ui.status_bar.config(text=f"Quality set to {val}")
         except Exception as e:
             print("progress update error:", e)
 
+    def image_rate_target(self):
+        """이미지 전송 크기 모드 → None(슬라이더 Q) / ("bytes", n) / ("sec", 초)"""
+        mode = self.ui.combo_rate.get()
+        if mode == "Fixed Q":
+            return None
+        try:
+            value = float(self.ui.rate_target_var.get())
+        except ValueError:
+            value = 0
+        if value <= 0:
+            self.ui.status_bar.config(text=f"{mode}: 잘못된 값 → Quality {self.compression_quality} 사용")
+            return None
+        if mode == "Target KB":
+            return "bytes", int(value * 1024)
+        return "sec", value
+
     def update_quality(self, val):
         try:
-            self.compression_quality = int(val)
+            self.engine.compression_quality = int(val)
             self.ui.status_bar.config(text=f"Quality set to {self.compression_quality}")
         except:
             pass
 
     def change_filter(self, event):
-        self.filter_mode = self.ui.combo_filter.get()
+        self.engine.filter_mode = self.ui.combo_filter.get()
+
+    def change_stream_codec(self, event):
+        codec = self.engine.set_stream_codec(self.ui.combo_codec.get())
+        self.ui.combo_codec.set(codec)
+        self.ui.status_bar.config(text=f"Live stream codec: {codec}")
 
     def close(self):
         self.system_msg("Closing application...")
-        self.running = False
-        try:
-            if self.video.capture_thread and self.video.capture_thread.is_alive():
-                self.video.capture_thread.join(timeout=0.5)
-        except:
-            pass
-        try:
-            if self.recv_thread and self.recv_thread.is_alive():
-                self.recv_thread.join(timeout=0.5)
-        except:
-            pass
-        try:
-            self.video.stop_camera()
-        except:
-            pass
-        try:
-            if self.sock:
-                self.sock.close()
-        except:
-            pass
+        self.engine.close()
         try:
             self.ui.root.destroy()
         except:
@@ -310,6 +260,86 @@ class App:
         sys.exit(0)
 
 
+# -----------------------
+# 시작 시간 측정 (python main.py bench [--import-only])
+# -----------------------
+_STARTUP_CHILD = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import main
+result = {"import": time.perf_counter() - t0, "window": None}
+if sys.argv[1:2] != ["--import-only"]:
+    try:
+        app = main.App()
+        app.ui.root.update()             # 첫 창이 실제로 그려질 때까지
+        result["window"] = time.perf_counter() - t0
+    except Exception as e:               # 디스플레이 없음 등
+        result["error"] = str(e)
+result["loaded"] = [m for m in main.STARTUP_LAZY_MODULES if m in sys.modules]
+print(json.dumps(result), flush=True)
+'''
+
+
+def _bench_startup(import_only=False):
+    """
+    새 인터프리터로 STARTUP_BENCH_RUNS번: 프로세스 시작 → 첫 창까지 시간
+    (import_only면 import main까지만) + -X importtime으로 가장 오래 걸린 import.
+    리턴 (종료 코드): 0 OK / 1 중간값이 STARTUP_BUDGET_SEC를 넘거나 STARTUP_LAZY_MODULES가 올라와 있음 /
+    2 창을 못 띄움 (디스플레이 없음 → 창 회귀는 잴 수 없으므로 통과로 치지 않는다. CI는 --import-only)
+    """
+    import os
+    import subprocess
+    import time
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    child = [sys.executable, "-c", _STARTUP_CHILD] + (["--import-only"] if import_only else [])
+    times, loaded, windowed = [], set(), not import_only
+    for i in range(STARTUP_BENCH_RUNS):
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(child, cwd=here, stdout=subprocess.PIPE, text=True)
+        line = ""
+        for line in proc.stdout:
+            if line.startswith("{"):
+                break
+        wall = time.perf_counter() - t0         # 결과 줄이 나온 시각 (종료 정리는 빼고)
+        proc.wait()
+        try:
+            r = json.loads(line)
+        except ValueError:
+            print("startup bench: 자식 프로세스 실패")
+            return 1
+        if not import_only and r["window"] is None:
+            print(f"startup bench: 창을 띄우지 못함 ({r.get('error')}) → SKIP "
+                  "(화면 없이 import만 재려면 python main.py bench --import-only)")
+            return 2
+        loaded.update(r["loaded"])
+        times.append(wall)
+        print(f"run {i + 1}: {wall:.3f}s (import main {r['import']:.3f}s"
+              + (f", 창 {r['window']:.3f}s" if r["window"] is not None else "")
+              + ")")
+
+    # 가장 오래 걸린 import (자기 시간 기준)
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=here,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True).stderr
+    rows = []
+    for row in err.splitlines():
+        parts = row.split("|")
+        if row.startswith("import time:") and len(parts) == 3 and parts[0].split(":")[1].strip().isdigit():
+            rows.append((int(parts[0].split(":")[1]), int(parts[1]), parts[2].strip()))
+    print("slowest imports (self / cumulative ms):")
+    for self_us, cum_us, name in sorted(rows, reverse=True)[:10]:
+        print(f"  {self_us / 1000:7.1f} / {cum_us / 1000:7.1f}  {name}")
+
+    median = sorted(times)[len(times) // 2]
+    ok = median <= STARTUP_BUDGET_SEC and not loaded
+    print(f"{'첫 창' if windowed else 'import'} 중간값 {median:.3f}s / 예산 {STARTUP_BUDGET_SEC:.1f}s"
+          + (f", 미리 올라온 모듈: {', '.join(sorted(loaded))}" if loaded else "")
+          + (" → OK" if ok else " → FAIL"))
+    return 0 if ok else 1
+
+
 if __name__ == '__main__':
+    if sys.argv[1:2] == ["bench"]:
+        sys.exit(_bench_startup(import_only="--import-only" in sys.argv[2:]))
     app = App()
     app.ui.root.mainloop()
@@ -1,9 +1,19 @@
 # network.py
 import socket
+import threading
+import time
+from collections import deque
 from struct import pack, unpack
 from typing import Tuple, Optional
 
-from config import HEADER_FMT, HEADER_SIZE
+from config import (
+    HEADER_FMT, HEADER_SIZE,
+    PACKET_PRIORITY, PACKET_PRIORITY_DEFAULT, DROPPABLE_QUEUE_MAX
+)
+
+# 오디오 / 비디오 / 파일 전송 스레드가 같은 소켓에 쓰므로
+# 패킷(헤더 + payload) 하나가 통째로 나가도록 직렬화한다
+_send_lock = threading.Lock()
 
 def safe_send_all(sock: socket.socket, data: bytes) -> bool:
     try:
@@ -13,24 +23,34 @@ def safe_send_all(sock: socket.socket, data: bytes) -> bool:
         print("Send failed:", e)
         return False
 
-def send_packet(sock: socket.socket, ttype: bytes, payload: bytes) -> bool:
+def send_packet(sock: socket.socket, ttype: bytes, payload) -> bool:
+    """payload는 bytes류 하나 또는 여러 조각의 tuple/list (이어 붙이지 않고 순서대로 보냄)"""
     if not sock:
         return False
-    header = pack(HEADER_FMT, ttype, len(payload))
-    return safe_send_all(sock, header + payload)
+    parts = payload if isinstance(payload, (tuple, list)) else (payload,)
+    size = sum(len(p) for p in parts)
+    header = pack(HEADER_FMT, ttype, size)
+    with _send_lock:
+        if size < 65536:
+            return safe_send_all(sock, header + b"".join(parts))
+        # 큰 payload(파일 청크)는 이어 붙이지 않고 그대로 보낸다 (memoryview 가능)
+        return all(safe_send_all(sock, p) for p in (header,) + tuple(parts))
 
 def recv_all(sock: socket.socket, n: int) -> Optional[bytes]:
-    data = b''
-    while len(data) < n:
+    # 미리 할당한 버퍼에 바로 받는다 (큰 청크에서 bytes 이어 붙이기는 O(n^2))
+    data = bytearray(n)
+    view = memoryview(data)
+    got = 0
+    while got < n:
         try:
-            packet = sock.recv(n - len(data))
+            k = sock.recv_into(view[got:], n - got)
         except Exception as e:
             print("recv error:", e)
             return None
-        if not packet:
+        if not k:
             return None
-        data += packet
-    return data
+        got += k
+    return bytes(data)
 
 def recv_packet(sock: socket.socket) -> Tuple[Optional[bytes], Optional[bytes]]:
     """
@@ -45,3 +65,120 @@ def recv_packet(sock: socket.socket) -> Tuple[Optional[bytes], Optional[bytes]]:
     if payload is None:
         return None, None
     return ttype, payload
+
+
+class PacketScheduler:
+    """
+    소켓 하나에 대한 송신 스케줄러 (송신 스레드 하나).
+
+    - send(): 패킷을 타입별 우선순위 큐에 넣고 바로 리턴 (PACKET_PRIORITY, 숫자가 작을수록 먼저)
+      오디오 > 제어 / 채팅 > 비디오 순으로 나가므로 큰 파일이 실시간 미디어를 막지 않는다
+    - 큐가 모두 비었을 때만 bulk source(파일 전송)에서 패킷을 하나씩 꺼낸다.
+      source끼리는 priority가 가장 작은 것들 사이에서 round-robin (공정 분배)
+    - MJPEG 프레임처럼 버려도 되는 타입은 DROPPABLE_QUEUE_MAX개까지만 쌓고 오래된 것부터 버린다
+
+    bulk source 인터페이스:
+        priority                        # 작을수록 먼저
+        ready() -> bool                 # 지금 보낼 패킷이 있는지 (False면 건너뜀, 준비되면 wake())
+        next_packet() -> (ttype, payload) 또는 None(끝)
+        on_sent(nbytes, seconds)        # 보낸 뒤 호출 (청크 크기 조절 / 진행률)
+        abort()                         # 연결 종료 시
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        levels = max(PACKET_PRIORITY.values()) + 1
+        self.queues = [deque() for _ in range(levels)]
+        self.sources = deque()
+        self.cond = threading.Condition()
+        self.running = True
+        self.stats = {"sent": 0, "dropped": 0, "bulk": 0}
+
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def send(self, ttype: bytes, payload) -> bool:
+        prio = PACKET_PRIORITY.get(ttype, PACKET_PRIORITY_DEFAULT)
+        with self.cond:
+            if not self.running:
+                return False
+            q = self.queues[prio]
+            if ttype in DROPPABLE_QUEUE_MAX:
+                limit = DROPPABLE_QUEUE_MAX[ttype]
+                same = [item for item in q if item[0] == ttype]
+                if len(same) >= limit:
+                    q.remove(same[0])
+                    self.stats["dropped"] += 1
+            q.append((ttype, payload))
+            self.cond.notify()
+        return True
+
+    def add_source(self, source) -> bool:
+        with self.cond:
+            if not self.running:
+                return False
+            self.sources.append(source)
+            self.cond.notify()
+        return True
+
+    def wake(self):
+        """bulk source가 보낼 데이터가 새로 생겼을 때"""
+        with self.cond:
+            self.cond.notify()
+
+    def _pick(self):
+        """다음에 보낼 것: ("pkt", (ttype, payload)) / ("src", source) / None(종료)"""
+        with self.cond:
+            while self.running:
+                for q in self.queues:
+                    if q:
+                        return "pkt", q.popleft()
+                ready = [s for s in self.sources if s.ready()]
+                if ready:
+                    best = min(s.priority for s in ready)
+                    while not (self.sources[0].priority == best and self.sources[0] in ready):
+                        self.sources.rotate(-1)
+                    src = self.sources[0]
+                    self.sources.rotate(-1)
+                    return "src", src
+                self.cond.wait()
+            return None
+
+    def _loop(self):
+        while True:
+            item = self._pick()
+            if item is None:
+                break
+            kind, obj = item
+            if kind == "pkt":
+                ok = send_packet(self.sock, *obj)
+            else:
+                pkt = obj.next_packet()
+                if pkt is None:
+                    with self.cond:
+                        if obj in self.sources:
+                            self.sources.remove(obj)
+                    continue
+                t0 = time.monotonic()
+                ok = send_packet(self.sock, *pkt)
+                if ok:
+                    payload = pkt[1]
+                    n = sum(len(p) for p in payload) if isinstance(payload, (tuple, list)) else len(payload)
+                    obj.on_sent(n, time.monotonic() - t0)
+                    self.stats["bulk"] += 1
+            if not ok:
+                break
+            self.stats["sent"] += 1
+        self.stop()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            sources = list(self.sources)
+            self.sources.clear()
+            for q in self.queues:
+                q.clear()
+            self.cond.notify_all()
+        for src in sources:
+            src.abort()
+
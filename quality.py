@@ -0,0 +1,176 @@
+# quality.py
+"""
+비디오 품질 분석 (프레임별 PSNR / SSIM)
+
+- 원본 / 압축 비디오를 처음부터 나란히 순서대로 디코딩해서 같은 순번의 프레임끼리 비교 (seek 없음)
+  두 쪽 모두 ffmpeg에서 같은 fps(압축 쪽 기준)와 같은 해상도(원본 기준)로 맞춰 rawvideo로 받는다
+  → fps / 해상도가 달라도 같은 시각의 프레임끼리 1:1
+- every: N프레임마다 하나 (1이면 전부). 고르는 것도 ffmpeg(select 필터)이 해서
+  건너뛰는 프레임은 파이프로 넘어오지 않는다
+- workers > 1이면 시간 구간으로 나눠 프로세스 풀에서 (구간마다 ffmpeg -ss 정확한 탐색)
+  구간 경계는 every의 배수 프레임이라 샘플 위치가 workers와 상관없이 같다
+- 결과: {"index": [...], "psnr": [...], "ssim": [...], "mean_psnr", "mean_ssim", "min_psnr", "seconds"}
+  (똑같은 프레임의 PSNR은 inf → 평균 / 최솟값에서는 빼고 계산)
+
+단독 실행: python quality.py 원본 압축본 [every] [workers]
+"""
+
+import math
+import multiprocessing
+import os
+import re
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from config import ffmpeg_path
+from extra import compute_psnr, compute_ssim_y
+
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+_VIDEO_RE = re.compile(r"Stream #\d+:\d+.*?: Video: .*?(\d{2,5})x(\d{2,5})")
+_FPS_RE = re.compile(r"(\d+(?:\.\d+)?) fps")
+
+
+def video_info(path):
+    """(width, height, fps, duration) — ffmpeg -i 출력에서 읽는다. 실패하면 None"""
+    try:
+        completed = subprocess.run(
+            [ffmpeg_path() or "ffmpeg", "-hide_banner", "-i", path],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors="replace"
+        )
+    except FileNotFoundError:
+        print("⚠ ffmpeg 실행 파일을 찾을 수 없습니다. ./ffmpeg 폴더 또는 PATH 확인 필요.")
+        return None
+    err = completed.stderr
+    d, v = _DURATION_RE.search(err), None
+    for line in err.splitlines():
+        v = _VIDEO_RE.search(line)
+        if v:
+            f = _FPS_RE.search(line)
+            break
+    if not d or not v:
+        print("video info error:", path)
+        return None
+    h, m, s = d.groups()
+    fps = float(f.group(1)) if f else 30.0
+    return int(v.group(1)), int(v.group(2)), fps, int(h) * 3600 + int(m) * 60 + float(s)
+
+
+def _open_reader(path, start, count, fps, size, every):
+    """start초부터 (fps, size로 맞춘) 프레임 중 every마다 하나를 count개까지 BGR로 내보내는 ffmpeg"""
+    w, h = size
+    cmd = [ffmpeg_path() or "ffmpeg", "-loglevel", "error", "-nostdin"]
+    if start > 0:
+        cmd += ["-ss", f"{start:.6f}"]
+    cmd += [
+        "-i", path, "-an",
+        "-vf", f"fps={fps}:start_time=0,scale={w}:{h},select=not(mod(n\\,{every}))",
+        "-vsync", "0",
+    ]
+    if count is not None:
+        cmd += ["-frames:v", str(count)]
+    cmd += ["-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"]
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=w * h * 3)
+
+
+def _analyze_range(ref_path, cmp_path, start_frame, frames, fps, size, every):
+    """
+    한 구간(start_frame부터 frames개, None이면 끝까지)을 lockstep으로 디코딩해서
+    [(프레임 번호, psnr, ssim), ...] 리턴 (프로세스 풀 워커)
+    """
+    count = None if frames is None else -(-frames // every)
+    start = start_frame / fps
+    readers = [_open_reader(p, start, count, fps, size, every) for p in (ref_path, cmp_path)]
+    frame_bytes = size[0] * size[1] * 3
+    shape = (size[1], size[0], 3)
+    out = []
+    try:
+        index = start_frame
+        while True:
+            a = readers[0].stdout.read(frame_bytes)
+            b = readers[1].stdout.read(frame_bytes)
+            if len(a) < frame_bytes or len(b) < frame_bytes:
+                break
+            f1 = np.frombuffer(a, np.uint8).reshape(shape)
+            f2 = np.frombuffer(b, np.uint8).reshape(shape)
+            out.append((index, float(compute_psnr(f1, f2)), float(compute_ssim_y(f1, f2))))
+            index += every
+    finally:
+        for r in readers:
+            r.kill()
+            r.wait()
+            r.stdout.close()
+    return out
+
+
+def analyze_video(ref_path, cmp_path, every=1, workers=1, fps=None, on_progress=None):
+    """
+    원본(ref) 대비 압축본(cmp)의 프레임별 PSNR / SSIM.
+    fps: 비교 기준 fps (None이면 압축본 fps). on_progress(done, total): 구간이 끝날 때마다
+    """
+    t0 = time.perf_counter()
+    ref, cmp = video_info(ref_path), video_info(cmp_path)
+    if ref is None or cmp is None:
+        return None
+    every = max(1, int(every))
+    fps = fps or cmp[2]
+    size = (ref[0], ref[1])
+    total = int(min(ref[3], cmp[3]) * fps)
+
+    # 구간 나누기 (경계는 every의 배수 프레임)
+    workers = max(1, min(int(workers), max(1, total // (every * 2))))
+    step = -(-max(total, 1) // workers)
+    step = -(-step // every) * every
+    ranges = [(s, step) for s in range(0, total, step)] or [(0, None)]
+    ranges[-1] = (ranges[-1][0], None)
+
+    rows = []
+    if len(ranges) == 1:
+        rows = _analyze_range(ref_path, cmp_path, 0, None, fps, size, every)
+        if on_progress:
+            on_progress(1, 1)
+    else:
+        # spawn: 작업 스레드 / Tk가 떠 있는 프로세스를 fork하지 않는다
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=len(ranges), mp_context=ctx) as pool:
+            futures = [
+                pool.submit(_analyze_range, ref_path, cmp_path, s, n, fps, size, every)
+                for s, n in ranges
+            ]
+            for done, fut in enumerate(as_completed(futures), 1):
+                rows.extend(fut.result())
+                if on_progress:
+                    on_progress(done, len(futures))
+    rows.sort()
+
+    psnr = [p for _, p, _ in rows]
+    ssim = [s for _, _, s in rows]
+    finite = [p for p in psnr if math.isfinite(p)]
+    return {
+        "index": [i for i, _, _ in rows],
+        "psnr": psnr,
+        "ssim": ssim,
+        "mean_psnr": float(np.mean(finite)) if finite else (float("inf") if psnr else 0.0),
+        "min_psnr": float(min(finite)) if finite else (float("inf") if psnr else 0.0),
+        "mean_ssim": float(np.mean(ssim)) if ssim else 0.0,
+        "seconds": time.perf_counter() - t0,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 3:
+        print("usage: python quality.py original compressed [every] [workers]")
+        sys.exit(1)
+    every = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else (os.cpu_count() or 1)
+
+    for n in sorted({1, workers}):
+        r = analyze_video(sys.argv[1], sys.argv[2], every=every, workers=n)
+        if r is None:
+            sys.exit(1)
+        print(f"workers={n}: {len(r['psnr'])} frames in {r['seconds']:.2f}s  "
+              f"PSNR mean {r['mean_psnr']:.2f} / min {r['min_psnr']:.2f} dB, SSIM mean {r['mean_ssim']:.4f}")
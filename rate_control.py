@@ -0,0 +1,130 @@
+# rate_control.py
+"""
+JPEG 목표 크기 맞추기 (이미지 전송용)
+
+- fit_jpeg(img, target_bytes): 목표 크기 이하에서 가장 높은 JPEG 품질(Q)을 찾는다
+- 병렬 이분 탐색: 매 라운드마다 구간 (lo, hi) 안의 Q 후보 workers개를 스레드로 동시에 인코딩
+  (cv2.imencode는 GIL을 놓는다) → 맞는 가장 큰 Q와 안 맞는 가장 작은 Q 사이로 구간을 좁힌다.
+  JPEG 크기는 Q에 대해 (거의) 단조 증가라 라운드마다 구간이 workers+1 분의 1로 줄어든다
+- Q 최솟값으로도 넘치면 (allow_downscale) RATE_SCALES 축소 배율을 병렬로 시도해서
+  맞는 가장 큰 배율을 고른 뒤 그 크기에서 다시 Q를 찾는다
+- 어떤 조합도 안 맞으면 가장 작은 결과를 fits=False로 리턴
+- 인코딩은 progressive JPEG (실제로 보내는 형식 그대로 크기를 잰다)
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from config import RATE_Q_MIN, RATE_Q_MAX, RATE_SCALES, RATE_WORKERS
+
+_pool = ThreadPoolExecutor(max_workers=RATE_WORKERS, thread_name_prefix="jpeg-rate")
+
+
+def _encode(img, q):
+    ok, buf = cv2.imencode(
+        ".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, int(q), cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+    )
+    return buf.tobytes() if ok else None
+
+
+def _resize(img, scale):
+    if scale >= 1.0:
+        return img
+    h, w = img.shape[:2]
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+
+def _candidates(lo, hi, k):
+    """(lo, hi) 사이에서 겹치지 않는 정수 Q 최대 k개 (고르게)"""
+    step = (hi - lo) / (k + 1)
+    qs = sorted({int(round(lo + step * (i + 1))) for i in range(k)})
+    return [q for q in qs if lo < q < hi]
+
+
+def _search_q(img, target_bytes, q_min, q_max, workers):
+    """
+    목표 이하인 가장 큰 Q → (q, data) / Q 최솟값도 넘치면 (None, q_min 결과)
+    인코딩 횟수를 stats로 같이 리턴
+    """
+    encodes = 0
+    data = _encode(img, q_max)
+    encodes += 1
+    if data is not None and len(data) <= target_bytes:
+        return q_max, data, encodes
+    lo_data = _encode(img, q_min)
+    encodes += 1
+    if lo_data is None or len(lo_data) > target_bytes:
+        return None, lo_data, encodes
+
+    lo, hi = q_min, q_max                # lo: 맞음, hi: 넘침
+    best = lo_data
+    while hi - lo > 1:
+        qs = _candidates(lo, hi, workers)
+        results = list(_pool.map(lambda q: _encode(img, q), qs))
+        encodes += len(qs)
+        for q, d in zip(qs, results):
+            if d is not None and len(d) <= target_bytes:
+                if q > lo:
+                    lo, best = q, d
+            else:
+                hi = min(hi, q)
+                break                    # 단조이므로 그 위는 볼 필요 없음
+    return lo, best, encodes
+
+
+def fit_jpeg(img, target_bytes, q_min=RATE_Q_MIN, q_max=RATE_Q_MAX,
+             allow_downscale=True, workers=RATE_WORKERS):
+    """
+    리턴: {"data", "q", "scale", "size", "fits", "encodes", "seconds", "image"(인코딩한 이미지)}
+    """
+    t0 = time.perf_counter()
+    q, data, encodes = _search_q(img, target_bytes, q_min, q_max, workers)
+    scale, used = 1.0, img
+
+    if q is None and allow_downscale:
+        # 축소 배율들을 Q 최솟값으로 한 번에 → 맞는 가장 큰 배율에서 Q 탐색
+        scaled = {s: _resize(img, s) for s in RATE_SCALES}
+        sizes = dict(zip(
+            RATE_SCALES,
+            _pool.map(lambda s: _encode(scaled[s], q_min), RATE_SCALES)
+        ))
+        encodes += len(RATE_SCALES)
+        fitting = [s for s in RATE_SCALES if sizes[s] is not None and len(sizes[s]) <= target_bytes]
+        if fitting:
+            scale = max(fitting)
+            used = scaled[scale]
+            q, data, n = _search_q(used, target_bytes, q_min, q_max, workers)
+            encodes += n
+        else:
+            scale = min(RATE_SCALES)
+            used, data = scaled[scale], sizes[scale]
+
+    return {
+        "data": data,
+        "q": q if q is not None else q_min,
+        "scale": scale,
+        "size": len(data) if data else 0,
+        "fits": q is not None,
+        "encodes": encodes,
+        "seconds": time.perf_counter() - t0,
+        "image": used,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    import numpy as np
+
+    if len(sys.argv) > 1:
+        img = cv2.imread(sys.argv[1])
+    else:
+        rng = np.random.default_rng(0)
+        img = cv2.resize(rng.integers(0, 256, (60, 80, 3), dtype=np.uint8), (1920, 1440),
+                         interpolation=cv2.INTER_CUBIC)
+    for target in (2_000_000, 300_000, 100_000, 30_000, 5_000):
+        r = fit_jpeg(img, target)
+        print(f"target {target:>9} B → Q={r['q']:>2} scale={r['scale']:.2f} size={r['size']:>8} "
+              f"fits={r['fits']} ({r['encodes']} encodes, {r['seconds'] * 1000:.0f} ms)")
@@ -70,7 +70,8 @@ class RelayServer:
                 peer = self.get_peer(conn)
                 if peer:
                     try:
-                        peer.sendall(header + payload)
+                        peer.sendall(header)
+                        peer.sendall(payload)
                     except Exception as e:
                         print(f"[Server] Forward error to peer: {e}")
                 else:
@@ -83,12 +84,15 @@ class RelayServer:
             self.remove_client(conn)
 
     def recv_all(self, conn, n):
-        data = b''
-        while len(data) < n:
-            packet = conn.recv(n - len(data))
-            if not packet:
+        # 큰 파일 청크도 O(n)으로: 미리 할당한 버퍼에 바로 받는다
+        data = bytearray(n)
+        view = memoryview(data)
+        got = 0
+        while got < n:
+            k = conn.recv_into(view[got:], n - got)
+            if not k:
                 return None
-            data += packet
+            got += k
         return data
 
 if __name__ == '__main__':
@@ -0,0 +1,6 @@
+# tests/conftest.py
+# 저장소 루트의 모듈(extra 등)을 그대로 import할 수 있게
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,88 @@
+# tests/test_quality_kernels.py
+"""
+PSNR / SSIM float32 커널이 원래 float64 구현(_compute_psnr_ref / _compute_ssim_y_ref)과
+허용 오차 안에서 같은지 (python extra.py bench의 오차 검사와 같은 기준)
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from extra import (
+    compute_psnr, compute_ssim_y, compute_psnr_batch, compute_ssim_y_batch,
+    _compute_psnr_ref, _compute_ssim_y_ref,
+)
+
+PSNR_TOL = 1e-6     # dB
+SSIM_TOL = 1e-4
+
+
+def _frames(n=3, w=320, h=240, seed=0):
+    """부드러운 영상 + JPEG(Q=30) 압축본 스택 (N×H×W×3)"""
+    rng = np.random.default_rng(seed)
+    base = cv2.resize(rng.integers(0, 256, (h // 16, w // 16, 3), dtype=np.uint8), (w, h),
+                      interpolation=cv2.INTER_CUBIC)
+    refs = np.stack([np.roll(base, 5 * i, axis=1) for i in range(n)])
+    cmps = np.stack([
+        cv2.imdecode(cv2.imencode(".jpg", f, [cv2.IMWRITE_JPEG_QUALITY, 30])[1], cv2.IMREAD_COLOR)
+        for f in refs
+    ])
+    return refs, cmps
+
+
+def test_psnr_matches_reference():
+    refs, cmps = _frames()
+    for a, b in zip(refs, cmps):
+        assert abs(compute_psnr(a, b) - _compute_psnr_ref(a, b)) < PSNR_TOL
+
+
+def test_psnr_identical_is_inf():
+    refs, _ = _frames(n=1)
+    assert compute_psnr(refs[0], refs[0]) == float("inf")
+
+
+@pytest.mark.parametrize("tile_rows", [1, 7, 64, 10_000])
+def test_ssim_matches_reference(tile_rows):
+    refs, cmps = _frames()
+    for a, b in zip(refs, cmps):
+        assert abs(compute_ssim_y(a, b, tile_rows=tile_rows) - _compute_ssim_y_ref(a, b)) < SSIM_TOL
+
+
+@pytest.mark.parametrize("tile_rows", [1, 7])
+def test_ssim_tiling_matches_untiled(tile_rows):
+    refs, cmps = _frames(n=1)
+    a, b = refs[0], cmps[0]
+    whole = compute_ssim_y(a, b, tile_rows=a.shape[0])
+    assert abs(compute_ssim_y(a, b, tile_rows=tile_rows) - whole) < 1e-6
+
+
+@pytest.mark.parametrize("tile_rows", [1, 7, 64])
+def test_grayscale_input(tile_rows):
+    refs, cmps = _frames(n=1)
+    a = cv2.cvtColor(refs[0], cv2.COLOR_BGR2GRAY)
+    b = cv2.cvtColor(cmps[0], cv2.COLOR_BGR2GRAY)
+    # 기준: 회색조를 3채널로 복제하면 Y는 원래 값 그대로
+    a3, b3 = cv2.cvtColor(a, cv2.COLOR_GRAY2BGR), cv2.cvtColor(b, cv2.COLOR_GRAY2BGR)
+    assert abs(compute_psnr(a, b) - _compute_psnr_ref(a, b)) < PSNR_TOL
+    assert abs(compute_ssim_y(a, b, tile_rows=tile_rows) - _compute_ssim_y_ref(a3, b3)) < SSIM_TOL
+
+
+def test_batch_matches_reference():
+    refs, cmps = _frames(n=4)
+    ref_p = np.array([_compute_psnr_ref(a, b) for a, b in zip(refs, cmps)])
+    ref_s = np.array([_compute_ssim_y_ref(a, b) for a, b in zip(refs, cmps)])
+
+    for stack in ((refs, cmps), (list(refs), list(cmps))):      # 스택 / 리스트 둘 다
+        p = compute_psnr_batch(*stack)
+        s = compute_ssim_y_batch(*stack, tile_rows=7)
+        assert p.shape == s.shape == (len(refs),)
+        assert np.max(np.abs(p - ref_p)) < PSNR_TOL
+        assert np.max(np.abs(s - ref_s)) < SSIM_TOL
+
+
+def test_shape_mismatch_raises():
+    refs, _ = _frames(n=1)
+    with pytest.raises(ValueError):
+        compute_psnr(refs[0], refs[0][:-1])
+    with pytest.raises(ValueError):
+        compute_ssim_y(refs[0], refs[0][:-1])
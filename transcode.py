@@ -0,0 +1,213 @@
+# transcode.py
+"""
+병렬 세그먼트 트랜스코딩 (H.263)
+
+- 입력의 키프레임 시각을 ffmpeg으로 찾아서 (-skip_frame nokey + showinfo, ffprobe 불필요)
+  비슷한 길이의 세그먼트로 나눈다. 경계는 항상 키프레임이라
+  세그먼트마다 -ss 탐색이 앞쪽 GOP를 디코딩하느라 시간을 버리지 않는다
+- 세그먼트마다 ffmpeg 프로세스 하나(-threads 1)를 워커 수(기본: CPU 코어 수)만큼 동시에 돌린다.
+  실제 인코딩은 ffmpeg 프로세스가 하므로 파이썬 쪽은 스레드 풀로 프로세스를 띄우고 기다리기만 한다
+- 오디오는 한 번에 따로 인코딩 (비디오보다 훨씬 가볍다)
+- concat demuxer로 세그먼트를 -c copy로 이어 붙이고 오디오와 mux → 재인코딩 없이 AVI 한 개
+- 진행률: on_progress(done, total, index, seconds) — 세그먼트 하나가 끝날 때마다 (워커 스레드에서)
+
+단독 실행: python transcode.py input.mp4
+    → 단일 프로세스(utils.encode_h263)와 병렬 경로의 시간 / 속도 향상 비교
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import (
+    ffmpeg_path, TRANSCODE_SEGMENT_MIN_SEC, TRANSCODE_SEGMENTS_PER_WORKER
+)
+
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?), start: (-?\d+(?:\.\d+)?)")
+_PTS_RE = re.compile(r"pts_time:\s*(-?\d+(?:\.\d+)?)")
+
+
+def probe(input_path):
+    """
+    (길이 초, 키프레임 시각 목록(0부터), 오디오 있음) 을 리턴. 실패하면 None.
+    키프레임만 디코딩하므로 (-skip_frame nokey) 전체 디코딩보다 훨씬 빠르다.
+    """
+    cmd = [
+        ffmpeg_path() or "ffmpeg", "-hide_banner", "-nostats",
+        "-skip_frame", "nokey", "-i", input_path,
+        "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-"
+    ]
+    try:
+        completed = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                                   errors="replace")
+    except FileNotFoundError:
+        print("⚠ ffmpeg 실행 파일을 찾을 수 없습니다. ./ffmpeg 폴더 또는 PATH 확인 필요.")
+        return None
+    err = completed.stderr
+    m = _DURATION_RE.search(err)
+    if completed.returncode != 0 or not m:
+        print("FFmpeg probe 오류:", err[-500:])
+        return None
+
+    h, mnt, sec, start = m.groups()
+    duration = int(h) * 3600 + int(mnt) * 60 + float(sec)
+    start = float(start)
+    keyframes = sorted(
+        float(t) - start for line in err.splitlines() if "Parsed_showinfo" in line
+        for t in _PTS_RE.findall(line)
+    )
+    has_audio = re.search(r"Stream #0:\d+.*: Audio:", err) is not None
+    return duration, keyframes, has_audio
+
+
+def plan_segments(duration, keyframes, workers):
+    """키프레임 경계로 [(시작, 길이 또는 None(끝까지)), ...] 세그먼트 계획"""
+    target = max(TRANSCODE_SEGMENT_MIN_SEC, duration / max(1, workers * TRANSCODE_SEGMENTS_PER_WORKER))
+    cuts = [0.0]
+    for k in keyframes:
+        # 목표 길이를 넘긴 첫 키프레임에서 자르되, 마지막 조각이 너무 짧아지지 않게
+        if k - cuts[-1] >= target and duration - k >= TRANSCODE_SEGMENT_MIN_SEC / 2:
+            cuts.append(k)
+    segments = [(cuts[i], cuts[i + 1] - cuts[i]) for i in range(len(cuts) - 1)]
+    segments.append((cuts[-1], None))
+    return segments
+
+
+def _run(cmd):
+    t0 = time.perf_counter()
+    completed = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                               errors="replace")
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip()[-500:] or f"ffmpeg exit {completed.returncode}")
+    return time.perf_counter() - t0
+
+
+def _segment_cmd(input_path, start, length, out, fps, resolution):
+    cmd = [ffmpeg_path() or "ffmpeg", "-y", "-loglevel", "error", "-threads", "1"]
+    if start > 0:
+        cmd += ["-ss", f"{start:.6f}"]
+    cmd += ["-i", input_path]
+    if length is not None:
+        cmd += ["-t", f"{length:.6f}"]
+    cmd += [
+        "-an", "-r", str(fps), "-s", resolution,
+        "-c:v", "h263", "-pix_fmt", "yuv420p", "-threads", "1",
+        "-f", "nut", out
+    ]
+    return cmd
+
+
+def transcode_h263(input_path, output_path, fps=30, resolution="704x576",
+                   workers=None, on_progress=None, info=None):
+    """
+    input_path → output_path (H.263 AVI)를 세그먼트 병렬로 인코딩.
+    리턴: {"seconds", "segments", "workers", "cpu_seconds", "speedup"} (실패하면 None)
+    speedup = 세그먼트 인코딩 시간 합 / 실제 걸린 시간 (병렬로 얻은 배수)
+    info: 이미 구한 probe() 결과 (없으면 여기서 구함)
+    """
+    workers = workers or os.cpu_count() or 1
+    t0 = time.perf_counter()
+    info = info or probe(input_path)
+    if info is None:
+        return None
+    duration, keyframes, has_audio = info
+    segments = plan_segments(duration, keyframes, workers)
+
+    work = tempfile.mkdtemp(prefix="h263_", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        seg_paths = [os.path.join(work, f"seg_{i:04d}.nut") for i in range(len(segments))]
+        audio_path = os.path.join(work, "audio.nut")
+        seg_times = [0.0] * len(segments)
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcode") as pool:
+            futures = {}
+            if has_audio:
+                futures[pool.submit(_run, [
+                    ffmpeg_path() or "ffmpeg", "-y", "-loglevel", "error", "-i", input_path,
+                    "-vn", "-c:a", "libmp3lame", "-f", "nut", audio_path
+                ])] = None
+            for i, (start, length) in enumerate(segments):
+                cmd = _segment_cmd(input_path, start, length, seg_paths[i], fps, resolution)
+                futures[pool.submit(_run, cmd)] = i
+
+            done = 0
+            try:
+                for fut in as_completed(futures):
+                    i = futures[fut]
+                    seconds = fut.result()
+                    if i is None:
+                        continue
+                    seg_times[i] = seconds
+                    done += 1
+                    if on_progress:
+                        on_progress(done, len(segments), i, seconds)
+            except Exception:
+                for fut in futures:
+                    fut.cancel()
+                raise
+
+        # 세그먼트 이어 붙이기 + 오디오 (재인코딩 없음)
+        list_path = os.path.join(work, "segments.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for p in seg_paths:
+                f.write("file '{}'\n".format(p.replace("\\", "/").replace("'", "'\\''")))
+        cmd = [ffmpeg_path() or "ffmpeg", "-y", "-loglevel", "error",
+               "-f", "concat", "-safe", "0", "-i", list_path]
+        if has_audio:
+            cmd += ["-i", audio_path, "-map", "0:v", "-map", "1:a"]
+        cmd += ["-c", "copy", "-r", str(fps), output_path]
+        _run(cmd)
+
+    except Exception as e:
+        print("병렬 인코딩 오류:", e)
+        return None
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    elapsed = time.perf_counter() - t0
+    cpu = sum(seg_times)
+    return {
+        "seconds": elapsed,
+        "segments": len(segments),
+        "workers": workers,
+        "cpu_seconds": cpu,
+        "speedup": cpu / elapsed if elapsed > 0 else 1.0,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    import cv2
+    from utils import encode_h263
+
+    if len(sys.argv) < 2:
+        print("usage: python transcode.py input.mp4 [workers]")
+        sys.exit(1)
+    src = sys.argv[1]
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    def frames(path):
+        cap = cv2.VideoCapture(path)
+        count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        return count
+
+    t = time.perf_counter()
+    encode_h263(src, src + ".single.avi")
+    single = time.perf_counter() - t
+
+    stats = transcode_h263(
+        src, src + ".parallel.avi", workers=n,
+        on_progress=lambda d, total, i, s: print(f"  segment {i}: {s:.2f}s ({d}/{total})")
+    )
+    if stats is None:
+        sys.exit(1)
+    print(f"single process : {single:.2f}s, {frames(src + '.single.avi')} frames")
+    print(f"parallel       : {stats['seconds']:.2f}s, {frames(src + '.parallel.avi')} frames "
+          f"({stats['segments']} segments, {stats['workers']} workers)")
+    print(f"speedup        : {single / stats['seconds']:.2f}x vs single process "
+          f"(segment time / wall time {stats['speedup']:.2f}x)")
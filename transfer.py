@@ -0,0 +1,679 @@
+# transfer.py
+"""
+백그라운드 파일 전송 엔진
+
+- Tk 스레드는 파일 선택만 하고, 압축 / 분석 / 전송은 작업 스레드(최대 TRANSFER_MAX_JOBS개)에서 실행
+- 보내는 파일마다 전송 ID를 붙이고 (FILE_HDR의 "id", FILE_CHUNK / FILE_END 앞),
+  OutboundTransfer를 PacketScheduler의 bulk source로 등록한다.
+  스케줄러가 실시간 미디어 사이사이에 여러 전송의 청크를 번갈아 보낸다
+- 이어받기 / 중복 제거:
+  송신측은 파일을 TRANSFER_BLOCK_SIZE 블록으로 나눠 병렬로 SHA-256을 구하고 FILE_HDR에 싣는다.
+  수신측은 캐시(전체 해시로 찾음)나 이전에 받다 만 .part 파일에서 해시가 맞는 블록을
+  FILE_HAVE로 알려주고, 송신측은 빠진 블록만 (오프셋과 함께) 보낸다.
+  끝나면 수신측이 파일 전체를 다시 해시해서 검증한 뒤 이름을 바꾼다
+- 수신 파일 쓰기는 InboundWriter 스레드가 (모아서 쓰기, 미리 할당, fsync 묶음) 처리하고
+  받는 동안은 .part 임시 파일 → 검증 후 os.replace로 원자적으로 교체
+- 파일은 mmap으로 열어 해시 / 청크 모두 복사 없이 memoryview로 처리한다
+  (mmap이 안 되면 블록 해시도 청크도 _FileView가 필요한 범위만 readinto로 재사용 버퍼에 읽는다)
+- 청크 크기는 64KB에서 시작해 한 청크 전송 시간이 목표(TRANSFER_CHUNK_TIME)보다
+  짧으면 두 배로, 길면 절반으로 (64KB ~ 1MB) → 빠른 링크에서는 패킷 수가 줄고,
+  느린 링크에서는 청크 하나가 소켓을 오래 붙잡지 않는다
+- 인코딩하면서 보내기(send_stream): 크기를 모르는 스트림(ffmpeg stdout)을 읽는 대로 청크로 보내고,
+  블록 해시는 읽으면서 구해 FILE_END 뒤 trailer로 보낸다 (이 경우 FILE_HAVE / 이어받기 없음)
+- 진행률은 진행 중인 전송 전체 합계로 App.update_transfer_status에 (TRANSFER_PROGRESS_INTERVAL마다)
+"""
+
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    TYPE_FILE_HDR, TYPE_FILE_CHUNK, TYPE_FILE_END,
+    TRANSFER_MIN_CHUNK, TRANSFER_MAX_CHUNK, TRANSFER_CHUNK_TIME,
+    TRANSFER_PROGRESS_INTERVAL, TRANSFER_ID_FMT, TRANSFER_CHUNK_FMT, TRANSFER_MAX_JOBS,
+    TRANSFER_BLOCK_SIZE, TRANSFER_HAVE_TIMEOUT,
+    TRANSFER_WRITE_SIZE, TRANSFER_FSYNC_BYTES, TRANSFER_WRITE_QUEUE_MAX,
+    TRANSFER_STREAM_BUFFER, TRANSFER_DEFAULT_BPS
+)
+
+TRANSFER_ID_SIZE = struct.calcsize(TRANSFER_ID_FMT)
+TRANSFER_CHUNK_HDR_SIZE = struct.calcsize(TRANSFER_CHUNK_FMT)
+
+
+def split_transfer_id(payload: bytes):
+    """FILE_END payload → (id, 나머지)"""
+    (tid,) = struct.unpack_from(TRANSFER_ID_FMT, payload)
+    return tid, payload[TRANSFER_ID_SIZE:]
+
+
+def split_chunk(payload: bytes):
+    """FILE_CHUNK payload → (id, offset, data)"""
+    tid, offset = struct.unpack_from(TRANSFER_CHUNK_FMT, payload)
+    return tid, offset, memoryview(payload)[TRANSFER_CHUNK_HDR_SIZE:]
+
+
+# -----------------------
+# 블록 해시 (병렬)
+# -----------------------
+_hash_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="hash")
+
+
+def _sha256(data) -> str:
+    # hashlib은 큰 버퍼를 해시하는 동안 GIL을 놓으므로 스레드로 병렬화된다
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_blocks(view, block_size=TRANSFER_BLOCK_SIZE):
+    """버퍼(memoryview / mmap)를 블록 단위로 병렬 해시 → [hex, ...]"""
+    n = len(view)
+    slices = [view[i:i + block_size] for i in range(0, n, block_size)]
+    return list(_hash_pool.map(_sha256, slices))
+
+
+def hash_file_blocks(path, block_size=TRANSFER_BLOCK_SIZE):
+    if os.path.getsize(path) == 0:
+        return []
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # mmap이 안 되는 파일시스템 → 블록 하나 크기의 버퍼를 재사용하면서 순서대로
+            buf = bytearray(block_size)
+            hashes = []
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    return hashes
+                hashes.append(_sha256(memoryview(buf)[:n]))
+        try:
+            with memoryview(mm) as view:
+                return hash_blocks(view, block_size)
+        finally:
+            mm.close()
+
+
+class _FileView:
+    """
+    mmap이 안 될 때 OutboundTransfer.view 대신 쓰는 읽기 전용 뷰.
+    view[a:b]마다 그 범위만 readinto로 재사용 버퍼에 읽는다
+    (스케줄러는 패킷을 다 보낸 뒤에 다음 청크를 꺼내므로 버퍼 하나로 충분)
+    """
+
+    def __init__(self, f, size):
+        self.f = f
+        self.size = size
+        self.buf = bytearray(TRANSFER_MAX_CHUNK)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(self.size)
+        n = max(0, stop - start)
+        if n > len(self.buf):
+            self.buf = bytearray(n)
+        view = memoryview(self.buf)[:n]
+        self.f.seek(start)
+        got = 0
+        while got < n:
+            k = self.f.readinto(view[got:])
+            if not k:
+                break
+            got += k
+        return view[:got]
+
+
+def root_hash(block_hashes, size) -> str:
+    """파일 전체 해시 = sha256(크기 + 블록 해시 목록). 캐시 키로도 쓴다"""
+    h = hashlib.sha256(str(size).encode())
+    for b in block_hashes:
+        h.update(bytes.fromhex(b))
+    return h.hexdigest()
+
+
+def encode_have(bits) -> str:
+    return "".join("1" if b else "0" for b in bits)
+
+
+def missing_ranges(have: str, nblocks, block_size, total):
+    """FILE_HAVE 비트열 → 보내야 할 [(start, end), ...] (연속 블록은 합침)"""
+    ranges = []
+    for i in range(nblocks):
+        if i < len(have) and have[i] == "1":
+            continue
+        start, end = i * block_size, min((i + 1) * block_size, total)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+class OutboundTransfer:
+    """보내는 파일 하나 (PacketScheduler의 bulk source). ranges의 바이트만 보낸다"""
+
+    # 끝나면 전송 속도를 대역폭 추정에 넣는다 (첫 청크를 스케줄러에 넘긴 시각부터 잰다)
+    measure_rate = True
+
+    def __init__(self, engine, tid, ranges, view, priority=0):
+        self.engine = engine
+        self.id = tid
+        self.ranges = list(ranges)
+        self.total = sum(e - s for s, e in self.ranges)
+        self.view = view
+        self.priority = priority
+
+        self.range_idx = 0
+        self.pos = self.ranges[0][0] if self.ranges else 0
+        self.ended = False
+        self.chunk = TRANSFER_MIN_CHUNK
+        self.sent = 0
+        self.pending = 0
+        self.log = []
+        self.start = time.time()
+        self.first_chunk = None
+        self.done = threading.Event()
+        self.ok = False
+
+    def next_packet(self):
+        while self.range_idx < len(self.ranges):
+            start, end = self.ranges[self.range_idx]
+            n = min(self.chunk, end - self.pos)
+            if n <= 0:
+                self.range_idx += 1
+                if self.range_idx < len(self.ranges):
+                    self.pos = self.ranges[self.range_idx][0]
+                continue
+            off = self.pos
+            data = self.view[off:off + n]
+            self.pos += n
+            if self.first_chunk is None:
+                self.first_chunk = time.time()
+            self.pending = n
+            return TYPE_FILE_CHUNK, (struct.pack(TRANSFER_CHUNK_FMT, self.id, off), data)
+
+        if not self.ended:
+            self.ended = True
+            self.pending = 0
+            return TYPE_FILE_END, struct.pack(TRANSFER_ID_FMT, self.id)
+
+        # END까지 나감 → source에서 빠짐
+        if not self.done.is_set():
+            self.ok = True
+            self.done.set()
+            if self.measure_rate and self.first_chunk is not None:
+                self.engine._record_rate(self.sent, time.time() - self.first_chunk)
+            self.engine._progress(force=True)
+        return None
+
+    def on_sent(self, nbytes, seconds):
+        if not self.pending:
+            return
+        self.sent += self.pending
+        self.pending = 0
+
+        # 청크 크기 조절 (전송 시간 기준)
+        if seconds < TRANSFER_CHUNK_TIME / 2 and self.chunk < TRANSFER_MAX_CHUNK:
+            self.chunk *= 2
+        elif seconds > TRANSFER_CHUNK_TIME * 2 and self.chunk > TRANSFER_MIN_CHUNK:
+            self.chunk //= 2
+
+        elapsed = max(time.time() - self.start, 1e-4)
+        self.log.append((elapsed, self.sent * 8 / 1_000_000 / elapsed))
+        self.engine._progress()
+
+    def ready(self):
+        return True
+
+    def abort(self):
+        self.done.set()
+
+
+class OutboundStream(OutboundTransfer):
+    """
+    길이를 모르는 스트림(예: 인코딩 중인 ffmpeg stdout)을 보내는 bulk source.
+    읽는 쪽(send_stream)이 push()로 청크를 넣고, 다 넣으면 finish(trailer).
+    FILE_END 뒤에 trailer(JSON: 최종 크기 / 블록 해시 / 전체 해시)를 붙여 수신측이 검증한다.
+    """
+
+    # 속도가 인코더(ffmpeg)에 묶여 있어서 링크 대역폭 추정에 쓰면 안 된다
+    measure_rate = False
+
+    def __init__(self, engine, tid, scheduler, priority=0):
+        super().__init__(engine, tid, [], None, priority)
+        self.scheduler = scheduler
+        self.chunks = deque()
+        self.queued = 0
+        self.cond = threading.Condition()
+        self.trailer = None
+
+    def push(self, offset, data, max_queued):
+        with self.cond:
+            # 네트워크가 인코딩보다 느리면 여기서 기다림 → ffmpeg 파이프도 멈춘다 (메모리 보호)
+            while self.queued > max_queued and not self.done.is_set():
+                self.cond.wait(0.5)
+            self.chunks.append((offset, data))
+            self.queued += len(data)
+            self.total += len(data)
+        self.scheduler.wake()
+
+    def finish(self, trailer):
+        with self.cond:
+            self.trailer = trailer
+        self.scheduler.wake()
+
+    def ready(self):
+        return bool(self.chunks) or self.trailer is not None
+
+    def next_packet(self):
+        with self.cond:
+            if self.chunks:
+                off, data = self.chunks.popleft()
+                self.queued -= len(data)
+                self.cond.notify()
+                self.pending = len(data)
+                return TYPE_FILE_CHUNK, (struct.pack(TRANSFER_CHUNK_FMT, self.id, off), data)
+        if not self.ended:
+            self.ended = True
+            self.pending = 0
+            trailer = json.dumps(self.trailer).encode("utf-8")
+            return TYPE_FILE_END, struct.pack(TRANSFER_ID_FMT, self.id) + trailer
+        return super().next_packet()
+
+    def abort(self):
+        super().abort()
+        with self.cond:
+            self.cond.notify_all()
+
+
+class InboundWriter:
+    """
+    수신 파일 쓰기 전용 스레드.
+    네트워크 스레드는 write()로 버퍼를 넘기기만 하고 바로 돌아간다 (디스크가 느려도 오디오가 밀리지 않음).
+
+    - 파일마다 TRANSFER_WRITE_SIZE 버퍼에 연속된 청크를 모았다가
+      그 크기 경계에 맞춰 한 번에 pwrite (작은 쓰기 여러 번 → 큰 정렬된 쓰기 한 번)
+    - TRANSFER_FSYNC_BYTES마다, 그리고 닫을 때 fsync
+    - 쌓인 데이터가 TRANSFER_WRITE_QUEUE_MAX를 넘으면 그때만 write()가 기다린다 (메모리 보호)
+    - 쓰기가 실패하면(ENOSPC, EIO 등) 핸들의 "error"에 남기고 그 뒤 쓰기는 버린다.
+      close()의 on_done은 실패해도 항상 불리므로 받는 쪽이 handle["error"]를 보고 알린다
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.pending_bytes = 0
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    # -----------------------
+    # 네트워크 스레드
+    # -----------------------
+    def open(self, path, size):
+        """미리 크기를 잡아 둔 파일 핸들 (쓰기는 writer 스레드만). 디스크 작업이라 rx 풀에서 부른다"""
+        return self._handle(self._open_fd(path, size))
+
+    def open_later(self, path, truncate=False):
+        """
+        핸들만 바로 만들고 파일 열기는 writer 스레드에서 (큐 순서상 뒤에 오는 write보다 먼저).
+        수신 스레드가 헤더 직후의 청크를 기다리지 않고 받아야 하는 스트림용
+        """
+        handle = self._handle(None)
+        self.queue.put(("open", handle, path, truncate))
+        return handle
+
+    @staticmethod
+    def _handle(fd):
+        return {"fd": fd, "buf": bytearray(TRANSFER_WRITE_SIZE), "start": 0, "fill": 0, "unsynced": 0,
+                "error": None}
+
+    @staticmethod
+    def _open_fd(path, size, truncate=False):
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0) | (os.O_TRUNC if truncate else 0)
+        fd = os.open(path, flags, 0o644)
+        if size and os.fstat(fd).st_size < size:
+            try:
+                os.posix_fallocate(fd, 0, size)     # 조각나지 않게 한 번에 할당
+            except (AttributeError, OSError):
+                os.ftruncate(fd, size)
+        return fd
+
+    def write(self, handle, offset, data):
+        n = len(data)
+        with self.cond:
+            while self.pending_bytes > TRANSFER_WRITE_QUEUE_MAX:
+                self.cond.wait()
+            self.pending_bytes += n
+        self.queue.put(("write", handle, offset, data))
+
+    def close(self, handle, on_done=None):
+        """남은 데이터 쓰기 + fsync + 닫기가 끝나면 on_done() (writer 스레드에서, 실패해도 호출)"""
+        self.queue.put(("close", handle, on_done, None))
+
+    # -----------------------
+    # writer 스레드
+    # -----------------------
+    def _loop(self):
+        while True:
+            op, handle, a, b = self.queue.get()
+            if op == "open":
+                try:
+                    handle["fd"] = self._open_fd(a, 0, truncate=b)
+                except Exception as e:
+                    print("file writer error:", e)
+                    handle["error"] = str(e)
+            elif op == "write":
+                try:
+                    if handle["error"] is None:
+                        self._append(handle, a, b)
+                except Exception as e:
+                    print("file writer error:", e)
+                    handle["error"] = str(e)
+                finally:
+                    with self.cond:
+                        self.pending_bytes -= len(b)
+                        self.cond.notify_all()
+            else:
+                try:
+                    if handle["error"] is None:
+                        self._flush(handle)
+                        os.fsync(handle["fd"])
+                except Exception as e:
+                    print("file writer error:", e)
+                    handle["error"] = str(e)
+                finally:
+                    try:
+                        if handle["fd"] is not None:
+                            os.close(handle["fd"])
+                    except OSError:
+                        pass
+                    if a:
+                        try:
+                            a()
+                        except Exception as e:
+                            print("file writer callback error:", e)
+
+    def _append(self, h, offset, data):
+        data = memoryview(data)
+        while len(data):
+            if h["fill"] and offset != h["start"] + h["fill"]:
+                self._flush(h)                          # 연속이 아니면 먼저 비운다
+            if not h["fill"]:
+                h["start"] = offset
+            # 다음 TRANSFER_WRITE_SIZE 경계까지만 버퍼에 담는다
+            boundary = (h["start"] // TRANSFER_WRITE_SIZE + 1) * TRANSFER_WRITE_SIZE
+            room = boundary - (h["start"] + h["fill"])
+            k = min(room, len(data))
+            h["buf"][h["fill"]:h["fill"] + k] = data[:k]
+            h["fill"] += k
+            offset += k
+            data = data[k:]
+            if h["start"] + h["fill"] == boundary:
+                self._flush(h)
+
+    def _flush(self, h):
+        if not h["fill"]:
+            return
+        view = memoryview(h["buf"])[:h["fill"]]
+        pos = h["start"]
+        while len(view):
+            n = _pwrite(h["fd"], view, pos)
+            view = view[n:]
+            pos += n
+        h["unsynced"] += h["fill"]
+        h["fill"] = 0
+        if h["unsynced"] >= TRANSFER_FSYNC_BYTES:
+            os.fsync(h["fd"])
+            h["unsynced"] = 0
+
+
+def _pwrite(fd, data, offset):
+    if hasattr(os, "pwrite"):
+        return os.pwrite(fd, data, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.write(fd, data)
+
+
+class TransferEngine:
+    def __init__(self, app):
+        self.app = app
+        self.pool = ThreadPoolExecutor(max_workers=TRANSFER_MAX_JOBS, thread_name_prefix="transfer")
+        # 수신측 준비 / 검증 작업은 따로 (보내는 작업이 pool을 다 차지해도 FILE_HAVE 응답이 막히지 않게)
+        self.rx_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="transfer-rx")
+        self.writer = InboundWriter()
+        self.ids = itertools.count(1)
+        self.outbound = {}                # id → OutboundTransfer (진행 중)
+        self.have_waiters = {}            # id → [Event, FILE_HAVE 응답]
+        self.lock = threading.Lock()
+        self.last_report = 0.0
+        self.bandwidth = None             # 최근 전송들로 잰 속도 (bytes/s, 지수 평균)
+
+    # -----------------------
+    # 작업 (아무 스레드에서나 호출)
+    # -----------------------
+    def submit(self, fn, *args):
+        """fn(*args)를 작업 스레드에서 실행 (여러 작업이 동시에 진행될 수 있음)"""
+        self.pool.submit(self._run, fn, args)
+
+    def submit_rx(self, fn, *args):
+        self.rx_pool.submit(self._run, fn, args)
+
+    def _run(self, fn, args):
+        try:
+            fn(*args)
+        except Exception as e:
+            print("transfer job error:", e)
+            self.app.system_msg(f"[전송 실패] {e}")
+
+    # -----------------------
+    # 전송 (작업 스레드에서 호출, 끝날 때까지 블로킹)
+    # -----------------------
+    def send_file(self, path, meta, priority=0):
+        """
+        파일을 FILE_HDR → (FILE_HAVE 대기) → 빠진 FILE_CHUNK... → FILE_END 로 보낸다.
+        리턴: 전송률 로그 [(경과 초, Mbps), ...] (연결이 끊기면 None)
+        """
+        total = os.path.getsize(path)
+        with open(path, "rb") as f:
+            if total == 0:
+                return self._send(meta, memoryview(b""), priority=priority)
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # 파일 전체를 메모리에 올리지 않고 청크마다 readinto
+                return self._send(meta, _FileView(f, total), priority=priority,
+                                  blocks=hash_file_blocks(path))
+            try:
+                with memoryview(mm) as view:
+                    return self._send(meta, view, priority=priority)
+            finally:
+                try:
+                    mm.close()
+                except BufferError:
+                    pass    # 중단된 전송의 청크를 스케줄러가 아직 들고 있음 → GC가 정리
+
+    def send_data(self, data, meta, priority=0):
+        """메모리에 있는 데이터(예: 압축한 JPEG)를 파일처럼 전송"""
+        return self._send(meta, memoryview(data), priority=priority)
+
+    def _send(self, meta, view, priority=0, blocks=None):
+        app = self.app
+        scheduler = app.scheduler
+        if scheduler is None:
+            return None
+
+        total = len(view)
+        if blocks is None:
+            blocks = hash_blocks(view)
+        tid = next(self.ids)
+        meta = dict(
+            meta, id=tid, filesize=total, block_size=TRANSFER_BLOCK_SIZE,
+            blocks=blocks, hash=root_hash(blocks, total)
+        )
+
+        # 1) 헤더 → 수신측이 가진 블록 목록(FILE_HAVE)을 기다림
+        waiter = [threading.Event(), None]
+        self.have_waiters[tid] = waiter
+        try:
+            if not app.send_bytes(TYPE_FILE_HDR, json.dumps(meta).encode("utf-8")):
+                return None
+            if not waiter[0].wait(TRANSFER_HAVE_TIMEOUT) or waiter[1] is None:
+                app.system_msg(f"[전송 중단] {meta.get('filename', '')}: 수신측 응답 없음")
+                return None
+        finally:
+            self.have_waiters.pop(tid, None)
+
+        have = waiter[1].get("have", "")
+        ranges = missing_ranges(have, len(blocks), TRANSFER_BLOCK_SIZE, total)
+        skipped = total - sum(e - s for s, e in ranges)
+        if skipped:
+            app.system_msg(
+                f"[이어받기] {meta.get('filename', '')}: {skipped/1024/1024:.2f}MB는 상대가 이미 가지고 있음"
+            )
+
+        # 2) 빠진 블록만 스케줄러로
+        t = OutboundTransfer(self, tid, ranges, view, priority)
+        with self.lock:
+            self.outbound[t.id] = t
+        try:
+            if not app.scheduler or not app.scheduler.add_source(t):
+                return None
+            t.done.wait()
+        finally:
+            with self.lock:
+                self.outbound.pop(t.id, None)
+
+        if not t.ok:
+            app.system_msg(f"[전송 중단] {meta.get('filename', '')}: 연결이 끊겼습니다.")
+            return None
+        return t.log
+
+    def send_stream(self, readable, meta, tee_path=None, on_eof=None, priority=0):
+        """
+        readable(파이프 등)을 끝까지 읽으면서 바로 보낸다: FILE_HDR(stream) → FILE_CHUNK... → FILE_END + trailer.
+        tee_path: 보낸 바이트를 그대로 저장할 파일 (송신측 분석용)
+        on_eof(): 입력이 끝나면 (tee 파일을 닫은 뒤) 호출. False를 리턴하면 수신측에 실패로 알린다
+        리턴: 전송률 로그 (실패 / 연결 끊김이면 None)
+        """
+        app = self.app
+        scheduler = app.scheduler
+        if scheduler is None:
+            return None
+
+        tid = next(self.ids)
+        meta = dict(meta, id=tid, stream=True, block_size=TRANSFER_BLOCK_SIZE)
+        if not app.send_bytes(TYPE_FILE_HDR, json.dumps(meta).encode("utf-8")):
+            return None
+
+        s = OutboundStream(self, tid, scheduler, priority)
+        with self.lock:
+            self.outbound[tid] = s
+        try:
+            if not scheduler.add_source(s):
+                return None
+
+            read = getattr(readable, "read1", readable.read)   # 파이프에 있는 만큼만 (기다리지 않음)
+            blocks = []
+            h = hashlib.sha256()
+            in_block = 0
+            offset = 0
+            tee = open(tee_path, "wb") if tee_path else None
+            try:
+                while not s.done.is_set():
+                    data = read(s.chunk)
+                    if not data:
+                        break
+                    if tee:
+                        tee.write(data)
+                    # 블록 해시는 읽으면서 (TRANSFER_BLOCK_SIZE 경계마다 하나)
+                    view = memoryview(data)
+                    while len(view):
+                        k = min(TRANSFER_BLOCK_SIZE - in_block, len(view))
+                        h.update(view[:k])
+                        in_block += k
+                        view = view[k:]
+                        if in_block == TRANSFER_BLOCK_SIZE:
+                            blocks.append(h.hexdigest())
+                            h = hashlib.sha256()
+                            in_block = 0
+                    s.push(offset, data, TRANSFER_STREAM_BUFFER)
+                    offset += len(data)
+            finally:
+                if tee:
+                    tee.close()
+
+            if s.done.is_set():
+                app.system_msg(f"[전송 중단] {meta.get('filename', '')}: 연결이 끊겼습니다.")
+                return None
+            if in_block:
+                blocks.append(h.hexdigest())
+
+            ok = on_eof() if on_eof else True
+            if ok is False:
+                s.finish({"error": True})
+                s.done.wait()
+                return None
+            s.finish({"filesize": offset, "blocks": blocks, "hash": root_hash(blocks, offset)})
+            s.done.wait()
+        finally:
+            with self.lock:
+                self.outbound.pop(tid, None)
+
+        if not s.ok:
+            app.system_msg(f"[전송 중단] {meta.get('filename', '')}: 연결이 끊겼습니다.")
+            return None
+        return s.log
+
+    def handle_have(self, payload: bytes):
+        """수신 스레드: FILE_HAVE 응답을 기다리는 전송에 전달"""
+        try:
+            msg = json.loads(payload.decode("utf-8"))
+        except Exception as e:
+            print("file have parse error:", e)
+            return
+        waiter = self.have_waiters.get(msg.get("id"))
+        if waiter:
+            waiter[1] = msg
+            waiter[0].set()
+
+    def abort_all(self):
+        """연결 종료: FILE_HAVE를 기다리는 전송도 바로 끝낸다"""
+        for waiter in list(self.have_waiters.values()):
+            waiter[0].set()
+
+    def _record_rate(self, nbytes, seconds):
+        # 작은 전송은 지연 시간이 대부분이라 속도 추정에 쓰지 않는다
+        if nbytes < 4 * TRANSFER_MIN_CHUNK or seconds <= 0:
+            return
+        rate = nbytes / seconds
+        self.bandwidth = rate if self.bandwidth is None else 0.7 * self.bandwidth + 0.3 * rate
+
+    def estimated_bandwidth(self):
+        """(bytes/s, 측정값인지). 아직 잰 적이 없으면 TRANSFER_DEFAULT_BPS"""
+        if self.bandwidth is None:
+            return TRANSFER_DEFAULT_BPS, False
+        return self.bandwidth, True
+
+    def _progress(self, force=False):
+        now = time.time()
+        if not force and now - self.last_report < TRANSFER_PROGRESS_INTERVAL:
+            return
+        self.last_report = now
+        with self.lock:
+            active = list(self.outbound.values())
+        if not active:
+            return
+        sent = sum(t.sent for t in active)
+        total = sum(t.total for t in active)
+        elapsed = max(now - min(t.start for t in active), 1e-4)
+        self.app.update_transfer_status(
+            100.0 * sent / max(total, 1), sent, total, sent / 1024 / 1024 / elapsed
+        )
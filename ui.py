@@ -6,7 +6,8 @@ from PIL import Image, ImageTk
 import cv2
 import io
 
-from config import DEFAULT_SERVER_HOST
+from config import DEFAULT_SERVER_HOST, STREAM_CODECS, RATE_MODES
+from extra import add_record_controls
 
 
 class AppUI:
@@ -87,6 +88,11 @@ class AppUI:
         tk.Button(frame_file, text="Send Image", command=self.app.compress_and_send_with_quality).pack(pady=2)
         tk.Button(frame_file, text="Send Video", command=self.app.compress_and_send_h263_video).pack(pady=2)
         
+        # Record
+        group_rec = tk.LabelFrame(control_frame, text="Record", padx=6, pady=6)
+        group_rec.pack(side=tk.LEFT, padx=6)
+        add_record_controls(group_rec, self.app)
+
         # Quality / Filter
         group_effect = tk.LabelFrame(control_frame, text="Quality / Filter", padx=6, pady=6)
         group_effect.pack(side=tk.LEFT, padx=6)
@@ -97,15 +103,29 @@ class AppUI:
         )
         self.scale_quality.set(self.app.compression_quality)
         self.scale_quality.pack(side=tk.LEFT, padx=6)
+        # 이미지 전송 크기: 슬라이더 Q 그대로 / 목표 KB / 목표 전송 시간(초)
+        self.combo_rate = ttk.Combobox(group_effect, values=RATE_MODES, state="readonly", width=9)
+        self.combo_rate.current(0)
+        self.combo_rate.pack(side=tk.LEFT, padx=2)
+        self.rate_target_var = tk.StringVar(value="200")
+        tk.Entry(group_effect, textvariable=self.rate_target_var, width=5).pack(side=tk.LEFT, padx=2)
         tk.Label(group_effect, text="Filter:").pack(side=tk.LEFT)
         self.combo_filter = ttk.Combobox(
             group_effect,
-            values=["None", "Gray", "Canny(Edge)", "Inverse", "Face Detect", "Blur"],
+            values=["None", "Gray", "Canny(Edge)", "Inverse", "Face Detect", "Blur",
+                    "Blur > Gray", "Gray > Face Detect"],
             state="readonly", width=16
         )
         self.combo_filter.current(0)
         self.combo_filter.pack(side=tk.LEFT, padx=6)
         self.combo_filter.bind("<<ComboboxSelected>>", self.app.change_filter)
+        tk.Label(group_effect, text="Stream:").pack(side=tk.LEFT)
+        self.combo_codec = ttk.Combobox(
+            group_effect, values=STREAM_CODECS, state="readonly", width=7
+        )
+        self.combo_codec.current(0)
+        self.combo_codec.pack(side=tk.LEFT, padx=6)
+        self.combo_codec.bind("<<ComboboxSelected>>", self.app.change_stream_codec)
 
         # 메인 영역 (Local / Remote / Chat)
         main_frame = tk.Frame(self.root, bg="#202020")
@@ -142,6 +162,12 @@ class AppUI:
         )
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
 
+        # 파일 전송 진행률 (App.update_transfer_status)
+        self.transfer_label = tk.Label(
+            self.status_bar, text="", anchor=tk.E, bg="#ddd", font=("Arial", 10)
+        )
+        self.transfer_label.pack(side=tk.RIGHT, padx=6)
+
     # --- 이미지 갱신 헬퍼 ---
     def show_local_bgr(self, frame):
         try:
@@ -164,6 +190,66 @@ class AppUI:
         except Exception as e:
             print("show_remote_frame error:", e)
 
+    def show_remote_bgr(self, frame):
+        try:
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            img = Image.fromarray(rgb)
+            img = img.resize((440, 560))
+            imgtk = ImageTk.PhotoImage(img)
+            self.lbl_remote.configure(image=imgtk)
+            self.lbl_remote.image = imgtk
+        except Exception as e:
+            print("show_remote_frame error:", e)
+
     def clear_local(self):
         self.lbl_local.configure(image='')
         self.lbl_local.image = None
+
+    # --- 채팅창 ---
+    def append_chat(self, text: str):
+        try:
+            box = self.chat_box
+            box.configure(state='normal')
+            box.insert('end', text + '\n')
+            box.configure(state='disabled')
+            box.see('end')
+        except Exception as e:
+            print("append_chat error:", e)
+
+    # --- 압축 결과 그래프 (ClientEngine.on_result) ---
+    def plot_result(self, labels, sizes, title, speed_title, log, quality=None):
+        import matplotlib.pyplot as plt
+
+        timestamps = [t for t, _ in log]
+        mbps_log = [m for _, m in log]
+
+        fig, axs = plt.subplots(1, 3 if quality else 2, figsize=(15 if quality else 10, 5))
+
+        # 파일 크기 + PSNR/SSIM
+        axs[0].bar(labels, sizes, color=["blue", "orange"])
+        axs[0].set_title(title, fontsize=12)
+        axs[0].set_ylabel("Bytes")
+        axs[0].grid(axis="y", linestyle="--", alpha=0.5)
+
+        # 전송 속도(Mbps)
+        axs[1].plot(timestamps, mbps_log, marker='o', color="green")
+        axs[1].set_title(speed_title, fontsize=12)
+        axs[1].set_xlabel("Time (seconds)")
+        axs[1].set_ylabel("Mbps")
+        axs[1].grid(True)
+
+        axs[1].set_xlim(left=0)
+
+        # 프레임별 PSNR / SSIM (비디오)
+        if quality:
+            axs[2].plot(quality["index"], quality["psnr"], color="purple", label="PSNR (dB)")
+            axs[2].set_title("Per-frame Quality", fontsize=12)
+            axs[2].set_xlabel("Frame")
+            axs[2].set_ylabel("PSNR (dB)")
+            axs[2].grid(True)
+            ax_ssim = axs[2].twinx()
+            ax_ssim.plot(quality["index"], quality["ssim"], color="gray", alpha=0.7, label="SSIM")
+            ax_ssim.set_ylabel("SSIM")
+        plt.tight_layout()
+        plt.show()
+
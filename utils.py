@@ -1,9 +1,12 @@
 # utils.py
 import os
+import time
 import cv2
 import numpy as np
 import subprocess
 
+from config import ffmpeg_path
+
 # 한글/공백 경로에서도 안전하게 이미지 읽기
 def imread_unicode(path: str):
     try:
@@ -17,9 +20,9 @@ def imread_unicode(path: str):
 # h.263 인코딩
 def encode_h263(input_path, output_path, fps=30, resolution="704x576"):
     command = [
-        "./ffmpeg/ffmpeg", "-y",
-        "-r", str(fps),
+        ffmpeg_path() or "ffmpeg", "-y",
         "-i", input_path,
+        "-r", str(fps),
         "-s", resolution,
         "-c:v", "h263",
         "-pix_fmt", "yuv420p",
@@ -40,10 +43,126 @@ def encode_h263(input_path, output_path, fps=30, resolution="704x576"):
         print("FFmpeg 인코딩 오류:", e.stderr)
         return False
     except FileNotFoundError:
-        print("⚠ ffmpeg 실행 파일을 찾을 수 없습니다. path 확인 필요.")
+        print("⚠ ffmpeg 실행 파일을 찾을 수 없습니다. ./ffmpeg 폴더 또는 PATH 확인 필요.")
         return False
 
 
+# h.263 인코딩 → stdout 스트림 (인코딩하면서 보내기)
+# AVI는 끝에 인덱스를 써야 해서 파이프로 못 내보내므로 nut 컨테이너로 흘리고,
+# 다 받은 쪽에서 remux_to_avi로 AVI로 바꾼다 (재인코딩 없음)
+def open_h263_stream(input_path, fps=30, resolution="704x576"):
+    import tempfile
+    command = [
+        ffmpeg_path() or "ffmpeg", "-y", "-loglevel", "error",
+        "-i", input_path,
+        "-r", str(fps),
+        "-s", resolution,
+        "-c:v", "h263",
+        "-pix_fmt", "yuv420p",
+        "-c:a", "libmp3lame",
+        "-f", "nut", "pipe:1"
+    ]
+    try:
+        # stderr는 파일로 (파이프로 받으면 아무도 안 읽을 때 ffmpeg이 멈출 수 있음)
+        err = tempfile.TemporaryFile()
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=err, stdin=subprocess.DEVNULL)
+        proc.err_file = err
+        return proc
+    except FileNotFoundError:
+        print("⚠ ffmpeg 실행 파일을 찾을 수 없습니다. ./ffmpeg 폴더 또는 PATH 확인 필요.")
+        return None
+
+def stream_error(proc) -> str:
+    """open_h263_stream 프로세스의 ffmpeg 오류 출력"""
+    try:
+        proc.err_file.seek(0)
+        return proc.err_file.read().decode("utf-8", "replace")
+    except Exception:
+        return ""
+
+def remux_to_avi(input_path, output_path, fps=30):
+    command = [
+        ffmpeg_path() or "ffmpeg", "-y", "-loglevel", "error",
+        "-i", input_path,
+        "-c", "copy",
+        "-r", str(fps),
+        output_path
+    ]
+    try:
+        subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        return True
+    except subprocess.CalledProcessError as e:
+        print("FFmpeg remux 오류:", e.stderr)
+        return False
+    except FileNotFoundError:
+        print("⚠ ffmpeg 실행 파일을 찾을 수 없습니다. ./ffmpeg 폴더 또는 PATH 확인 필요.")
+        return False
+
+
+# -----------------------
+# H.263 비트스트림 헬퍼
+# -----------------------
+# PTYPE source format → (width, height)
+H263_SOURCE_FORMATS = {
+    1: (128, 96),      # sub-QCIF
+    2: (176, 144),     # QCIF
+    3: (352, 288),     # CIF
+    4: (704, 576),     # 4CIF
+    5: (1408, 1152),   # 16CIF
+}
+
+def find_h263_pictures(data, start=0):
+    """
+    PSC(Picture Start Code, 0000 0000 0000 0000 1000 00)의 위치 목록.
+    ffmpeg은 PSC를 바이트 정렬해서 내보내므로 바이트 단위로만 찾는다.
+    """
+    positions = []
+    n = len(data)
+    i = data.find(b"\x00\x00", start)
+    while 0 <= i < n - 2:
+        if (data[i + 2] & 0xFC) == 0x80:
+            positions.append(i)
+            i = data.find(b"\x00\x00", i + 3)
+        else:
+            i = data.find(b"\x00\x00", i + 1)
+    return positions
+
+def h263_picture_info(data, pos=0):
+    """
+    pos 위치의 픽처 헤더에서 (is_intra, (w, h))를 읽는다.
+    헤더가 잘렸거나 확장 PTYPE(H.263+)이면 None.
+    """
+    if len(data) < pos + 5:
+        return None
+    v = int.from_bytes(bytes(data[pos:pos + 5]), "big")   # 40 bits
+    fmt = (v >> (39 - 37)) & 0x7
+    size = H263_SOURCE_FORMATS.get(fmt)
+    if size is None:
+        return None
+    is_intra = ((v >> (39 - 38)) & 0x1) == 0
+    return is_intra, size
+
+
+# -----------------------
+# JPEG 비트스트림 헬퍼
+# -----------------------
+JPEG_SOS = b"\xff\xda"     # Start Of Scan
+JPEG_EOI = b"\xff\xd9"     # End Of Image
+
+def find_jpeg_scans(data, start=0, end=None):
+    """
+    SOS 마커 위치 목록. 엔트로피 코딩 구간의 0xFF 뒤에는 항상 0x00 / RST가 오므로
+    FF DA는 진짜 마커일 때만 나온다 (cv2.imencode 출력에는 EXIF 썸네일도 없음).
+    progressive JPEG은 스캔 k가 끝나는 곳 = 스캔 k+1의 SOS → 그 앞까지 + EOI로 디코딩하면 k단계 화질
+    """
+    positions = []
+    i = data.find(JPEG_SOS, start, end)
+    while i >= 0:
+        positions.append(i)
+        i = data.find(JPEG_SOS, i + 2, end)
+    return positions
+
+
 # FPS 값이 0이거나 말이 안 되면 기본값 30으로
 def safe_fps(raw_fps) -> float:
     try:
@@ -54,31 +173,121 @@ def safe_fps(raw_fps) -> float:
     except Exception:
         return 30.0
 
+# -----------------------
+# 얼굴 검출 스테이지
+# -----------------------
+_face_cascade = None
+
+def get_face_cascade():
+    """Haar cascade XML은 처음 한 번만 읽는다."""
+    global _face_cascade
+    if _face_cascade is None:
+        _face_cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        )
+    return _face_cascade
+
+
+class FaceDetector:
+    """
+    축소된 프레임에서 detect_every 프레임마다 한 번 검출하고,
+    그 사이 프레임은 직전 박스 주변에서 템플릿 매칭으로 추적한다.
+    cost_ms: 프레임당 처리 시간(ms, 지수 평균), detect_ms: 마지막 검출 시간 → stats()
+    show_cost: 처리 시간을 프레임에 그린다 (그 프레임은 상대에게 전송 / 녹화되므로 기본은 끔)
+    """
+
+    def __init__(self, detect_every=5, detect_width=320, show_cost=False):
+        self.detect_every = detect_every
+        self.detect_width = detect_width
+        self.show_cost = show_cost
+
+        self.frame_idx = 0
+        self.boxes = []        # 축소 좌표 (x, y, w, h)
+        self.templates = []    # 축소 gray 템플릿
+        self.need_detect = True
+
+        self.cost_ms = 0.0
+        self.detect_ms = 0.0
+
+    def _detect(self, gray):
+        t0 = time.perf_counter()
+        faces = get_face_cascade().detectMultiScale(
+            gray, 1.1, 4, minSize=(20, 20)
+        )
+        self.boxes = [tuple(int(v) for v in f) for f in faces]
+        self.templates = [gray[y:y+h, x:x+w].copy() for (x, y, w, h) in self.boxes]
+        self.need_detect = False
+        self.detect_ms = (time.perf_counter() - t0) * 1000
+
+    def _track(self, gray):
+        gh, gw = gray.shape[:2]
+        boxes, templates = [], []
+        for (x, y, w, h), tmpl in zip(self.boxes, self.templates):
+            # 박스 크기의 절반만큼 넓힌 영역에서만 탐색
+            mx, my = w // 2, h // 2
+            x0, y0 = max(0, x - mx), max(0, y - my)
+            x1, y1 = min(gw, x + w + mx), min(gh, y + h + my)
+            roi = gray[y0:y1, x0:x1]
+            if roi.shape[0] < h or roi.shape[1] < w:
+                continue
+            res = cv2.matchTemplate(roi, tmpl, cv2.TM_CCOEFF_NORMED)
+            _, score, _, loc = cv2.minMaxLoc(res)
+            if score < 0.5:
+                continue
+            boxes.append((x0 + loc[0], y0 + loc[1], w, h))
+            templates.append(tmpl)
+        if len(boxes) < len(self.boxes):
+            # 놓친 얼굴이 있으면 다음 프레임에서 바로 재검출
+            self.need_detect = True
+        self.boxes, self.templates = boxes, templates
+
+    def process(self, frame):
+        t0 = time.perf_counter()
+
+        h, w = frame.shape[:2]
+        scale = min(1.0, self.detect_width / float(w))
+        if scale < 1.0:
+            small = cv2.resize(frame, (int(w * scale), int(h * scale)),
+                               interpolation=cv2.INTER_AREA)
+        else:
+            small = frame
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        if self.need_detect or self.frame_idx % self.detect_every == 0:
+            self._detect(gray)
+        else:
+            self._track(gray)
+        self.frame_idx += 1
+
+        inv = 1.0 / scale
+        for (x, y, bw, bh) in self.boxes:
+            x, y = int(x * inv), int(y * inv)
+            bw, bh = int(bw * inv), int(bh * inv)
+            cv2.rectangle(frame, (x, y), (x+bw, y+bh), (0, 255, 0), 2)
+            cv2.putText(frame, "User", (x, y-10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.9,
+                        (0, 255, 0), 2)
+
+        ms = (time.perf_counter() - t0) * 1000
+        self.cost_ms = ms if self.frame_idx == 1 else 0.9 * self.cost_ms + 0.1 * ms
+        if self.show_cost:
+            cv2.putText(frame, f"face {self.cost_ms:.1f} ms", (8, h - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+        return frame
+
+    def stats(self):
+        return {"cost_ms": self.cost_ms, "detect_ms": self.detect_ms,
+                "faces": len(self.boxes)}
+
+
 # 필터 적용 (원래 VideoChatClient.apply_filter -> 함수로 분리)
+# mode는 필터 이름 하나 또는 "Blur > Gray" 같은 체인. 결과는 frame에 in-place로 쓴다.
 def apply_filter(frame, mode: str):
+    if not mode or mode == "None":
+        return frame
     try:
-        if mode == "Gray":
-            g = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            return cv2.cvtColor(g, cv2.COLOR_GRAY2BGR)
-        elif mode == "Canny(Edge)":
-            g = cv2.Canny(frame, 50, 150)
-            return cv2.cvtColor(g, cv2.COLOR_GRAY2BGR)
-        elif mode == "Inverse":
-            return cv2.bitwise_not(frame)
-        elif mode == "Blur":
-            return cv2.GaussianBlur(frame, (15, 15), 0)
-        elif mode == "Face Detect":
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            face_cascade = cv2.CascadeClassifier(
-                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-            )
-            faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-            for (x, y, w, h) in faces:
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                cv2.putText(frame, "User", (x, y-10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.9,
-                            (0, 255, 0), 2)
-            return frame
+        from filters import apply_chain  # 순환 import 방지 위해 함수 안에서 import
+        return apply_chain(frame, mode)
     except Exception as e:
         print("Filter error:", e)
     return frame
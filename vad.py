@@ -0,0 +1,72 @@
+# vad.py
+"""
+마이크 스트리밍용 음성 구간 검출 (VAD)
+
+- 청크를 10ms 프레임으로 reshape 해서 에너지 / zero-crossing rate를 한 번에 계산
+- 노이즈 플로어는 청크의 가장 조용한 프레임을 천천히 따라가고, 더 조용해지면 바로 내려간다
+- 에너지가 플로어 + margin_db를 넘거나, 조금 낮더라도 ZCR이 높으면(ㅅ/ㅊ 같은 무성 자음) 음성
+- 음성이 끝난 뒤 hangover_ms 동안은 계속 음성으로 보고 말끝이 잘리지 않게 한다
+"""
+
+import numpy as np
+
+
+class VoiceActivityDetector:
+    def __init__(self, rate=16000, frame_ms=10, hangover_ms=300,
+                 margin_db=9.0, zcr_margin_db=3.0, zcr_thresh=0.25,
+                 min_speech_db=-55.0):
+        self.frame_len = int(rate * frame_ms / 1000)
+        self.rate = rate
+        self.hangover_s = hangover_ms / 1000.0
+        self.margin_db = margin_db
+        self.zcr_margin_db = zcr_margin_db
+        self.zcr_thresh = zcr_thresh
+        self.min_speech_db = min_speech_db
+
+        self.noise_db = -60.0
+        self.hang_left = 0.0
+        self.stats = {"chunks": 0, "speech": 0, "suppressed": 0}
+
+    def is_speech(self, pcm: bytes) -> bool:
+        x = np.frombuffer(pcm, dtype=np.int16)
+        n = len(x) // self.frame_len * self.frame_len
+        if n == 0:
+            return True
+        frames = x[:n].reshape(-1, self.frame_len).astype(np.float32) * (1.0 / 32768)
+
+        energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+
+        thr = max(self.noise_db + self.margin_db, self.min_speech_db)
+        loud = energy_db > thr
+        fricative = (energy_db > thr - self.zcr_margin_db) & (zcr > self.zcr_thresh)
+        active = bool(np.any(loud | fricative))
+
+        # 청크에서 가장 조용한 프레임으로 노이즈 플로어 추적
+        # (음성 중에도 아주 천천히 올라가야 배경 잡음이 커졌을 때 갇히지 않는다)
+        quietest = float(energy_db.min())
+        if quietest < self.noise_db:
+            self.noise_db = quietest
+        else:
+            rate = 0.005 if active else 0.05
+            self.noise_db += rate * (quietest - self.noise_db)
+
+        chunk_s = len(x) / float(self.rate)
+        if active:
+            self.hang_left = self.hangover_s
+        else:
+            self.hang_left = max(0.0, self.hang_left - chunk_s)
+
+        speech = active or self.hang_left > 0
+        self.stats["chunks"] += 1
+        if speech:
+            self.stats["speech"] += 1
+        else:
+            self.stats["suppressed"] += 1
+        return speech
+
+    @property
+    def noise_level_db(self) -> float:
+        """comfort noise 용 배경 잡음 레벨 (dBov)"""
+        return self.noise_db
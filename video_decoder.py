@@ -1,36 +1,168 @@
 # video_decoder.py
 import subprocess
+import threading
+from collections import deque
 import numpy as np
 import cv2
 
-from config import ffmpeg_available
+from config import ffmpeg_available, ffmpeg_path
+from utils import find_h263_pictures, h263_picture_info
 
-def decode_h263_bytes_to_bgr(data_bytes):
+
+def h263_stream_size(data_bytes):
+    """비트스트림의 첫 픽처 헤더에서 (w, h)를 읽는다. 없으면 None."""
+    starts = find_h263_pictures(data_bytes)
+    if not starts:
+        return None
+    info = h263_picture_info(data_bytes, starts[0])
+    return info[1] if info else None
+
+
+def decode_h263_bytes_to_bgr(data_bytes, size=None):
     """
     H.263 bitstream을 단일 BGR frame으로 디코딩.
     원래 client.py의 decode_h263_bytes_to_bgr 그대로 분리.
+
+    한 번만 디코딩할 때 쓰는 함수 (호출마다 ffmpeg을 새로 띄운다).
+    연속 스트림은 H263DecoderSession을 사용할 것.
+    해상도는 size=(w, h) 또는 픽처 헤더에서 읽고, 여러 프레임이 나오면 마지막 프레임을 리턴.
     """
     if not ffmpeg_available():
         return None
+    size = size or h263_stream_size(data_bytes)
+    if size is None:
+        return None
     try:
         proc = subprocess.Popen(
             [
-                "ffmpeg", "-loglevel", "error",
+                ffmpeg_path(), "-loglevel", "error",
                 "-f", "h263", "-i", "pipe:0",
                 "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"
             ],
             stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
         )
         out, err = proc.communicate(input=data_bytes, timeout=1.0)
-        if not out:
-            return None
-
-        for w, h in [(640, 480), (320, 240), (1280, 720), (480, 360)]:
-            if len(out) == w * h * 3:
-                arr = np.frombuffer(out, dtype=np.uint8).reshape((h, w, 3))
-                return arr
 
-        return None
+        w, h = size
+        frame_len = w * h * 3
+        if len(out) < frame_len:
+            return None
+        last = (len(out) // frame_len - 1) * frame_len
+        return np.frombuffer(out, dtype=np.uint8, count=frame_len,
+                             offset=last).reshape((h, w, 3))
     except Exception as e:
         print("decode_h263 error:", e)
         return None
+
+
+class H263DecoderSession:
+    """
+    수신 스트림 하나당 ffmpeg 디코더 프로세스 하나를 유지.
+
+    - feed(): 받은 비트스트림을 ffmpeg stdin에 그대로 흘려 넣는다.
+    - reader 스레드가 stdout에서 정확히 w*h*3 바이트씩 읽어 on_frame(frame, ts) 호출.
+      ts는 그 픽처를 feed()할 때 넘긴 타임스탬프 (픽처 하나당 프레임 하나).
+    - 해상도는 size=(w, h)로 주거나(메타데이터), 첫 픽처 헤더에서 읽는다.
+      헤더의 해상도가 바뀌면 프로세스를 새 크기로 다시 띄운다.
+    """
+
+    def __init__(self, on_frame, size=None):
+        self.on_frame = on_frame
+        self.size = size
+        self.proc = None
+        self.read_thread = None
+        self.frames = 0
+        self.pending_ts = deque()
+
+    def _spawn(self) -> bool:
+        if not ffmpeg_available():
+            return False
+        cmd = [
+            ffmpeg_path(), "-loglevel", "error",
+            "-flags", "low_delay",
+            "-probesize", "32", "-analyzeduration", "0",
+            "-threads", "1",                 # frame threading은 프레임 지연을 늘린다
+            "-f", "h263", "-i", "pipe:0",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"
+        ]
+        try:
+            self.proc = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                bufsize=0
+            )
+        except Exception as e:
+            print("Failed to start ffmpeg decoder:", e)
+            self.proc = None
+            return False
+
+        self.pending_ts.clear()
+        self.read_thread = threading.Thread(
+            target=self._reader, args=(self.proc, self.size), daemon=True
+        )
+        self.read_thread.start()
+        return True
+
+    def feed(self, data: bytes, ts: float = None) -> bool:
+        """비트스트림 추가. 디코더를 쓸 수 없으면 False."""
+        header_size = h263_stream_size(data)
+        if header_size and header_size != self.size:
+            self.close()
+            self.size = header_size
+        if self.size is None:
+            return False
+
+        if self.proc is None and not self._spawn():
+            return False
+        if self.proc.poll() is not None:
+            self.proc = None
+            return False
+
+        for _ in find_h263_pictures(data):
+            self.pending_ts.append(ts)
+        try:
+            self.proc.stdin.write(data)
+            return True
+        except Exception as e:
+            print("h263 decoder write error:", e)
+            return False
+
+    def _reader(self, proc, size):
+        w, h = size
+        frame_len = w * h * 3
+        try:
+            while True:
+                # 프레임마다 새 배열에 바로 readinto (추가 복사 없음)
+                frame = np.empty((h, w, 3), dtype=np.uint8)
+                mv = memoryview(frame).cast("B")
+                got = 0
+                while got < frame_len:
+                    n = proc.stdout.readinto(mv[got:])
+                    if not n:
+                        return
+                    got += n
+                self.frames += 1
+                ts = self.pending_ts.popleft() if self.pending_ts else None
+                try:
+                    self.on_frame(frame, ts)
+                except Exception as e:
+                    print("h263 on_frame error:", e)
+        except Exception as e:
+            print("h263 decoder reader error:", e)
+
+    def close(self):
+        proc = self.proc
+        self.proc = None
+        if not proc:
+            return
+        try:
+            proc.stdin.close()
+        except Exception:
+            pass
+        try:
+            proc.terminate()
+            proc.wait(timeout=1)
+        except Exception:
+            pass
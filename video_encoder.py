@@ -1,29 +1,61 @@
 # video_encoder.py
 import subprocess
 import threading
+import queue
+from collections import deque
+
+import numpy as np
+
+from av_sync import media_clock
+from config import ffmpeg_available, ffmpeg_path
+from utils import find_h263_pictures, h263_picture_info
 
-from config import ffmpeg_available
 
 class H263Encoder:
     """
     ffmpeg 프로세스를 띄워서 raw BGR frame -> H.263 bitstream 로 인코딩.
-    한 번 start() 후 여러 프레임 encode() 가능.
+    한 번 start() 후 여러 프레임 submit() 가능.
+
+    - submit()은 블로킹하지 않는다. 프레임은 최대 max_queue개까지 쌓이고,
+      넘치면 가장 오래된 프레임을 버린다 (라이브 스트림은 지연보다 드롭이 낫다).
+    - 완성된 픽처 하나마다 on_picture(data, ts, is_intra)가 호출된다.
+      ts는 submit() 때 넘긴 입력 타임스탬프.
+    - 출력은 PSC(Picture Start Code) 단위로 자른다. 한 픽처의 끝은 다음 PSC가
+      도착해야 확정되므로 콜백은 1프레임 늦게 온다 (stop() 시 마지막 픽처도 flush).
     """
 
-    def __init__(self):
+    def __init__(self, on_picture=None, max_queue: int = 3):
+        self.on_picture = on_picture
         self.proc = None
+        self.params = None
+        self.running = False
+
+        self.frames = queue.Queue(maxsize=max_queue)
+        self.pending_ts = deque()          # ffmpeg에 들어갔지만 아직 출력되지 않은 프레임
+        self.write_thread = None
         self.read_thread = None
-        self.out_buffer = bytearray()
-        self.buf_cond = threading.Condition()
+        self.keyframe_pending = False
 
-    def start(self, width: int, height: int, fps: int = 20) -> bool:
+        self.stats = {"submitted": 0, "dropped": 0, "pictures": 0}
+
+    def start(self, width: int, height: int, fps: int = 20, gop: int = 40) -> bool:
         if not ffmpeg_available():
             return False
-        if self.proc:
+        if self.running:
             return True
+        self.params = (width, height, fps, gop)
+        if not self._spawn():
+            return False
+
+        self.running = True
+        self.write_thread = threading.Thread(target=self._writer, daemon=True)
+        self.write_thread.start()
+        return True
 
+    def _spawn(self) -> bool:
+        width, height, fps, gop = self.params
         cmd = [
-            "ffmpeg",
+            ffmpeg_path(),
             "-loglevel", "error",
             "-f", "rawvideo",
             "-pix_fmt", "bgr24",
@@ -31,6 +63,8 @@ class H263Encoder:
             "-r", str(fps),
             "-i", "pipe:0",
             "-c:v", "h263",
+            "-g", str(gop),
+            "-flush_packets", "1",
             "-f", "h263",
             "pipe:1"
         ]
@@ -39,7 +73,7 @@ class H263Encoder:
                 cmd,
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
                 bufsize=0
             )
         except Exception as e:
@@ -47,52 +81,131 @@ class H263Encoder:
             self.proc = None
             return False
 
-        def reader():
+        self.pending_ts.clear()
+        self.read_thread = threading.Thread(
+            target=self._reader, args=(self.proc,), daemon=True
+        )
+        self.read_thread.start()
+        return True
+
+    # -----------------------
+    # 입력 (호출 스레드는 블로킹되지 않음)
+    # -----------------------
+    def submit(self, frame, ts: float = None) -> bool:
+        if not self.running:
+            return False
+        item = (frame, media_clock() if ts is None else ts)
+        self.stats["submitted"] += 1
+        while True:
+            try:
+                self.frames.put_nowait(item)
+                return True
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self.stats["dropped"] += 1
+                except queue.Empty:
+                    pass
+
+    def request_keyframe(self):
+        """
+        다음 프레임을 인트라(I) 프레임으로 만든다.
+        파이프로 연결된 ffmpeg에는 키프레임을 강제할 방법이 없으므로
+        writer 스레드가 다음 프레임 전에 같은 설정으로 프로세스를 다시 띄운다
+        (새 스트림의 첫 프레임은 항상 I).
+        """
+        self.keyframe_pending = True
+
+    def _writer(self):
+        while self.running:
+            item = self.frames.get()
+            if item is None:
+                break
+            frame, ts = item
+
+            if self.keyframe_pending:
+                self.keyframe_pending = False
+                self._close_proc()
+                if not self._spawn():
+                    break
+
+            self.pending_ts.append(ts)
             try:
-                while True:
-                    data = self.proc.stdout.read(4096)
-                    if not data:
-                        break
-                    with self.buf_cond:
-                        self.out_buffer.extend(data)
-                        self.buf_cond.notify_all()
+                mv = memoryview(np.ascontiguousarray(frame)).cast("B")
+                while mv:
+                    n = self.proc.stdin.write(mv)
+                    mv = mv[n:]
             except Exception as e:
-                print("h263 stdout reader error:", e)
+                print("ffmpeg-write error:", e)
+                break
 
-        self.read_thread = threading.Thread(target=reader, daemon=True)
-        self.read_thread.start()
-        return True
+        self.running = False
+        self._close_proc()
 
-    def encode(self, frame):
-        if not self.proc:
-            return None
+    # -----------------------
+    # 출력 (PSC 단위로 픽처 분리)
+    # -----------------------
+    def _reader(self, proc):
+        buf = bytearray()
+        scan = 1
         try:
-            self.proc.stdin.write(frame.tobytes())
-            self.proc.stdin.flush()
+            while True:
+                data = proc.stdout.read(65536)
+                if not data:
+                    break
+                buf.extend(data)
+
+                cut = 0
+                for pos in find_h263_pictures(buf, scan):
+                    if pos > cut:
+                        self._emit(bytes(buf[cut:pos]))
+                        cut = pos
+                del buf[:cut]
+                # PSC가 read 경계에 걸칠 수 있으므로 마지막 2바이트부터 다시 검색
+                scan = max(len(buf) - 2, 1)
         except Exception as e:
-            print("ffmpeg-write error:", e)
-            return None
+            print("h263 stdout reader error:", e)
 
-        with self.buf_cond:
-            self.buf_cond.wait(timeout=0.1)
-            if not self.out_buffer:
-                return None
-            data = bytes(self.out_buffer)
-            self.out_buffer.clear()
-            return data
+        if buf:
+            self._emit(bytes(buf))
 
-    def stop(self):
-        if not self.proc:
+    def _emit(self, data: bytes):
+        ts = self.pending_ts.popleft() if self.pending_ts else media_clock()
+        info = h263_picture_info(data)
+        self.stats["pictures"] += 1
+        if self.on_picture:
+            try:
+                self.on_picture(data, ts, bool(info and info[0]))
+            except Exception as e:
+                print("h263 on_picture error:", e)
+
+    def _close_proc(self):
+        proc = self.proc
+        if not proc:
             return
         try:
-            try:
-                self.proc.stdin.close()
-            except Exception:
-                pass
-            self.proc.terminate()
-            self.proc.wait(timeout=1)
+            proc.stdin.close()
+        except Exception:
+            pass
+        if self.read_thread:
+            self.read_thread.join(timeout=1)
+        try:
+            proc.terminate()
+            proc.wait(timeout=1)
         except Exception:
             pass
         self.proc = None
-        with self.buf_cond:
-            self.out_buffer.clear()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        # writer가 get()에서 대기 중일 수 있으므로 큐를 비우고 종료 신호
+        while True:
+            try:
+                self.frames.get_nowait()
+            except queue.Empty:
+                break
+        self.frames.put(None)
+        if self.write_thread and threading.current_thread() is not self.write_thread:
+            self.write_thread.join(timeout=2)
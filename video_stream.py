@@ -1,56 +1,115 @@
 # video_stream.py
 import cv2
+import numpy as np
 import time
 import threading
-import pyaudio
 
-from config import TYPE_VIDEO, TYPE_AUDIO
-from utils import safe_fps, apply_filter
+from config import (
+    TYPE_VIDEO, TYPE_VIDEO_H263, TYPE_AUDIO, TYPE_KEYFRAME_REQ,
+    H263_STREAM_SIZE, H263_STREAM_FPS, H263_GOP, KEYFRAME_REQ_INTERVAL,
+    VISUALIZER_FPS
+)
+from utils import (
+    safe_fps, apply_filter, find_h263_pictures, h263_picture_info
+)
+from video_encoder import H263Encoder
+from video_decoder import H263DecoderSession
+from extra import VideoRecorder
+from audio_codec import AudioEncoder, encode_comfort_noise
+from vad import VoiceActivityDetector
+from audio_io import RingBuffer, packet_frames, get_pyaudio
+from av_sync import media_clock, pack_media_ts, PlayoutScheduler
 
-# 오디오 설정
-CHUNK = 1024
-FORMAT = pyaudio.paInt16
-CHANNELS = 1
-RATE = 16000
 
 # AudioStream : 마이크 캡처 + 서버 전송
 class AudioStream:
+    """
+    콜백 모드 마이크 캡처.
+    PyAudio 콜백은 링 버퍼에 쓰고 이벤트만 울리고, 송신 스레드가 패킷 단위
+    (packet_ms, 기본 20ms)로 꺼내서 VAD / 인코딩 / 전송을 한다.
+    패킷마다 첫 샘플의 캡처 시각(media_clock)을 붙여 보낸다.
+    포맷(rate / channels / packet_ms)은 app.audio_codec.send_format을 따른다.
+    """
+
     def __init__(self, app):
         self.app = app
         self.running = False
 
-        self.audio = pyaudio.PyAudio()
-        self.stream = None
+        self.stream = None              # PyAudio는 처음 시작할 때 연다 (audio_io.get_pyaudio)
         self.thread = None
+        self.ring = None
+        self.ready = threading.Event()
+        self.ts_ref = None             # (링 쓰기 위치, 마지막 샘플 캡처 시각)
+        self.fmt = None
+        self.encoder = AudioEncoder()
+        self.vad = None
+        self.in_silence = False
+        self.last_cn = 0.0
+        self.stats = {"overflows": 0}
 
     def start(self):
         """오디오 스트리밍 시작"""
         if self.running:
             return
 
+        fmt = dict(self.app.audio_codec.send_format)
+        frames = packet_frames(fmt)
+        self.fmt = fmt
+        self.ring = RingBuffer(frames * fmt["channels"] * 32)
+        self.ts_ref = None
+        self.ready.clear()
+        self.vad = VoiceActivityDetector(rate=fmt["rate"])
+        self.in_silence = False
+
         try:
-            self.stream = self.audio.open(
-                format=FORMAT,
-                channels=CHANNELS,
-                rate=RATE,
+            import pyaudio
+            self.pa_continue = pyaudio.paContinue
+            self.stream = get_pyaudio().open(
+                format=pyaudio.paInt16,
+                channels=fmt["channels"],
+                rate=fmt["rate"],
                 input=True,
-                frames_per_buffer=CHUNK,
+                frames_per_buffer=frames,
+                stream_callback=self._callback
             )
+            self.stream.start_stream()
         except Exception as e:
+            self.stream = None
             self.app.system_msg(f"Audio start failed: {e}")
             return
 
         self.running = True
         self.thread = threading.Thread(target=self._loop, daemon=True)
         self.thread.start()
-        self.app.system_msg("Audio streaming started")
+        self.app.system_msg(
+            f"Audio streaming started ({fmt['rate']} Hz, {fmt['channels']} ch, {fmt['packet_ms']} ms)"
+        )
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        # 오디오 스레드: 복사 한 번 + 이벤트만 (블로킹 / 할당 최소화)
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        if self.ring.write(samples) < len(samples):
+            self.stats["overflows"] += 1
+        self.ts_ref = (self.ring.w, media_clock())
+        self.ready.set()
+        return None, self.pa_continue
 
     def _loop(self):
+        pkt = np.empty(packet_frames(self.fmt) * self.fmt["channels"], dtype=np.int16)
+        ring = self.ring
+        per_sec = float(self.fmt["rate"] * self.fmt["channels"])
         while self.running:
+            if not self.ready.wait(0.5):
+                continue
+            self.ready.clear()
             try:
-                data = self.stream.read(CHUNK, exception_on_overflow=False)
-                if self.app.sock:
-                    self.app.send_bytes(TYPE_AUDIO, data)
+                while ring.available() >= len(pkt):
+                    w, t = self.ts_ref
+                    ts = t - (w - ring.r) / per_sec
+                    ring.read_into(pkt)
+                    self.app.video.feed_visualizer("local", pkt, self.fmt["channels"])
+                    if self.app.sock:
+                        self._send_chunk(pkt.tobytes(), ts)
             except Exception as e:
                 print("Audio stream error:", e)
                 # 오류가 나도 loop를 종료하지만 stop()은 호출하지 않음
@@ -58,26 +117,49 @@ class AudioStream:
 
         print("Audio loop ended")
 
-    def stop(self):
-        """오디오 스트리밍 종료"""
-        self.running = False
+    def _send_chunk(self, data: bytes, ts: float):
+        codec = self.app.audio_codec
+        if codec.use_vad and not self.vad.is_speech(data):
+            # 무음: 시작할 때와 이후 1초마다 comfort noise 마커만 보낸다
+            now = time.time()
+            if not self.in_silence or now - self.last_cn >= 1.0:
+                self.in_silence = True
+                self.last_cn = now
+                self.app.send_bytes(
+                    TYPE_AUDIO, pack_media_ts(ts) + encode_comfort_noise(self.vad.noise_level_db)
+                )
+            return
+
+        self.in_silence = False
+        # 협상된 코덱으로 압축 (협상 전에는 pcm16)
+        payload = self.encoder.encode(codec.send_codec, data)
+        self.app.send_bytes(TYPE_AUDIO, pack_media_ts(ts) + payload)
 
+    def reconfigure(self):
+        """협상된 송신 포맷이 바뀌면 캡처를 새 포맷으로 다시 연다."""
+        if not self.running or self.fmt == self.app.audio_codec.send_format:
+            return
+        self._close()
+        self.start()
+
+    def _close(self):
+        self.running = False
         try:
             if self.stream:
                 self.stream.stop_stream()
                 self.stream.close()
         except:
             pass
-
         self.stream = None
-        self.app.system_msg("Audio streaming stopped")
+        self.ready.set()
+        if self.thread and threading.current_thread() is not self.thread:
+            self.thread.join(timeout=1)
+        self.thread = None
 
-    def __del__(self):
-        """PyAudio 리소스 해제"""
-        try:
-            self.audio.terminate()
-        except:
-            pass
+    def stop(self):
+        """오디오 스트리밍 종료"""
+        self._close()
+        self.app.system_msg("Audio streaming stopped")
 
 # VideoStream : 카메라 / 비디오 파일 재생 + 송출
 class VideoStream:
@@ -91,6 +173,28 @@ class VideoStream:
         self.audio = AudioStream(app)   # 오디오 객체 포함
         self.lock = threading.Lock()
 
+        # 녹화기 (내 영상 / 수신 영상)
+        self.recorders = {
+            "local": VideoRecorder(source="local"),
+            "remote": VideoRecorder(source="remote"),
+        }
+
+        # H.263 라이브 송신 상태
+        self.h263 = None
+
+        # Audio Visualizer 소스
+        self.visualizer = None
+
+        # H.263 라이브 수신 상태
+        self.rx_decoder = None
+        self.rx_synced = False
+        self.last_keyframe_req = 0.0
+
+        # 수신 비디오는 오디오 클럭에 맞춰 표시 (립싱크)
+        self.playout = PlayoutScheduler(
+            self._present_remote, lambda: self.app.audio_player.audio_clock()
+        )
+
     # 카메라 시작
     def start_camera(self):
         with self.lock:
@@ -118,17 +222,57 @@ class VideoStream:
 
             frame = apply_filter(frame, self.app.filter_mode)
 
-            self.app.show_local(frame)
-            self._send_frame(frame)
+            self._emit_frame(frame)
 
             time.sleep(1 / 20)
 
         self.stop_camera()
 
+    # Audio Visualizer (마이크 / 수신 오디오 스펙트로그램을 영상 소스로 사용)
+    def start_visualizer(self):
+        from visualizer import AudioVisualizer
+
+        with self.lock:
+            if self.cap or self.sending:
+                self.app.system_msg("Stop the current source first")
+                return
+            self.visualizer = AudioVisualizer()
+            self.sending = True
+            self.thread = threading.Thread(target=self._visualizer_loop, daemon=True)
+            self.thread.start()
+
+        if not self.audio.running:
+            self.app.system_msg("Audio Visualizer started (Start Mic to see local audio)")
+        else:
+            self.app.system_msg("Audio Visualizer started")
+
+    def _visualizer_loop(self):
+        # 오디오 패킷 주기와 무관하게 고정 주기로 렌더링 (밀리면 따라잡지 않고 건너뜀)
+        period = 1.0 / VISUALIZER_FPS
+        next_t = time.monotonic()
+        while self.sending and self.visualizer:
+            frame = self.visualizer.render()
+            self._emit_frame(frame)
+
+            next_t += period
+            delay = next_t - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_t = time.monotonic()
+
+        self.stop_camera()
+
+    def feed_visualizer(self, lane, pcm, channels=1):
+        viz = self.visualizer
+        if viz is not None:
+            viz.feed(lane, pcm, channels)
+
     # 카메라 종료
     def stop_camera(self):
         with self.lock:
             self.sending = False
+            self.visualizer = None
 
             if self.cap:
                 try:
@@ -137,6 +281,10 @@ class VideoStream:
                     pass
                 self.cap = None
 
+            if self.h263:
+                self.h263.stop()
+                self.h263 = None
+
             self.app.clear_local()
             self.app.system_msg("Camera stopped")
 
@@ -195,17 +343,35 @@ class VideoStream:
             if not ret:
                 break
 
-            self.app.show_local(frame)
-            self._send_frame(frame)
+            self._emit_frame(frame)
 
             time.sleep(1 / 20)
 
         self.stop_camera()
 
-    # 프레임을 JPEG로 인코딩하여 서버로 전송
-    def _send_frame(self, frame):
+    # 로컬 표시 + 전송 + 녹화
+    def _emit_frame(self, frame):
+        ts = media_clock()
+        self.app.show_local(frame)
+        jpeg = self._send_frame(frame, ts)
+
+        rec = self.recorders["local"]
+        if rec.recording:
+            # 전송용 JPEG가 있으면 그대로 저장 (재인코딩 없음)
+            if jpeg is not None:
+                rec.write_jpeg(jpeg)
+            else:
+                rec.write(frame)
+
+    # 프레임을 JPEG(또는 H.263)로 인코딩하여 서버로 전송
+    # MJPEG 모드에서는 보낸 JPEG 바이트를 리턴
+    def _send_frame(self, frame, ts):
         if not self.app.sock:
-            return
+            return None
+
+        if self.app.stream_codec == "H.263":
+            self._send_frame_h263(frame, ts)
+            return None
 
         ok, jpg = cv2.imencode(
             ".jpg", frame,
@@ -213,4 +379,86 @@ class VideoStream:
         )
 
         if ok:
-            self.app.send_bytes(TYPE_VIDEO, jpg.tobytes())
+            data = jpg.tobytes()
+            self.app.send_bytes(TYPE_VIDEO, pack_media_ts(ts) + data)
+            return data
+        return None
+
+    # MJPEG 라이브 수신 (녹화는 도착 즉시, 표시는 playout 스케줄러가)
+    def handle_video_packet(self, payload: bytes, ts: float = None):
+        self.playout.push(ts, ("jpeg", payload))
+        rec = self.recorders["remote"]
+        if rec.recording:
+            rec.write_jpeg(payload)
+
+    def _on_remote_frame(self, frame, ts=None):
+        self.playout.push(ts, ("bgr", frame))
+        rec = self.recorders["remote"]
+        if rec.recording:
+            rec.write(frame)
+
+    def _present_remote(self, item):
+        kind, data = item
+        if kind == "jpeg":
+            self.app.show_remote_jpeg(data)
+        else:
+            self.app.show_remote_from_bgr(data)
+
+
+    # H.263 라이브 송신 (inter-frame 압축)
+    def _send_frame_h263(self, frame, ts):
+        w, h = H263_STREAM_SIZE
+        if frame.shape[1] != w or frame.shape[0] != h:
+            frame = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+
+        if self.h263 is None:
+            self.h263 = H263Encoder(on_picture=self._on_h263_picture)
+            if not self.h263.start(w, h, fps=H263_STREAM_FPS, gop=H263_GOP):
+                self.h263 = None
+                self.app.stream_codec = "MJPEG"
+                self.app.system_msg("H.263 encoder failed — falling back to MJPEG")
+                return
+
+        # 인코딩은 ffmpeg writer/reader 스레드에서 진행, 캡처 스레드는 바로 복귀
+        self.h263.submit(frame, ts)
+
+    def _on_h263_picture(self, data: bytes, ts: float, is_intra: bool):
+        self.app.send_bytes(TYPE_VIDEO_H263, pack_media_ts(ts) + data)
+
+    # 상대가 키프레임을 요청 (입장 / 디코딩 실패)
+    def handle_keyframe_request(self):
+        if self.h263:
+            self.h263.request_keyframe()
+
+    def _request_keyframe(self):
+        now = time.time()
+        if now - self.last_keyframe_req < KEYFRAME_REQ_INTERVAL:
+            return
+        self.last_keyframe_req = now
+        self.app.send_bytes(TYPE_KEYFRAME_REQ, b"")
+
+    # H.263 라이브 수신 (스트림당 ffmpeg 디코더 하나 유지)
+    def handle_h263_packet(self, payload: bytes, ts: float = None):
+        if not self.rx_synced:
+            starts = find_h263_pictures(payload)
+            info = h263_picture_info(payload, starts[0]) if starts else None
+            if not (info and info[0]):
+                # 스트림 중간에 입장 → P 프레임만으로는 디코딩 불가
+                self._request_keyframe()
+                return
+            self.rx_synced = True
+
+        if self.rx_decoder is None:
+            self.rx_decoder = H263DecoderSession(self._on_remote_frame)
+
+        if not self.rx_decoder.feed(payload, ts):
+            # 디코더 프로세스 종료 / 손상 → 다음 I 프레임부터 다시 시작
+            self.reset_remote()
+            self._request_keyframe()
+
+    def reset_remote(self):
+        self.rx_synced = False
+        self.playout.clear()
+        if self.rx_decoder:
+            self.rx_decoder.close()
+            self.rx_decoder = None
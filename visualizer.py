@@ -0,0 +1,170 @@
+# visualizer.py
+"""
+"Audio Visualizer" 소스 모드
+
+- 마이크(로컬) / 수신(원격) 오디오를 스펙트로그램 + 파형 이미지로 그린다
+- 오디오 경로에서는 feed()로 링 버퍼에 샘플만 복사 (FFT / 그리기는 하지 않음)
+- render()는 VideoStream의 고정 주기(VISUALIZER_FPS) 루프에서 호출:
+  그동안 쌓인 샘플을 hop 단위 창으로 묶어 rfft 한 번에 계산하고,
+  원형 컬럼 버퍼 + 재사용 출력 이미지에 그린다 (프레임마다 할당 없음)
+- 출력 프레임은 카메라 프레임과 같은 경로로 표시 / 송출 / 녹화된다
+"""
+
+import cv2
+import numpy as np
+
+from audio_io import RingBuffer
+from config import VISUALIZER_SIZE, VISUALIZER_FFT, VISUALIZER_DB_RANGE
+
+
+class _Lane:
+    """오디오 소스 하나 (스펙트로그램 영역 + 파형 영역)"""
+
+    def __init__(self, width, spec_h, wave_h, fft_size, rate_hint=48000):
+        self.width = width
+        self.spec_h = spec_h
+        self.wave_h = wave_h
+        self.fft_size = fft_size
+        self.hop = fft_size // 2
+
+        # 생산자: 오디오 스레드 / 소비자: render (락 없음). 최대 1초 분량
+        self.ring = RingBuffer(rate_hint)
+        self.pending = np.zeros(0, dtype=np.int16)     # 다음 창에 이어질 꼬리
+        self.chunk = np.empty(rate_hint, dtype=np.int16)
+
+        self.cols = np.zeros((width, spec_h, 3), dtype=np.uint8)   # 원형 컬럼 버퍼
+        self.col = 0
+        self.wave = np.zeros(width * 8, dtype=np.int16)            # 최근 파형
+
+    def feed(self, samples):
+        self.ring.write(samples)
+
+
+class AudioVisualizer:
+    def __init__(self, size=VISUALIZER_SIZE, fft_size=VISUALIZER_FFT,
+                 db_range=VISUALIZER_DB_RANGE, lanes=("local", "remote")):
+        self.width, self.height = size
+        self.fft_size = fft_size
+        self.db_range = db_range
+
+        lane_h = self.height // len(lanes)
+        wave_h = lane_h // 4
+        self.lane_names = list(lanes)
+        self.lanes = {
+            name: _Lane(self.width, lane_h - wave_h, wave_h, fft_size)
+            for name in lanes
+        }
+        self.frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+
+        # 미리 계산: 창 함수, dB → 색 LUT, 주파수 bin → 세로 픽셀 (저역을 넓게, 로그 축)
+        self.window = np.hanning(fft_size).astype(np.float32)
+        self.norm = 1.0 / (fft_size / 4 * 32768.0)
+        ramp = np.arange(256, dtype=np.uint8).reshape(-1, 1)
+        self.lut = cv2.applyColorMap(ramp, cv2.COLORMAP_INFERNO).reshape(256, 3)
+        bins = fft_size // 2 + 1
+        any_lane = next(iter(self.lanes.values()))
+        y = np.linspace(0, 1, any_lane.spec_h)[::-1]           # 위쪽이 고음
+        self.bin_idx = np.minimum(
+            (np.expm1(y * np.log1p(bins - 1))).astype(np.int32), bins - 1
+        )
+        self.rows = np.arange(any_lane.wave_h, dtype=np.int32).reshape(-1, 1)
+
+    # -----------------------
+    # 오디오 스레드 (복사만)
+    # -----------------------
+    def feed(self, lane: str, pcm, channels: int = 1):
+        """int16 PCM(bytes 또는 배열)을 lane에 추가. 스테레오는 첫 채널만 사용."""
+        samples = np.frombuffer(pcm, dtype=np.int16) if isinstance(pcm, (bytes, bytearray)) else pcm
+        if channels > 1:
+            samples = samples[::channels]
+        self.lanes[lane].feed(samples)
+
+    # -----------------------
+    # 렌더링 (고정 주기)
+    # -----------------------
+    def _spectrum_columns(self, lane):
+        n = lane.ring.read_into(lane.chunk)
+        if n == 0:
+            return 0
+        x = np.concatenate((lane.pending, lane.chunk[:n]))
+
+        # 창 개수만큼 한 번에 FFT (hop = fft/2, 50% 겹침)
+        count = (len(x) - self.fft_size) // lane.hop + 1
+        if count <= 0:
+            lane.pending = x
+            self._push_wave(lane, lane.chunk[:n])
+            return 0
+        frames = np.lib.stride_tricks.sliding_window_view(x, self.fft_size)[::lane.hop][:count]
+        lane.pending = x[count * lane.hop:]
+        frames = frames[-self.width:]
+
+        spec = np.abs(np.fft.rfft(frames.astype(np.float32) * self.window, axis=1))
+        db = 20 * np.log10(spec * self.norm + 1e-9)
+        level = np.clip((db + self.db_range) * (255.0 / self.db_range), 0, 255).astype(np.uint8)
+        colors = self.lut[level[:, self.bin_idx]]                   # (count, spec_h, 3)
+
+        c = len(colors)
+        end = lane.col + c
+        if end <= self.width:
+            lane.cols[lane.col:end] = colors
+        else:
+            k = self.width - lane.col
+            lane.cols[lane.col:] = colors[:k]
+            lane.cols[:end - self.width] = colors[k:]
+        lane.col = end % self.width
+
+        self._push_wave(lane, lane.chunk[:n])
+        return c
+
+    @staticmethod
+    def _push_wave(lane, samples):
+        n = min(len(samples), len(lane.wave))
+        lane.wave[:-n] = lane.wave[n:]
+        lane.wave[-n:] = samples[-n:]
+
+    def _draw_lane(self, lane, y0):
+        # 스펙트로그램: 원형 버퍼를 오래된 순서로 펼쳐서 복사 (가로가 시간)
+        spec = self.frame[y0:y0 + lane.spec_h]
+        k = self.width - lane.col
+        spec[:, :k] = lane.cols[lane.col:].transpose(1, 0, 2)
+        spec[:, k:] = lane.cols[:lane.col].transpose(1, 0, 2)
+
+        # 파형: 픽셀 컬럼마다 min/max 구간을 채운다
+        wave = self.frame[y0 + lane.spec_h:y0 + lane.spec_h + lane.wave_h]
+        blocks = lane.wave.reshape(self.width, -1)
+        half = lane.wave_h / 2.0
+        scale = half / 32768.0
+        top = (half - blocks.max(axis=1) * scale).astype(np.int32)
+        bot = (half - blocks.min(axis=1) * scale).astype(np.int32)
+        mask = (self.rows >= top) & (self.rows <= bot)
+        wave[:] = 0
+        wave[mask] = (80, 220, 120)
+
+    def render(self):
+        """쌓인 오디오를 반영한 프레임 (재사용 버퍼)을 리턴"""
+        y0 = 0
+        for name in self.lane_names:
+            lane = self.lanes[name]
+            self._spectrum_columns(lane)
+            self._draw_lane(lane, y0)
+            y0 += lane.spec_h + lane.wave_h
+        return self.frame
+
+
+if __name__ == "__main__":
+    import time
+
+    viz = AudioVisualizer()
+    rate = 16000
+    t = np.arange(rate // 20) / rate
+    iters = 200
+    total = 0.0
+    for i in range(iters):
+        tone = (8000 * np.sin(2 * np.pi * (300 + 20 * i) * t)).astype(np.int16)
+        viz.feed("local", tone)
+        viz.feed("remote", tone[::-1].copy())
+        t0 = time.perf_counter()
+        viz.render()
+        total += time.perf_counter() - t0
+    print(f"render: {total * 1000 / iters:.2f} ms/frame "
+          f"({viz.width}x{viz.height}, fft {viz.fft_size}, 50 ms of audio per frame)")